@@ -12,6 +12,7 @@ import os
 
 from .preprocessor import get_preprocessor, preprocess_messages
 from .plugin_manager import get_plugin_manager, load_plugins
+from .stream_parser import SSEDecoder, ToolCallStreamParser
 
 # 配置日志
 logging.basicConfig(level=logging.INFO)
@@ -31,10 +32,32 @@ class AgentAPIServer:
         self.preprocessor = get_preprocessor()
         self.plugin_manager = get_plugin_manager()
         
+        # 上游HTTP会话：所有请求和工具循环的后续轮次共用连接池
+        self._session: Optional[aiohttp.ClientSession] = None
+        
         # 创建web应用
         self.app = web.Application()
+        self.app.on_cleanup.append(self._close_session)
         self.setup_routes()
     
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession()
+        return self._session
+    
+    async def _close_session(self, app: web.Application = None):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+    
+    def _upstream_headers(self, request: web.Request = None, stream: bool = False) -> Dict[str, str]:
+        return {
+            'Content-Type': 'application/json',
+            'Authorization': f'Bearer {self.api_key}',
+            'User-Agent': request.headers.get('user-agent', '') if request is not None else '',
+            'Accept': 'text/event-stream' if stream else 'application/json'
+        }
+    
     def setup_routes(self):
         """设置路由"""
         # 模型列表代理
@@ -121,27 +144,19 @@ class AgentAPIServer:
                 logger.info(f"预处理后的请求: {json.dumps(original_body, ensure_ascii=False)[:200]}...")
             
             # 3. 调用LLM API
-            async with aiohttp.ClientSession() as session:
-                headers = {
-                    'Content-Type': 'application/json',
-                    'Authorization': f'Bearer {self.api_key}',
-                    'User-Agent': request.headers.get('user-agent', ''),
-                    'Accept': 'text/event-stream' if original_body.get('stream') else 'application/json'
-                }
+            async with self._get_session().post(
+                f"{self.api_url}/v1/chat/completions",
+                headers=self._upstream_headers(request, bool(original_body.get('stream'))),
+                json=original_body
+            ) as response:
                 
-                async with session.post(
-                    f"{self.api_url}/v1/chat/completions",
-                    headers=headers,
-                    json=original_body
-                ) as response:
-                    
-                    # 检查是否为流式响应
-                    is_streaming = original_body.get('stream') and 'text/event-stream' in response.headers.get('content-type', '')
-                    
-                    if is_streaming:
-                        return await self._handle_streaming_response(response, original_body, request)
-                    else:
-                        return await self._handle_non_streaming_response(response, original_body)
+                # 检查是否为流式响应
+                is_streaming = original_body.get('stream') and 'text/event-stream' in response.headers.get('content-type', '')
+                
+                if is_streaming:
+                    return await self._handle_streaming_response(response, original_body, request)
+                else:
+                    return await self._handle_non_streaming_response(response, original_body)
         
         except Exception as e:
             logger.error(f"处理对话请求失败: {e}")
@@ -151,60 +166,128 @@ class AgentAPIServer:
             )
     
     async def _handle_streaming_response(self, response: aiohttp.ClientResponse, original_body: Dict, request: web.Request) -> web.StreamResponse:
-        """处理流式响应"""
+        """处理流式响应
+        
+        按SSE事件转发上游输出：普通文本增量原样立即转发，工具调用块不转发给客户端。
+        一轮结束（[DONE]或上游断开）时若有工具调用，执行工具并以更新后的消息重新请求上游，
+        客户端连接保持不断，最后只发送一次 [DONE]。
+        """
         stream_response = web.StreamResponse(
             status=response.status,
-            headers=dict(response.headers)
+            headers={
+                'Content-Type': 'text/event-stream',
+                'Cache-Control': 'no-cache',
+                'Connection': 'keep-alive'
+            }
         )
-        
-        # 设置流式响应头部
-        stream_response.headers['Content-Type'] = 'text/event-stream'
-        stream_response.headers['Cache-Control'] = 'no-cache'
-        stream_response.headers['Connection'] = 'keep-alive'
-        
         await stream_response.prepare(request)
         
         # 处理工具调用循环
         recursion_depth = 0
         max_recursion = int(os.getenv('MaxhandoffLoopStream', '5'))
-        current_messages = original_body.get('messages', [])
-        current_ai_content = ''
+        current_messages = list(original_body.get('messages', []))
+        upstream = response
         
-        async for chunk in response.content:
-            chunk_str = chunk.decode('utf-8')
-            
-            # 检查是否包含工具调用
-            if '<<<[TOOL_REQUEST]>>>' in chunk_str:
-                # 收集完整的AI响应
-                current_ai_content += chunk_str
+        try:
+            while True:
+                parser = ToolCallStreamParser(enabled=recursion_depth < max_recursion)
+                template = await self._relay_stream_round(upstream, parser, stream_response)
                 
-                # 解析工具调用
-                tool_calls = self._parse_tool_calls(current_ai_content)
+                if not parser.has_tool_calls:
+                    break
                 
-                if tool_calls and recursion_depth < max_recursion:
-                    # 执行工具调用
-                    tool_results = await self._execute_tool_calls(tool_calls)
-                    
-                    # 添加AI响应和工具结果到消息历史
-                    current_messages.append({'role': 'assistant', 'content': current_ai_content})
-                    current_messages.append({'role': 'user', 'content': tool_results})
-                    
-                    # 继续调用LLM
-                    recursion_depth += 1
-                    current_ai_content = ''
-                    
-                    # 发送换行符给客户端
-                    await stream_response.write(b'\n')
-                    
-                    # 继续处理下一轮响应
-                    continue
+                tool_calls = self._parse_tool_calls(parser.content)
+                if not tool_calls:
+                    break
+                
+                # 执行工具调用
+                tool_results = await self._execute_tool_calls(tool_calls)
+                
+                # 添加AI响应和工具结果到消息历史
+                current_messages.append({'role': 'assistant', 'content': parser.content})
+                current_messages.append({'role': 'user', 'content': tool_results})
+                recursion_depth += 1
+                
+                # 继续调用LLM，新一轮的输出接着写到同一个客户端连接
+                if upstream is not response:
+                    upstream.release()
+                upstream = await self._get_session().post(
+                    f"{self.api_url}/v1/chat/completions",
+                    headers=self._upstream_headers(request, stream=True),
+                    json={**original_body, 'messages': current_messages, 'stream': True}
+                )
+                if upstream.status != 200:
+                    error_text = (await upstream.read()).decode('utf-8', errors='replace')
+                    logger.error(f"工具调用后续请求失败: HTTP {upstream.status} {error_text[:200]}")
+                    await stream_response.write(self._sse_event(template, {'content': f"\n[工具调用后续请求失败: HTTP {upstream.status}]"}))
+                    break
             
-            # 转发原始chunk
-            await stream_response.write(chunk)
+            await stream_response.write(b'data: [DONE]\n\n')
+        finally:
+            # 首轮响应由调用方的上下文管理器关闭；后续轮次在这里关闭（客户端中途断开时同样停止读取上游）
+            if upstream is not response:
+                upstream.close()
         
         await stream_response.write_eof()
         return stream_response
     
+    async def _relay_stream_round(self, upstream: aiohttp.ClientResponse, parser: ToolCallStreamParser,
+                                  stream_response: web.StreamResponse) -> Dict:
+        """转发一轮上游SSE输出，返回最后一个数据块（用于构造补发事件）；不转发本轮的 [DONE]"""
+        decoder = SSEDecoder()
+        template: Dict = {}
+        
+        async def relay(events) -> bool:
+            nonlocal template
+            for raw, data in events:
+                if data is None:
+                    await stream_response.write(raw)
+                    continue
+                if data.strip() == '[DONE]':
+                    return True
+                try:
+                    chunk = json.loads(data)
+                    choice = chunk['choices'][0]
+                except (ValueError, KeyError, IndexError, TypeError):
+                    await stream_response.write(raw)
+                    continue
+                template = chunk
+                delta = choice.get('delta') or {}
+                text = delta.get('content')
+                finish = choice.get('finish_reason')
+                forwarded = parser.feed(text) if text else text
+                suppress_finish = bool(finish) and parser.has_tool_calls  # 还有下一轮，本轮的结束标记不转发
+                if forwarded == text and not suppress_finish:
+                    await stream_response.write(raw)  # 常规情况：原始事件直接转发
+                    continue
+                rest_delta = {k: v for k, v in delta.items() if k != 'content'}
+                if forwarded:
+                    rest_delta['content'] = forwarded
+                finish = None if suppress_finish else finish
+                if rest_delta or finish:
+                    await stream_response.write(self._sse_event(chunk, rest_delta, finish))
+            return False
+        
+        async for data in upstream.content.iter_any():
+            if await relay(decoder.feed(data)):
+                break
+        else:
+            await relay(decoder.flush())
+        
+        rest = parser.flush()
+        if rest:
+            await stream_response.write(self._sse_event(template, {'content': rest}))
+        return template
+    
+    @staticmethod
+    def _sse_event(template: Dict, delta: Dict, finish_reason: Optional[str] = None) -> bytes:
+        """以上游数据块为模板构造SSE事件，替换其中的delta和finish_reason"""
+        choice = dict((template.get('choices') or [{}])[0])
+        choice['delta'] = delta
+        choice['finish_reason'] = finish_reason
+        event = dict(template, choices=[choice])
+        return f"data: {json.dumps(event, ensure_ascii=False)}\n\n".encode('utf-8')
+    
     async def _handle_non_streaming_response(self, response: aiohttp.ClientResponse, original_body: Dict) -> web.Response:
         """处理非流式响应"""
         response_data = await response.read()
@@ -233,19 +316,14 @@ class AgentAPIServer:
                 current_messages.append({'role': 'user', 'content': tool_results})
                 
                 # 继续调用LLM
-                async with aiohttp.ClientSession() as session:
-                    async with session.post(
-                        f"{self.api_url}/v1/chat/completions",
-                        headers={
-                            'Content-Type': 'application/json',
-                            'Authorization': f'Bearer {self.api_key}',
-                            'Accept': 'application/json'
-                        },
-                        json={**original_body, 'messages': current_messages, 'stream': False}
-                    ) as next_response:
-                        next_response_data = await next_response.read()
-                        next_response_json = json.loads(next_response_data.decode('utf-8'))
-                        current_ai_content = next_response_json.get('choices', [{}])[0].get('message', {}).get('content', '')
+                async with self._get_session().post(
+                    f"{self.api_url}/v1/chat/completions",
+                    headers=self._upstream_headers(),
+                    json={**original_body, 'messages': current_messages, 'stream': False}
+                ) as next_response:
+                    next_response_data = await next_response.read()
+                    next_response_json = json.loads(next_response_data.decode('utf-8'))
+                    current_ai_content = next_response_json.get('choices', [{}])[0].get('message', {}).get('content', '')
                 
                 recursion_depth += 1
             
@@ -285,7 +363,7 @@ class AgentAPIServer:
             for match in re.finditer(param_pattern, tool_content):
                 key = match.group(1)
                 value = match.group(2).strip()
-                    tool_args[key] = value
+                tool_args[key] = value
             
             # 判断调用类型
             agent_type = tool_args.get('agentType', 'mcp').lower()
@@ -306,22 +384,16 @@ class AgentAPIServer:
             else:
                 # MCP类型调用格式（包括默认mcp和旧格式）
                 tool_name = tool_args.get('tool_name')
-            if tool_name:
+                if tool_name:
                     # 新格式：有service_name
-                    if 'service_name' in tool_args:
-                        tool_calls.append({
-                            'name': tool_name,
-                            'args': tool_args
-                        })
-                    else:
+                    if 'service_name' not in tool_args:
                         # 旧格式：tool_name作为服务名
-                        service_name = tool_name
-                        tool_args['service_name'] = service_name
+                        tool_args['service_name'] = tool_name
                         tool_args['agentType'] = 'mcp'
-                tool_calls.append({
-                    'name': tool_name,
-                    'args': tool_args
-                })
+                    tool_calls.append({
+                        'name': tool_name,
+                        'args': tool_args
+                    })
             
             start_index = end_pos + len(tool_request_end)
         
@@ -1,52 +1,143 @@
 # agent/image_processor.py
 # 图片处理器插件
+import asyncio
 import base64
+import hashlib
 import io
+import os
 import re
-from typing import List, Dict, Any
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import List, Dict, Any, Optional
 from PIL import Image
 import logging
 
 logger = logging.getLogger("ImageProcessor")
 
+_IMAGE_URL_RE = re.compile(r'https?://[^\s<>"]+\.(?:jpg|jpeg|png|gif|webp|bmp)')
+
+async def _close_session(session, loop):
+    """在aiohttp会话所属的事件循环上关闭它；所属循环已停止时在当前循环释放剩余连接"""
+    try:
+        if loop is not None and loop.is_running() and loop is not asyncio.get_running_loop():
+            asyncio.run_coroutine_threadsafe(session.close(), loop)
+        else:
+            await session.close()
+    except Exception as e:
+        logger.debug(f"关闭旧HTTP会话失败: {e}")
+
+def _encode_image(image_data: bytes, max_image_size: int, quality: int) -> Optional[bytes]:
+    """解码、缩放并重新编码为JPEG；在线程池中执行，失败返回None"""
+    try:
+        # 打开图片
+        image = Image.open(io.BytesIO(image_data))
+        
+        # 调整大小
+        if max(image.size) > max_image_size:
+            ratio = max_image_size / max(image.size)
+            new_size = tuple(int(dim * ratio) for dim in image.size)
+            image = image.resize(new_size, Image.Resampling.LANCZOS)
+        
+        # 转换为RGB模式（如果需要）
+        if image.mode in ('RGBA', 'LA', 'P'):
+            # 创建白色背景
+            background = Image.new('RGB', image.size, (255, 255, 255))
+            if image.mode == 'P':
+                image = image.convert('RGBA')
+            background.paste(image, mask=image.split()[-1] if image.mode in ('RGBA', 'LA') else None)
+            image = background
+        elif image.mode != 'RGB':
+            image = image.convert('RGB')
+        
+        # 保存为JPEG格式
+        output_buffer = io.BytesIO()
+        image.save(output_buffer, format='JPEG', quality=quality, optimize=True)
+        return output_buffer.getvalue()
+    
+    except Exception as e:
+        logger.error(f"处理图片数据失败: {e}")
+        return None
+
 class ImageProcessor:
-    """图片处理器 - 处理消息中的图片内容"""
+    """图片处理器 - 处理消息中的图片内容
+    
+    同一批消息中需要转换的图片URL先去重，再以有限并发下载；解码/缩放/编码在线程池中执行，
+    不占用事件循环。结果按 (URL, 尺寸, 质量) 的哈希写入磁盘缓存并保留一份内存LRU，
+    长对话历史中已处理过的图片不再重复下载和编码。磁盘缓存按总大小和文件年龄定期清理。
+    """
     
     def __init__(self, config: Dict = None):
         self.config = config or {}
-        self.max_image_size = self.config.get('max_image_size', 1024)  # 最大图片尺寸
-        self.quality = self.config.get('quality', 85)  # JPEG质量
+        self.max_image_size = int(self.config.get('max_image_size', 1024))  # 最大图片尺寸
+        self.quality = int(self.config.get('quality', 85))  # JPEG质量
         self.debug_mode = self.config.get('DebugMode', False)
+        self.max_concurrent_downloads = max(1, int(self.config.get('max_concurrent_downloads', 4)))
+        self.download_timeout = float(self.config.get('download_timeout', 30))
+        self.cache_dir = Path(self.config.get('image_cache_dir') or Path(os.getcwd()) / "agent" / ".image_cache")
+        self.memory_cache_size = int(self.config.get('memory_cache_size', 128))
+        self.disk_cache_max_bytes = int(float(self.config.get('disk_cache_max_mb', 256)) * 1024 * 1024)
+        self.disk_cache_max_age = float(self.config.get('disk_cache_max_age_days', 30)) * 86400
+        self.disk_cache_prune_interval = float(self.config.get('disk_cache_prune_interval', 3600))
+        self._last_prune: Optional[float] = None
+        self._written_since_prune = 0
+        self._prune_lock = threading.Lock()
+        self._memory_cache: "OrderedDict[str, str]" = OrderedDict()  # 缓存键 -> data URI
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._session = None
+        self._session_loop = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self.workers = max(1, int(self.config.get('image_workers', 2)))
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "downloads": 0, "failures": 0}
     
     async def process_messages(self, messages: List[Dict], config: Dict = None) -> List[Dict]:
         """处理消息中的图片内容"""
         if self.debug_mode:
             logger.info(f"开始处理 {len(messages)} 条消息中的图片")
         
-        processed_messages = []
-        for msg in messages:
-            processed_msg = await self._process_single_message(msg)
-            processed_messages.append(processed_msg)
+        # 先并发转换本批消息中所有需要转换的图片，再逐条替换
+        urls = {
+            part['image_url'].get('url', '')
+            for msg in messages if isinstance(msg.get('content'), list)
+            for part in msg['content']
+            if isinstance(part, dict) and part.get('type') == 'image_url' and isinstance(part.get('image_url'), dict)
+        }
+        urls = [url for url in urls if url and not url.startswith('data:image/')]
+        converted = {}
+        if urls:
+            semaphore = asyncio.Semaphore(self.max_concurrent_downloads)
+            results = await asyncio.gather(*(self._convert(url, semaphore) for url in urls), return_exceptions=True)
+            for url, result in zip(urls, results):
+                if isinstance(result, Exception):
+                    logger.error(f"转换图片URL失败: {result}")
+                    self.stats["failures"] += 1
+                    converted[url] = f"data:image/png;base64,{base64.b64encode(b'[Image load failed]').decode()}"
+                else:
+                    converted[url] = result
+        
+        processed_messages = [self._process_single_message(msg, converted) for msg in messages]
         
         if self.debug_mode:
-            logger.info("图片处理完成")
+            logger.info(f"图片处理完成，新转换 {len(urls)} 张，统计: {self.stats}")
         
         return processed_messages
     
-    async def _process_single_message(self, message: Dict) -> Dict:
+    def _process_single_message(self, message: Dict, converted: Dict[str, str]) -> Dict:
         """处理单条消息中的图片"""
         processed_msg = message.copy()
         
         # 处理字符串内容中的图片URL
         if isinstance(processed_msg.get('content'), str):
-            processed_msg['content'] = await self._process_text_content(processed_msg['content'])
+            processed_msg['content'] = self._process_text_content(processed_msg['content'])
         
         # 处理多模态内容
         elif isinstance(processed_msg.get('content'), list):
             processed_content = []
             for part in processed_msg['content']:
                 if isinstance(part, dict):
-                    processed_part = await self._process_content_part(part)
+                    processed_part = self._process_content_part(part, converted)
                     processed_content.append(processed_part)
                 else:
                     processed_content.append(part)
@@ -54,122 +145,256 @@ class ImageProcessor:
         
         return processed_msg
     
-    async def _process_text_content(self, text: str) -> str:
+    def _process_text_content(self, text: str) -> str:
         """处理文本内容中的图片URL"""
-        # 查找图片URL模式
-        image_url_pattern = r'https?://[^\s<>"]+\.(?:jpg|jpeg|png|gif|webp|bmp)'
-        
         def replace_image_url(match):
             image_url = match.group(0)
-            try:
-                # 这里可以下载图片并转换为base64
-                # 暂时返回原始URL
-                return f"[图片: {image_url}]"
-            except Exception as e:
-                logger.error(f"处理图片URL失败: {e}")
-                return f"[图片处理失败: {image_url}]"
-        
-        text = re.sub(image_url_pattern, replace_image_url, text)
-        return text
-    
-    async def _process_content_part(self, part: Dict) -> Dict:
-        """处理内容部分"""
+            # 这里可以下载图片并转换为base64
+            # 暂时返回原始URL
+            return f"[图片: {image_url}]"
+        
+        return _IMAGE_URL_RE.sub(replace_image_url, text)
+    
+    def _process_content_part(self, part: Dict, converted: Dict[str, str]) -> Dict:
+        """处理内容部分（返回副本，不修改调用方的消息）"""
         if part.get('type') == 'image_url':
             # 处理图片URL部分
             image_url = part.get('image_url', {})
             if isinstance(image_url, dict):
                 url = image_url.get('url', '')
-                if url.startswith('data:image/'):
-                    # 已经是base64格式
-                    return part
-                else:
-                    # 需要转换为base64
-                    try:
-                        base64_data = await self._url_to_base64(url)
-                        part['image_url']['url'] = base64_data
-                    except Exception as e:
-                        logger.error(f"转换图片URL失败: {e}")
-                        part['image_url']['url'] = f"data:image/png;base64,{base64.b64encode(b'[Image load failed]').decode()}"
+                if url in converted:
+                    part = dict(part, image_url=dict(image_url, url=converted[url]))
         
         elif part.get('type') == 'text':
             # 处理文本部分中的图片引用
-            text = part.get('text', '')
-            part['text'] = await self._process_text_content(text)
+            part = dict(part, text=self._process_text_content(part.get('text', '')))
         
         return part
     
+    def _cache_key(self, url: str) -> str:
+        raw = f"{url}|{self.max_image_size}|{self.quality}".encode('utf-8')
+        return hashlib.blake2b(raw, digest_size=16).hexdigest()
+    
+    async def _convert(self, url: str, semaphore: asyncio.Semaphore) -> str:
+        """内存缓存 -> 磁盘缓存 -> 下载并编码；同一URL同时只处理一次"""
+        key = self._cache_key(url)
+        cached = self._memory_cache.get(key)
+        if cached is not None:
+            self._memory_cache.move_to_end(key)
+            self.stats["memory_hits"] += 1
+            return cached
+        
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            return await asyncio.shield(inflight)
+        
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            loop = asyncio.get_running_loop()
+            data_uri = await loop.run_in_executor(self._get_executor(), self._read_disk_cache, key)
+            if data_uri is not None:
+                self.stats["disk_hits"] += 1
+            else:
+                async with semaphore:
+                    data_uri = await self._url_to_base64(url)
+                await loop.run_in_executor(self._get_executor(), self._write_disk_cache, key, data_uri)
+            self._remember(key, data_uri)
+            future.set_result(data_uri)
+            return data_uri
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()  # 已在此处处理，避免无人等待时告警
+            raise
+        finally:
+            self._inflight.pop(key, None)
+    
+    def _remember(self, key: str, data_uri: str):
+        self._memory_cache[key] = data_uri
+        self._memory_cache.move_to_end(key)
+        while len(self._memory_cache) > self.memory_cache_size:
+            self._memory_cache.popitem(last=False)
+    
+    def _read_disk_cache(self, key: str) -> Optional[str]:
+        path = self.cache_dir / key[:2] / f"{key}.b64"
+        try:
+            data_uri = path.read_text(encoding='ascii')
+        except (OSError, UnicodeDecodeError):
+            return None
+        try:
+            os.utime(path)  # 命中时刷新mtime，清理时按最近使用时间淘汰
+        except OSError:
+            pass
+        return data_uri
+    
+    def _write_disk_cache(self, key: str, data_uri: str):
+        try:
+            path = self.cache_dir / key[:2] / f"{key}.b64"
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = path.with_suffix(f".{os.getpid()}.tmp")
+            tmp.write_text(data_uri, encoding='ascii')
+            os.replace(tmp, path)  # 原子替换，并发写入时不会读到半个文件
+        except OSError as e:
+            logger.warning(f"写入图片缓存失败: {e}")
+            return
+        self._written_since_prune += len(data_uri)
+        self._maybe_prune_disk_cache()
+    
+    def _maybe_prune_disk_cache(self):
+        """首次写入、距上次清理超过间隔或新写入超过上限的1/10时清理磁盘缓存（在线程池中执行）"""
+        now = time.monotonic()
+        if (self._last_prune is not None and now - self._last_prune < self.disk_cache_prune_interval
+                and self._written_since_prune < self.disk_cache_max_bytes // 10):
+            return
+        if not self._prune_lock.acquire(blocking=False):
+            return  # 其它线程正在清理
+        try:
+            self._last_prune = now
+            self._written_since_prune = 0
+            self._prune_disk_cache()
+        finally:
+            self._prune_lock.release()
+    
+    def _prune_disk_cache(self):
+        """删除超过最大年龄的缓存文件和残留临时文件，总大小仍超限时按最近使用时间从旧到新删除"""
+        now = time.time()
+        entries = []
+        for path in self.cache_dir.glob("*/*"):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            expired = now - stat.st_mtime > self.disk_cache_max_age
+            if path.suffix == ".tmp":
+                expired = now - stat.st_mtime > 3600  # 写入中途退出留下的临时文件
+            if expired:
+                self._remove_cache_file(path)
+            elif path.suffix == ".b64":
+                entries.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in entries)
+        if total <= self.disk_cache_max_bytes:
+            return
+        entries.sort()
+        removed = 0
+        for _, size, path in entries:
+            if total <= self.disk_cache_max_bytes:
+                break
+            if self._remove_cache_file(path):
+                total -= size
+                removed += 1
+        logger.info(f"图片磁盘缓存超过上限，已删除 {removed} 个最久未使用的文件")
+    
+    @staticmethod
+    def _remove_cache_file(path: Path) -> bool:
+        try:
+            path.unlink()
+            return True
+        except OSError:
+            return False
+    
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="image-processor")
+        return self._executor
+    
+    async def _get_session(self):
+        """复用aiohttp会话；会话绑定创建它的事件循环，换循环时重建"""
+        import aiohttp
+        loop = asyncio.get_running_loop()
+        if self._session is None or self._session.closed or self._session_loop is not loop:
+            old_session, old_loop = self._session, self._session_loop
+            self._session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=self.download_timeout))
+            self._session_loop = loop
+            if old_session is not None and not old_session.closed:
+                await _close_session(old_session, old_loop)
+        return self._session
+    
     async def _url_to_base64(self, url: str) -> str:
         """将图片URL转换为base64格式"""
         try:
-            import aiohttp
-            async with aiohttp.ClientSession() as session:
-                async with session.get(url) as response:
-                    if response.status == 200:
-                        image_data = await response.read()
-                        # 处理图片
-                        processed_image_data = await self._process_image_data(image_data)
-                        # 转换为base64
-                        base64_data = base64.b64encode(processed_image_data).decode()
-                        return f"data:image/png;base64,{base64_data}"
-                    else:
-                        raise Exception(f"HTTP {response.status}")
+            session = await self._get_session()
+            async with session.get(url) as response:
+                if response.status == 200:
+                    image_data = await response.read()
+                    mime_type = response.headers.get('Content-Type', 'image/png').split(';')[0]
+                else:
+                    raise Exception(f"HTTP {response.status}")
+            self.stats["downloads"] += 1
         except Exception as e:
             logger.error(f"下载图片失败: {e}")
             raise
-    
-    async def _process_image_data(self, image_data: bytes) -> bytes:
-        """处理图片数据（调整大小、压缩等）"""
-        try:
-            # 打开图片
-            image = Image.open(io.BytesIO(image_data))
-            
-            # 调整大小
-            if max(image.size) > self.max_image_size:
-                ratio = self.max_image_size / max(image.size)
-                new_size = tuple(int(dim * ratio) for dim in image.size)
-                image = image.resize(new_size, Image.Resampling.LANCZOS)
-            
-            # 转换为RGB模式（如果需要）
-            if image.mode in ('RGBA', 'LA', 'P'):
-                # 创建白色背景
-                background = Image.new('RGB', image.size, (255, 255, 255))
-                if image.mode == 'P':
-                    image = image.convert('RGBA')
-                background.paste(image, mask=image.split()[-1] if image.mode == 'RGBA' else None)
-                image = background
-            
-            # 保存为JPEG格式
-            output_buffer = io.BytesIO()
-            image.save(output_buffer, format='JPEG', quality=self.quality, optimize=True)
-            return output_buffer.getvalue()
         
-        except Exception as e:
-            logger.error(f"处理图片数据失败: {e}")
-            # 返回原始数据
-            return image_data
+        # 处理图片（CPU密集，放到线程池）
+        processed_image_data = await self._process_image_data(image_data)
+        if processed_image_data is None:
+            # 处理失败时使用原始数据
+            processed_image_data = image_data
+        else:
+            mime_type = 'image/jpeg'
+        # 转换为base64
+        base64_data = base64.b64encode(processed_image_data).decode()
+        return f"data:{mime_type};base64,{base64_data}"
+    
+    async def _process_image_data(self, image_data: bytes) -> Optional[bytes]:
+        """处理图片数据（调整大小、压缩等），失败返回None"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._get_executor(), _encode_image, image_data, self.max_image_size, self.quality
+        )
+    
+    async def close(self):
+        """关闭共享的HTTP会话和线程池"""
+        session, self._session = self._session, None
+        if session is not None and not session.closed:
+            await _close_session(session, self._session_loop)
+        self._session_loop = None
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
     
     def extract_image_urls(self, text: str) -> List[str]:
         """从文本中提取图片URL"""
-        image_url_pattern = r'https?://[^\s<>"]+\.(?:jpg|jpeg|png|gif|webp|bmp)'
-        return re.findall(image_url_pattern, text)
+        return _IMAGE_URL_RE.findall(text)
     
     def is_image_url(self, url: str) -> bool:
         """判断是否为图片URL"""
         image_extensions = ('.jpg', '.jpeg', '.png', '.gif', '.webp', '.bmp')
         return any(url.lower().endswith(ext) for ext in image_extensions)
 
+# 插件实例在多次调用间复用，共享HTTP会话、线程池和缓存
+_processor: Optional[ImageProcessor] = None
+
+async def _get_processor(config: Dict = None) -> ImageProcessor:
+    """获取共享的处理器实例；配置变化时新建，并关闭旧实例的HTTP会话和线程池"""
+    global _processor
+    if _processor is None or (config is not None and config != _processor.config):
+        old_processor, _processor = _processor, ImageProcessor(config)
+        if old_processor is not None:
+            await old_processor.close()
+    return _processor
+
 # 插件接口函数
 async def processMessages(messages: List[Dict], config: Dict = None) -> List[Dict]:
     """插件接口函数 - 处理消息中的图片"""
-    processor = ImageProcessor(config)
+    processor = await _get_processor(config)
     return await processor.process_messages(messages, config)
 
 async def initialize(config: Dict = None):
     """插件初始化函数"""
+    processor = await _get_processor(config)
+    # 启动时在线程池中清理一次磁盘缓存
+    asyncio.get_running_loop().run_in_executor(processor._get_executor(), processor._maybe_prune_disk_cache)
     logger.info("图片处理器插件已初始化")
     return True
 
 async def shutdown():
     """插件关闭函数"""
+    global _processor
+    if _processor is not None:
+        await _processor.close()
+        _processor = None
     logger.info("图片处理器插件已关闭")
     return True 
\ No newline at end of file
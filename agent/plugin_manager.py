@@ -2,6 +2,7 @@
 # 插件管理器
 import os
 import json
+import time
 import asyncio
 from typing import Dict, List, Any, Optional
 from pathlib import Path
@@ -17,7 +18,15 @@ class AgentPluginManager:
         self.plugins = {}
         self.message_preprocessors = {}
         self.static_placeholder_values = {}
+        self.static_plugin_status: Dict[str, Dict[str, Any]] = {}  # 静态插件运行状态
         self.debug_mode = os.getenv("DEBUG", "False").lower() == "true"
+        self.static_plugin_concurrency = max(1, int(os.getenv("StaticPluginConcurrency", "4")))  # 静态插件命令并发上限
+        self.static_plugin_timeout = float(os.getenv("StaticPluginTimeout", "30"))  # 静态插件命令默认超时（秒）
+        self._command_semaphore: Optional[asyncio.Semaphore] = None
+        self._next_refresh: Dict[str, float] = {}  # 插件名 -> 下次刷新时间（事件循环时钟）
+        self._refresh_intervals: Dict[str, float] = {}  # 插件名 -> 刷新间隔（秒）
+        self._refreshing: Dict[str, asyncio.Task] = {}
+        self._scheduler_task: Optional[asyncio.Task] = None
         
         self.plugin_dir = Path(self.project_base_path) / "agent" / "plugins"
         self.plugin_dir.mkdir(exist_ok=True)
@@ -27,13 +36,21 @@ class AgentPluginManager:
         if self.debug_mode:
             logger.info("开始加载插件...")
         
+        await self._stop_refresh_scheduler()
         self.plugins.clear()
         self.message_preprocessors.clear()
-        self.static_placeholder_values.clear()
+        # 静态占位符值保留到新值产生，重新加载期间继续提供旧值
         
         await self._scan_plugin_directory()
         await self._initialize_plugins()
         
+        declared = {p for manifest in self.plugins.values() if manifest['pluginType'] == 'static'
+                    for p in self._static_placeholders(manifest)}
+        for placeholder in [p for p in self.static_placeholder_values if p not in declared]:
+            self._remove_static_value(placeholder)
+        
+        self._start_refresh_scheduler()
+        
         if self.debug_mode:
             logger.info(f"插件加载完成，共加载 {len(self.plugins)} 个插件")
     
@@ -90,8 +107,8 @@ class AgentPluginManager:
         return config
     
     async def _initialize_plugins(self):
-        """初始化插件"""
-        for plugin_name, manifest in self.plugins.items():
+        """初始化插件（各插件并行初始化，静态插件命令受并发上限约束）"""
+        async def initialize(plugin_name: str, manifest: Dict):
             try:
                 if manifest['pluginType'] == 'messagePreprocessor':
                     await self._initialize_message_preprocessor(plugin_name, manifest)
@@ -99,6 +116,8 @@ class AgentPluginManager:
                     await self._initialize_static_plugin(plugin_name, manifest)
             except Exception as e:
                 logger.error(f"初始化插件失败 {plugin_name}: {e}")
+        
+        await asyncio.gather(*(initialize(name, manifest) for name, manifest in list(self.plugins.items())))
     
     async def _initialize_message_preprocessor(self, plugin_name: str, manifest: Dict):
         """初始化消息预处理器"""
@@ -133,46 +152,175 @@ class AgentPluginManager:
         if 'entryPoint' not in manifest or 'command' not in manifest['entryPoint']:
             return
         
+        if await self._refresh_static_plugin(plugin_name) and self.debug_mode:
+            logger.info(f"初始化静态插件: {plugin_name}")
+    
+    @staticmethod
+    def _static_placeholders(manifest: Dict) -> List[str]:
+        return [info['placeholder'] for info in manifest.get('capabilities', {}).get('systemPromptPlaceholders', [])]
+    
+    async def _refresh_static_plugin(self, plugin_name: str) -> bool:
+        """执行静态插件命令并更新其占位符；失败时保留上一次成功的值"""
+        manifest = self.plugins.get(plugin_name)
+        if not manifest:
+            return False
+        status = self.static_plugin_status.setdefault(plugin_name, {
+            "runs": 0, "failures": 0, "last_success": None, "last_error": None, "last_duration": None
+        })
+        started = time.monotonic()
         try:
             config = self._get_plugin_config(manifest)
             result = await self._execute_static_plugin_command(manifest, config)
-            
-            if 'capabilities' in manifest and 'systemPromptPlaceholders' in manifest['capabilities']:
-                for placeholder_info in manifest['capabilities']['systemPromptPlaceholders']:
-                    placeholder = placeholder_info['placeholder']
-                    self.static_placeholder_values[placeholder] = result
-            
-            if self.debug_mode:
-                logger.info(f"初始化静态插件: {plugin_name}")
+        except Exception as e:
+            status["failures"] += 1
+            status["last_error"] = str(e)
+            logger.error(f"静态插件执行失败 {plugin_name}，继续使用上一次的值: {e}")
+            return False
+        finally:
+            status["runs"] += 1
+            status["last_duration"] = round(time.monotonic() - started, 3)
         
+        for placeholder in self._static_placeholders(manifest):
+            self._set_static_value(placeholder, result)
+        status["last_success"] = time.time()
+        status["last_error"] = None
+        return True
+    
+    def _set_static_value(self, placeholder: str, value: str):
+        """更新静态占位符值，并同步给预处理器（使其值缓存失效）"""
+        self.static_placeholder_values[placeholder] = value
+        try:
+            from .preprocessor import get_preprocessor
+            get_preprocessor().set_static_placeholder(placeholder, value)
+        except Exception as e:
+            logger.debug(f"同步静态占位符到预处理器失败: {e}")
+    
+    def _remove_static_value(self, placeholder: str):
+        """移除已删除插件的静态占位符值，并同步给预处理器"""
+        self.static_placeholder_values.pop(placeholder, None)
+        try:
+            from .preprocessor import get_preprocessor
+            get_preprocessor().remove_static_placeholder(placeholder)
         except Exception as e:
-            logger.error(f"初始化静态插件失败 {plugin_name}: {e}")
+            logger.debug(f"从预处理器移除静态占位符失败: {e}")
     
     async def _execute_static_plugin_command(self, manifest: Dict, config: Dict) -> str:
-        """执行静态插件命令"""
+        """执行静态插件命令（受并发上限和超时约束）"""
         command = manifest['entryPoint']['command']
         base_path = manifest['basePath']
+        timeout_ms = manifest.get('communication', {}).get('timeout')
+        timeout = timeout_ms / 1000 if timeout_ms else self.static_plugin_timeout
         
         env = os.environ.copy()
         for key, value in config.items():
             if value is not None:
                 env[key] = str(value)
         
-        process = await asyncio.create_subprocess_shell(
-            command,
-            cwd=base_path,
-            env=env,
-            stdout=asyncio.subprocess.PIPE,
-            stderr=asyncio.subprocess.PIPE
-        )
+        if self._command_semaphore is None:
+            self._command_semaphore = asyncio.Semaphore(self.static_plugin_concurrency)
         
-        stdout, stderr = await process.communicate()
+        async with self._command_semaphore:
+            process = await asyncio.create_subprocess_shell(
+                command,
+                cwd=base_path,
+                env=env,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
+                start_new_session=(os.name == 'posix')  # 独立进程组，超时时连同shell启动的子进程一起结束
+            )
+            
+            try:
+                stdout, stderr = await asyncio.wait_for(process.communicate(), timeout)
+            except asyncio.TimeoutError:
+                await self._kill_process(process)
+                raise Exception(f"静态插件执行超时({timeout:g}秒)")
+            except asyncio.CancelledError:
+                await self._kill_process(process)
+                raise
         
         if process.returncode != 0:
             raise Exception(f"静态插件执行失败: {stderr.decode()}")
         
         return stdout.decode().strip()
     
+    @staticmethod
+    async def _kill_process(process):
+        try:
+            if os.name == 'posix':
+                import signal
+                os.killpg(process.pid, signal.SIGKILL)
+            else:
+                process.kill()
+        except (ProcessLookupError, PermissionError):
+            pass
+        try:
+            await asyncio.wait_for(process.wait(), 5)
+        except asyncio.TimeoutError:
+            logger.warning(f"静态插件进程未能及时退出: pid={process.pid}")
+    
+    @staticmethod
+    def _refresh_interval(plugin_name: str, manifest: Dict) -> float:
+        """解析refreshIntervalSeconds，未声明或无效时返回0（不定时刷新）"""
+        value = manifest.get('refreshIntervalSeconds')
+        if not value:
+            return 0.0
+        try:
+            interval = float(value)
+        except (TypeError, ValueError):
+            logger.error(f"静态插件 {plugin_name} 的refreshIntervalSeconds无效: {value!r}，不启用定时刷新")
+            return 0.0
+        if interval <= 0:
+            logger.error(f"静态插件 {plugin_name} 的refreshIntervalSeconds必须大于0: {value!r}，不启用定时刷新")
+            return 0.0
+        return interval
+    
+    def _start_refresh_scheduler(self):
+        """为声明了refreshIntervalSeconds的静态插件启动后台刷新调度"""
+        loop = asyncio.get_running_loop()
+        self._refresh_intervals = {}
+        for name, manifest in self.plugins.items():
+            if manifest['pluginType'] == 'static':
+                interval = self._refresh_interval(name, manifest)
+                if interval > 0:
+                    self._refresh_intervals[name] = interval
+        self._next_refresh = {name: loop.time() + interval for name, interval in self._refresh_intervals.items()}
+        if self._next_refresh:
+            self._scheduler_task = asyncio.create_task(self._refresh_scheduler())
+            if self.debug_mode:
+                logger.info(f"静态插件定时刷新: {list(self._next_refresh)}")
+    
+    async def _refresh_scheduler(self):
+        """到期的插件各自在后台刷新；上一次刷新未结束的插件本轮跳过"""
+        loop = asyncio.get_running_loop()
+        while self._next_refresh:
+            now = loop.time()
+            for plugin_name, due in list(self._next_refresh.items()):
+                if due > now:
+                    continue
+                self._next_refresh[plugin_name] = now + self._refresh_intervals[plugin_name]
+                if plugin_name in self._refreshing:
+                    continue
+                task = asyncio.create_task(self._refresh_static_plugin(plugin_name))
+                self._refreshing[plugin_name] = task
+                task.add_done_callback(lambda _, name=plugin_name: self._refreshing.pop(name, None))
+            await asyncio.sleep(max(0.05, min(self._next_refresh.values()) - loop.time()))
+    
+    async def _stop_refresh_scheduler(self):
+        tasks = [t for t in [self._scheduler_task, *self._refreshing.values()] if t is not None]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._scheduler_task = None
+        self._refreshing.clear()
+        self._next_refresh = {}
+    
+    def get_static_plugin_status(self) -> Dict[str, Dict[str, Any]]:
+        """静态插件刷新状态"""
+        return {
+            name: dict(status, refresh_interval=self.plugins.get(name, {}).get('refreshIntervalSeconds'))
+            for name, status in self.static_plugin_status.items()
+        }
+    
     def _get_plugin_config(self, manifest: Dict) -> Dict:
         """获取插件配置"""
         config = {}
@@ -239,6 +387,8 @@ class AgentPluginManager:
         if self.debug_mode:
             logger.info("开始关闭所有插件...")
         
+        await self._stop_refresh_scheduler()
+        
         for plugin_name, plugin_module in self.message_preprocessors.items():
             try:
                 if hasattr(plugin_module, 'shutdown'):
@@ -3,18 +3,32 @@
 import os
 import json
 import re
-import asyncio
+import time
+from collections import OrderedDict
 from datetime import datetime
 from pathlib import Path
 from typing import Dict, List, Any, Optional, Union
 import logging
 
+from .template_engine import TemplateCache
+
 # 配置日志
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("AgentPreprocessor")
 
+_WEEKDAY_NAMES = ['星期一', '星期二', '星期三', '星期四', '星期五', '星期六', '星期日']
+_ASYNC_RESULT_RE = re.compile(r'handoff_ASYNC_RESULT::([a-zA-Z0-9_.-]+)::([a-zA-Z0-9_-]+)')
+_UNRESOLVED = object()  # 表示"不是已知占位符，原样保留"，不写入值缓存
+_VALUE_CACHE_SIZE = 1024  # 值缓存上限；日记本、异步结果等名称来自消息文本，按LRU淘汰
+_MAX_AGENT_DEPTH = 5  # Agent文件中再嵌套Agent占位符的最大层数
+
 class AgentPreprocessor:
-    """代理预处理系统 - 处理消息中的占位符、变量替换等"""
+    """代理预处理系统 - 处理消息中的占位符、变量替换等
+    
+    每段文本按内容编译一次（切分为文本段和占位符），之后每次请求只需单次拼接；
+    占位符的值按名称缓存，时间类占位符按秒缓存。环境变量在初始化时读取，
+    变化后调用invalidate_cache()重新加载。
+    """
     
     def __init__(self, project_base_path: str = None):
         self.project_base_path = project_base_path or os.getcwd()
@@ -24,6 +38,12 @@ class AgentPreprocessor:
         self.debug_mode = os.getenv("DEBUG", "False").lower() == "true"
         self.detectors = []  # 系统提示词转换规则
         self.super_detectors = []  # 全局上下文转换规则
+        self.template_cache = TemplateCache()
+        self._value_cache: "OrderedDict[str, Any]" = OrderedDict()  # 占位符名 -> 替换值（LRU）
+        self._agent_files: Dict[str, str] = {}  # Agent占位符名 -> Agent文件名（来自Agentxxx环境变量）
+        self._agent_contents: Dict[str, Optional[str]] = {}  # Agent文件名 -> 文件内容
+        self._time_second = None
+        self._time_values: Dict[str, str] = {}
         
         # 确保agent目录存在
         self.agent_dir.mkdir(exist_ok=True)
@@ -32,20 +52,13 @@ class AgentPreprocessor:
         self._init_placeholder_processors()
     
     def _init_placeholder_processors(self):
-        """初始化各种占位符处理器"""
-        self.processors = {
-            'agent': self._process_agent_placeholders,
-            'env_vars': self._process_env_variables,
-            'time_date': self._process_time_date,
-            'static_plugins': self._process_static_plugins,
-            'handoff_tools': self._process_handoff_tools,
-            'emoji': self._process_emoji_placeholders,
-            'diary': self._process_diary_placeholders,
-            'system_prompts': self._process_system_prompts,
-            'async_results': self._process_async_results
+        """从环境变量加载Agent占位符和detectors/superDetectors规则"""
+        self._agent_files = {
+            key[5:]: value for key, value in os.environ.items()
+            if key.startswith('Agent') and len(key) > 5
         }
-        
-        # 加载detectors和superDetectors规则
+        self.detectors = []
+        self.super_detectors = []
         for key, value in os.environ.items():
             if key.startswith('Detector') and key[8:].isdigit():
                 index = key[8:]
@@ -70,28 +83,31 @@ class AgentPreprocessor:
         if self.super_detectors:
             logger.info(f"加载了 {len(self.super_detectors)} 条全局上下文转换规则")
     
+    def invalidate_cache(self):
+        """环境变量或Agent文件变化后调用：重新加载规则并清空值缓存"""
+        self._init_placeholder_processors()
+        self._value_cache.clear()
+        self._agent_contents.clear()
+    
     async def preprocess_messages(self, messages: List[Dict], model: str = None) -> List[Dict]:
         """预处理消息列表"""
         if self.debug_mode:
             logger.info(f"开始预处理 {len(messages)} 条消息")
         
-        processed_messages = []
-        for msg in messages:
-            processed_msg = await self._process_single_message(msg, model)
-            processed_messages.append(processed_msg)
+        processed_messages = [self._process_single_message(msg, model) for msg in messages]
         
         if self.debug_mode:
-            logger.info("消息预处理完成")
+            logger.info(f"消息预处理完成，模板缓存: {self.template_cache.get_stats()}")
         
         return processed_messages
     
-    async def _process_single_message(self, message: Dict, model: str = None) -> Dict:
+    def _process_single_message(self, message: Dict, model: str = None) -> Dict:
         """处理单条消息"""
         processed_msg = message.copy()
         
         # 处理字符串内容
         if isinstance(processed_msg.get('content'), str):
-            processed_msg['content'] = await self._process_text_content(processed_msg['content'], model)
+            processed_msg['content'] = self._render_text(processed_msg['content'], model)
         
         # 处理数组内容（如多模态消息）
         elif isinstance(processed_msg.get('content'), list):
@@ -99,7 +115,7 @@ class AgentPreprocessor:
             for part in processed_msg['content']:
                 if isinstance(part, dict) and part.get('type') == 'text':
                     processed_part = part.copy()
-                    processed_part['text'] = await self._process_text_content(part['text'], model)
+                    processed_part['text'] = self._render_text(part['text'], model)
                     processed_content.append(processed_part)
                 else:
                     processed_content.append(part)
@@ -109,174 +125,138 @@ class AgentPreprocessor:
     
     async def _process_text_content(self, text: str, model: str = None) -> str:
         """处理文本内容中的所有占位符"""
+        return self._render_text(text, model)
+    
+    def _render_text(self, text: str, model: str = None, depth: int = 0) -> str:
         if not text:
             return text
         
-        processed_text = text
-        
-        # 依次应用所有处理器
-        for processor_name, processor_func in self.processors.items():
-            try:
-                processed_text = await processor_func(processed_text, model)
-            except Exception as e:
-                logger.error(f"处理器 {processor_name} 执行失败: {e}")
-                continue
+        if "{{" in text:
+            template = self.template_cache.get(text)
+            text = template.render(lambda name: self._resolve(name, model, depth))
         
-        return processed_text
-    
-    async def _process_agent_placeholders(self, text: str, model: str = None) -> str:
-        """处理Agent占位符 {{AgentName}}"""
-        # 查找所有Agent环境变量
-        agent_configs = {}
-        for key, value in os.environ.items():
-            if key.startswith('Agent') and len(key) > 5:
-                agent_name = key[5:]  # 去掉"Agent"前缀
-                agent_configs[agent_name] = value
-        
-        for agent_name, agent_file in agent_configs.items():
-            placeholder = f"{{{{{agent_name}}}}}"
-            if placeholder in text:
-                try:
-                    agent_file_path = self.agent_dir / agent_file
-                    if agent_file_path.exists():
-                        with open(agent_file_path, 'r', encoding='utf-8') as f:
-                            agent_content = f.read()
-                        # 递归处理agent内容中的占位符
-                        agent_content = await self._process_text_content(agent_content, model)
-                        text = text.replace(placeholder, agent_content)
-                    else:
-                        text = text.replace(placeholder, f"[Agent {agent_name} ({agent_file}) not found]")
-                except Exception as e:
-                    logger.error(f"处理Agent占位符 {agent_name} 失败: {e}")
-                    text = text.replace(placeholder, f"[Error processing Agent {agent_name}]")
-        
-        return text
-    
-    async def _process_env_variables(self, text: str, model: str = None) -> str:
-        """处理环境变量占位符"""
-        # 处理Tarxxx变量
-        for key, value in os.environ.items():
-            if key.startswith('Tar'):
-                placeholder = f"{{{{{key}}}}}"
-                text = text.replace(placeholder, value or f"未配置{key}")
-        
-        # 处理Varxxx变量
-        for key, value in os.environ.items():
-            if key.startswith('Var'):
-                placeholder = f"{{{{{key}}}}}"
-                text = text.replace(placeholder, value or f"未配置{key}")
-        
-        # 处理Port变量
-        if 'PORT' in os.environ:
-            text = text.replace("{{Port}}", os.environ['PORT'])
-        
-        # 处理Image_Key变量
-        image_key = os.getenv('Image_Key')
-        if image_key:
-            text = text.replace("{{Image_Key}}", image_key)
-        
-        return text
-    
-    async def _process_time_date(self, text: str, model: str = None) -> str:
-        """处理时间日期占位符"""
-        now = datetime.now()
-        
-        # 日期
-        date_str = now.strftime('%Y-%m-%d')
-        text = text.replace("{{Date}}", date_str)
-        
-        # 时间
-        time_str = now.strftime('%H:%M:%S')
-        text = text.replace("{{Time}}", time_str)
-        
-        # 星期
-        weekday_names = ['星期一', '星期二', '星期三', '星期四', '星期五', '星期六', '星期日']
-        weekday = weekday_names[now.weekday()]
-        text = text.replace("{{Today}}", weekday)
+        # 系统提示词转换规则是任意子串替换，在占位符替换之后整体应用
+        for rule in self.detectors:
+            if rule['detector'] and rule['output']:
+                text = text.replace(rule['detector'], rule['output'])
         
         return text
     
-    async def _process_static_plugins(self, text: str, model: str = None) -> str:
-        """处理静态插件占位符"""
-        for placeholder, value in self.static_placeholder_values.items():
-            if placeholder in text:
-                text = text.replace(placeholder, value)
-        
-        return text
+    def _resolve(self, name: str, model: str = None, depth: int = 0) -> Optional[str]:
+        """解析单个占位符，优先级与原处理器顺序一致：Agent、环境变量、时间、静态插件、handoff、表情包、日记本、异步结果"""
+        if name in self._agent_files:
+            return self._render_agent(name, model, depth)
+        
+        if name in ('Date', 'Time', 'Today'):
+            return self._current_time_values()[name]
+        
+        value = self._value_cache.get(name)
+        if value is not None:
+            self._value_cache.move_to_end(name)
+            return value
+        value = self._compute_value(name)
+        if value is _UNRESOLVED:  # 用户输入的任意{{名称}}不缓存，避免缓存随输入无限增长
+            return None
+        self._value_cache[name] = value
+        if len(self._value_cache) > _VALUE_CACHE_SIZE:
+            self._value_cache.popitem(last=False)
+        return value
     
-    async def _process_handoff_tools(self, text: str, model: str = None) -> str:
-        """处理handoff工具占位符"""
-        # 处理{{handoffAllTools}}占位符
-        if "{{handoffAllTools}}" in text:
+    def _compute_value(self, name: str):
+        """计算不随时间变化的占位符值（已知占位符的结果由_resolve按名称缓存）"""
+        # 环境变量
+        if name.startswith('Tar') or name.startswith('Var'):
+            if name in os.environ:
+                return os.environ[name] or f"未配置{name}"
+            return _UNRESOLVED
+        if name == 'Port':
+            return os.environ['PORT'] if 'PORT' in os.environ else _UNRESOLVED
+        if name == 'Image_Key':
+            return os.getenv('Image_Key') or _UNRESOLVED
+        
+        # 静态插件
+        placeholder = "{{" + name + "}}"
+        if placeholder in self.static_placeholder_values:
+            return self.static_placeholder_values[placeholder]
+        
+        # handoff工具
+        if name == 'handoffAllTools':
             handoff_descriptions = []
             # 这里可以从插件管理器获取工具描述
             handoff_descriptions.append("示例工具1: 这是一个示例工具的描述")
             handoff_descriptions.append("示例工具2: 这是另一个示例工具的描述")
-            
-            all_tools_string = "\n\n---\n\n".join(handoff_descriptions) if handoff_descriptions else "没有可用的handoff工具描述信息"
-            text = text.replace("{{handoffAllTools}}", all_tools_string)
+            return "\n\n---\n\n".join(handoff_descriptions) if handoff_descriptions else "没有可用的handoff工具描述信息"
+        if name == 'handoffWeatherInfo':
+            return "天气信息不可用"
         
-        # 处理{{handoffWeatherInfo}}占位符
-        text = text.replace("{{handoffWeatherInfo}}", "天气信息不可用")
+        # 表情包
+        if name.endswith('表情包'):
+            return self.cached_emoji_lists.get(name, f"{name}列表不可用")
         
-        return text
-    
-    async def _process_emoji_placeholders(self, text: str, model: str = None) -> str:
-        """处理表情包占位符"""
-        emoji_pattern = r'\{\{(.+?表情包)\}\}'
-        
-        def replace_emoji(match):
-            emoji_name = match.group(1)
-            emoji_list = self.cached_emoji_lists.get(emoji_name, f"{emoji_name}列表不可用")
-            return emoji_list
-        
-        text = re.sub(emoji_pattern, replace_emoji, text)
-        return text
-    
-    async def _process_diary_placeholders(self, text: str, model: str = None) -> str:
-        """处理日记本占位符"""
-        diary_pattern = r'\{\{(.+?)日记本\}\}'
-        
-        def replace_diary(match):
-            character_name = match.group(1)
+        # 日记本
+        if name.endswith('日记本') and len(name) > 3:
+            character_name = name[:-3]
             # 这里可以从日记系统获取内容
-            diary_content = f"[{character_name}日记本内容为空或未从插件获取]"
-            return diary_content
-        
-        text = re.sub(diary_pattern, replace_diary, text)
-        return text
-    
-    async def _process_system_prompts(self, text: str, model: str = None) -> str:
-        """处理系统提示词转换规则"""
-        # 这里可以从配置文件加载转换规则
-        # 示例规则
-        for rule in self.detectors:
-            if rule['detector'] and rule['output']:
-                text = text.replace(rule['detector'], rule['output'])
+            return f"[{character_name}日记本内容为空或未从插件获取]"
         
-        return text
-    
-    async def _process_async_results(self, text: str, model: str = None) -> str:
-        """处理异步结果占位符"""
-        async_result_pattern = r'\{\{handoff_ASYNC_RESULT::([a-zA-Z0-9_.-]+)::([a-zA-Z0-9_-]+)\}\}'
-        
-        def replace_async_result(match):
-            plugin_name = match.group(1)
-            request_id = match.group(2)
+        # 异步结果
+        match = _ASYNC_RESULT_RE.fullmatch(name)
+        if match:
+            plugin_name, request_id = match.groups()
             # 这里可以从异步结果目录读取结果
-            result_text = f"[任务 {plugin_name} (ID: {request_id}) 结果待更新...]"
-            return result_text
+            return f"[任务 {plugin_name} (ID: {request_id}) 结果待更新...]"
         
-        text = re.sub(async_result_pattern, replace_async_result, text)
-        return text
+        return _UNRESOLVED
+    
+    def _current_time_values(self) -> Dict[str, str]:
+        """时间日期占位符，按秒缓存"""
+        second = int(time.time())
+        if second != self._time_second:
+            now = datetime.fromtimestamp(second)
+            self._time_values = {
+                'Date': now.strftime('%Y-%m-%d'),
+                'Time': now.strftime('%H:%M:%S'),
+                'Today': _WEEKDAY_NAMES[now.weekday()],
+            }
+            self._time_second = second
+        return self._time_values
+    
+    def _render_agent(self, agent_name: str, model: str = None, depth: int = 0) -> str:
+        """处理Agent占位符 {{AgentName}}：读取Agent文件并递归处理其中的占位符"""
+        agent_file = self._agent_files[agent_name]
+        if depth >= _MAX_AGENT_DEPTH:
+            logger.error(f"Agent占位符嵌套过深: {agent_name}")
+            return f"[Error processing Agent {agent_name}]"
+        try:
+            if agent_file not in self._agent_contents:
+                agent_file_path = self.agent_dir / agent_file
+                if agent_file_path.exists():
+                    with open(agent_file_path, 'r', encoding='utf-8') as f:
+                        self._agent_contents[agent_file] = f.read()
+                else:
+                    self._agent_contents[agent_file] = None
+            agent_content = self._agent_contents[agent_file]
+            if agent_content is None:
+                return f"[Agent {agent_name} ({agent_file}) not found]"
+            return self._render_text(agent_content, model, depth + 1)
+        except Exception as e:
+            logger.error(f"处理Agent占位符 {agent_name} 失败: {e}")
+            return f"[Error processing Agent {agent_name}]"
     
     def set_static_placeholder(self, placeholder: str, value: str):
         """设置静态占位符值"""
         self.static_placeholder_values[placeholder] = value
+        self._value_cache.pop(placeholder[2:-2] if placeholder.startswith("{{") else placeholder, None)
+    
+    def remove_static_placeholder(self, placeholder: str):
+        """移除静态占位符值（插件被删除时调用）"""
+        self.static_placeholder_values.pop(placeholder, None)
+        self._value_cache.pop(placeholder[2:-2] if placeholder.startswith("{{") else placeholder, None)
     
     def set_emoji_list(self, emoji_name: str, emoji_list: str):
         """设置表情包列表"""
         self.cached_emoji_lists[emoji_name] = emoji_list
+        self._value_cache.pop(emoji_name, None)
     
     async def process_image_content(self, messages: List[Dict]) -> List[Dict]:
         """处理图片内容"""
@@ -0,0 +1,117 @@
+# agent/stream_parser.py
+# 流式代理用的SSE事件切分与工具调用标记增量解析
+from typing import List, Optional, Tuple
+
+TOOL_REQUEST_START = "<<<[TOOL_REQUEST]>>>"
+TOOL_REQUEST_END = "<<<[END_TOOL_REQUEST]>>>"
+
+_EVENT_SEPARATORS = (b"\r\n\r\n", b"\n\n", b"\r\r")
+
+class SSEDecoder:
+    """把上游字节流切分为完整的SSE事件；跨网络分块的事件会等到结束空行再产出"""
+
+    def __init__(self):
+        self._buffer = b""
+
+    def feed(self, data: bytes) -> List[Tuple[bytes, Optional[str]]]:
+        """返回 [(事件原始字节, data字段)]；没有data字段的事件（注释/心跳）data为None"""
+        self._buffer += data
+        events = []
+        while True:
+            end, sep_len = -1, 0
+            for sep in _EVENT_SEPARATORS:
+                pos = self._buffer.find(sep)
+                if pos != -1 and (end == -1 or pos < end):
+                    end, sep_len = pos, len(sep)
+            if end == -1:
+                break
+            raw = self._buffer[:end + sep_len]
+            self._buffer = self._buffer[end + sep_len:]
+            events.append((raw, self._parse_data(raw[:end])))
+        return events
+
+    def flush(self) -> List[Tuple[bytes, Optional[str]]]:
+        """上游结束时处理缺少结束空行的最后一个事件"""
+        raw, self._buffer = self._buffer, b""
+        if not raw.strip():
+            return []
+        return [(raw + b"\n\n", self._parse_data(raw))]
+
+    @staticmethod
+    def _parse_data(block: bytes) -> Optional[str]:
+        lines = []
+        for line in block.decode("utf-8", errors="replace").splitlines():
+            if line.startswith("data:"):
+                value = line[5:]
+                lines.append(value[1:] if value.startswith(" ") else value)
+        return "\n".join(lines) if lines else None
+
+def _partial_suffix(text: str, marker: str) -> int:
+    """text末尾能作为marker前缀的最长长度（标记可能被拆在两个增量之间）"""
+    for k in range(min(len(text), len(marker) - 1), 0, -1):
+        if marker.startswith(text[-k:]):
+            return k
+    return 0
+
+class ToolCallStreamParser:
+    """逐个增量扫描工具调用标记
+
+    标记外的文本立即放行，只扣留末尾可能是半个起始标记的几个字符；
+    TOOL_REQUEST块内的文本不转发给客户端。content保存本轮完整的原始回复，
+    用于解析工具调用和写回消息历史。enabled为False时（已达循环上限）全部原样放行。
+    """
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self.content = ""
+        self.completed_blocks = 0
+        self._in_block = False
+        self._block = ""  # 当前未闭合块的原始文本
+        self._pending = ""  # 扣留的可能是半个标记的文本
+
+    @property
+    def has_tool_calls(self) -> bool:
+        return self.completed_blocks > 0
+
+    def feed(self, delta: str) -> str:
+        """输入一个文本增量，返回可以立即转发给客户端的文本"""
+        self.content += delta
+        if not self.enabled:
+            return delta
+        if not self._in_block and not self._pending and "<" not in delta:
+            return delta  # 绝大多数增量走这里
+        buf, self._pending = self._pending + delta, ""
+        out = []
+        while buf:
+            if not self._in_block:
+                pos = buf.find(TOOL_REQUEST_START)
+                if pos != -1:
+                    out.append(buf[:pos])
+                    buf = buf[pos + len(TOOL_REQUEST_START):]
+                    self._in_block = True
+                    self._block = TOOL_REQUEST_START
+                    continue
+                keep = _partial_suffix(buf, TOOL_REQUEST_START)
+                out.append(buf[:len(buf) - keep])
+                self._pending = buf[len(buf) - keep:]
+                break
+            pos = buf.find(TOOL_REQUEST_END)
+            if pos != -1:
+                buf = buf[pos + len(TOOL_REQUEST_END):]
+                self._in_block = False
+                self._block = ""
+                self.completed_blocks += 1
+                continue
+            keep = _partial_suffix(buf, TOOL_REQUEST_END)
+            self._block += buf[:len(buf) - keep]
+            self._pending = buf[len(buf) - keep:]
+            break
+        return "".join(out)
+
+    def flush(self) -> str:
+        """本轮结束：返回仍被扣留的文本（包括未闭合的工具调用块，原样交给客户端）"""
+        rest = (self._block if self._in_block else "") + self._pending
+        self._in_block = False
+        self._block = ""
+        self._pending = ""
+        return rest
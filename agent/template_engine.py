@@ -0,0 +1,63 @@
+# agent/template_engine.py
+# 占位符模板引擎 - 文本按内容只切分一次，之后单次扫描完成替换
+import re
+from collections import OrderedDict
+from typing import Callable, Dict, Optional, Tuple
+
+PLACEHOLDER_RE = re.compile(r'\{\{(.+?)\}\}')
+
+class CompiledTemplate:
+    """切分后的模板：literals比names多一个，渲染时按 文本/占位符/文本... 交替拼接"""
+    __slots__ = ("literals", "names")
+
+    def __init__(self, literals: Tuple[str, ...], names: Tuple[str, ...]):
+        self.literals = literals
+        self.names = names
+
+    def render(self, resolve: Callable[[str], Optional[str]]) -> str:
+        """resolve(name)返回替换值；返回None的占位符原样保留"""
+        if not self.names:
+            return self.literals[0]
+        out = [self.literals[0]]
+        for name, literal in zip(self.names, self.literals[1:]):
+            value = resolve(name)
+            out.append(value if value is not None else "{{" + name + "}}")
+            out.append(literal)
+        return "".join(out)
+
+def compile_template(text: str) -> CompiledTemplate:
+    """把文本切分为文本段和占位符名"""
+    literals, names, last = [], [], 0
+    for match in PLACEHOLDER_RE.finditer(text):
+        literals.append(text[last:match.start()])
+        names.append(match.group(1))
+        last = match.end()
+    literals.append(text[last:])
+    return CompiledTemplate(tuple(literals), tuple(names))
+
+class TemplateCache:
+    """按文本内容缓存编译结果的LRU缓存；多轮对话的历史消息每次请求都会重复出现"""
+
+    def __init__(self, max_entries: int = 2048):
+        self.max_entries = max_entries
+        self._templates: "OrderedDict[str, CompiledTemplate]" = OrderedDict()
+        self.stats = {"hits": 0, "misses": 0}
+
+    def get(self, text: str) -> CompiledTemplate:
+        template = self._templates.get(text)
+        if template is not None:
+            self._templates.move_to_end(text)
+            self.stats["hits"] += 1
+            return template
+        self.stats["misses"] += 1
+        template = compile_template(text)
+        self._templates[text] = template
+        if len(self._templates) > self.max_entries:
+            self._templates.popitem(last=False)
+        return template
+
+    def clear(self):
+        self._templates.clear()
+
+    def get_stats(self) -> Dict[str, int]:
+        return dict(self.stats, size=len(self._templates))
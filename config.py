@@ -108,6 +108,12 @@ class GRAGConfig(BaseModel):
     neo4j_user: str = Field(default="neo4j", description="Neo4j用户名")
     neo4j_password: str = Field(default="your_password", description="Neo4j密码")
     neo4j_database: str = Field(default="neo4j", description="Neo4j数据库名")
+    backend: str = Field(default="auto", description="图谱后端：auto(本地索引优先，Neo4j兜底)/local(仅本地索引)/neo4j(仅Neo4j)")
+    vector_recall: bool = Field(default=True, description="是否启用向量记忆召回")
+    vector_min_score: float = Field(default=0.3, ge=0.0, le=1.0, description="向量召回最低余弦相似度")
+    embedding_model: str = Field(default="", description="嵌入模型名称，留空使用本地哈希嵌入")
+    embedding_base_url: str = Field(default="", description="嵌入API地址，留空使用api.base_url")
+    embedding_api_key: str = Field(default="", description="嵌入API密钥，留空使用api.api_key")
 
 
 class HandoffConfig(BaseModel):
@@ -115,6 +121,9 @@ class HandoffConfig(BaseModel):
     max_loop_stream: int = Field(default=5, ge=1, le=20, description="流式模式最大工具调用循环次数")
     max_loop_non_stream: int = Field(default=5, ge=1, le=20, description="非流式模式最大工具调用循环次数")
     show_output: bool = Field(default=False, description="是否显示工具调用输出")
+    log_payload_chars: int = Field(default=500, ge=0, description="handoff追踪日志中任务/结果的最大字符数，0表示不截断")
+    agent_stream_max_chars: int = Field(default=0, ge=0, description="流式Agent调用累计输出达到该字符数后提前结束，0表示不限制")
+    agent_stream_max_seconds: float = Field(default=0, ge=0, description="流式Agent调用耗时达到该秒数后提前结束，0表示不限制")
 
 
 class MCPConfig(BaseModel):
@@ -152,6 +161,44 @@ class MCPConfig(BaseModel):
         description="从MCP服务中排除已注册为Agent的服务"
     )
 
+    # 启动配置
+    warm_up_agents: bool = Field(
+        default=False,
+        description="启动后在后台线程池中预创建MCP Agent实例（默认首次使用时创建）"
+    )
+
+    # 热重载配置
+    hot_reload: bool = Field(
+        default=False,
+        description="监听agent-manifest.json和agent_configs变化，增量重新注册变化的Agent（开发调试用）"
+    )
+    hot_reload_interval: float = Field(
+        default=2.0,
+        ge=0.2,
+        description="热重载轮询间隔（秒），inotify不可用时生效"
+    )
+
+    # 外部stdio MCP服务会话池配置
+    session_pool_min_size: int = Field(default=1, ge=0, le=16, description="每个外部MCP服务常驻的最少会话（子进程）数")
+    session_pool_max_size: int = Field(default=4, ge=1, le=32, description="每个外部MCP服务最多同时存在的会话数，决定并发调用上限")
+    session_ping_interval: float = Field(default=30.0, ge=0.0, description="空闲会话保活探测间隔（秒），0表示不探测")
+    session_idle_timeout: float = Field(default=300.0, ge=1.0, description="超过min_size的会话空闲多久后回收（秒）")
+    tools_cache_ttl: float = Field(default=300.0, ge=0.0, description="外部MCP服务工具列表缓存有效期（秒），过期后后台刷新")
+    result_cache_enabled: bool = Field(default=True, description="缓存manifest中声明cacheable的工具调用结果")
+    result_cache_ttl: float = Field(default=300.0, ge=0.0, description="cacheable工具未声明ttl时的默认结果缓存时间（秒）")
+    result_cache_size: int = Field(default=512, ge=1, description="工具结果缓存最大条数")
+    blocking_pool_workers: int = Field(default=8, ge=1, le=64, description="blocking型Agent专用线程池大小")
+    blocking_max_concurrency: int = Field(default=2, ge=1, description="blocking型Agent未声明maxConcurrency时的默认并发上限")
+
+    # 工具调用超时与熔断配置
+    tool_timeout: float = Field(default=30.0, gt=0.0, description="manifest未声明timeout时的工具调用超时（秒）")
+    breaker_failure_threshold: int = Field(default=3, ge=1, description="连续失败多少次后熔断该工具")
+    breaker_latency_ratio: float = Field(default=0.8, gt=0.0, description="p95延迟超过超时时间的该比例时熔断")
+    breaker_reset_timeout: float = Field(default=30.0, ge=1.0, description="熔断后多久放行一次试探调用（秒）")
+    agent_max_sessions: int = Field(default=256, ge=1, description="AgentManager最多保留的会话数，超出时淘汰最久未使用的会话")
+    agent_session_ttl: float = Field(default=86400.0, ge=60.0, description="Agent会话无活动多久后过期（秒）")
+    agent_max_concurrency: int = Field(default=4, ge=1, description="单个Agent未配置max_concurrency时的默认并发调用上限")
+
 
 class BrowserConfig(BaseModel):
     """浏览器配置"""
@@ -603,10 +650,12 @@ GRAG_NEO4J_URI = config.grag.neo4j_uri
 GRAG_NEO4J_USER = config.grag.neo4j_user
 GRAG_NEO4J_PASSWORD = config.grag.neo4j_password
 GRAG_NEO4J_DATABASE = config.grag.neo4j_database
+GRAG_BACKEND = config.grag.backend
 
 MAX_handoff_LOOP_STREAM = config.handoff.max_loop_stream
 MAX_handoff_LOOP_NON_STREAM = config.handoff.max_loop_non_stream
 SHOW_handoff_OUTPUT = config.handoff.show_output
+HANDOFF_LOG_PAYLOAD_CHARS = config.handoff.log_payload_chars
 
 BROWSER_PATH = config.browser.path
 PLAYWRIGHT_HEADLESS = config.browser.playwright_headless
@@ -636,6 +685,26 @@ MCP_AGENT_PRIORITY = config.mcp.agent_priority
 MCP_AUTO_DISCOVER_AGENTS = config.mcp.auto_discover_agents
 MCP_AUTO_DISCOVER_MCP = config.mcp.auto_discover_mcp
 MCP_EXCLUDE_AGENT_TOOLS_FROM_MCP = config.mcp.exclude_agent_tools_from_mcp
+MCP_WARM_UP_AGENTS = config.mcp.warm_up_agents
+MCP_HOT_RELOAD = config.mcp.hot_reload
+MCP_HOT_RELOAD_INTERVAL = config.mcp.hot_reload_interval
+MCP_SESSION_POOL_MIN_SIZE = config.mcp.session_pool_min_size
+MCP_SESSION_POOL_MAX_SIZE = config.mcp.session_pool_max_size
+MCP_SESSION_PING_INTERVAL = config.mcp.session_ping_interval
+MCP_SESSION_IDLE_TIMEOUT = config.mcp.session_idle_timeout
+MCP_TOOLS_CACHE_TTL = config.mcp.tools_cache_ttl
+MCP_RESULT_CACHE_ENABLED = config.mcp.result_cache_enabled
+MCP_RESULT_CACHE_TTL = config.mcp.result_cache_ttl
+MCP_RESULT_CACHE_SIZE = config.mcp.result_cache_size
+MCP_BLOCKING_POOL_WORKERS = config.mcp.blocking_pool_workers
+MCP_BLOCKING_MAX_CONCURRENCY = config.mcp.blocking_max_concurrency
+MCP_TOOL_TIMEOUT = config.mcp.tool_timeout
+MCP_BREAKER_FAILURE_THRESHOLD = config.mcp.breaker_failure_threshold
+MCP_BREAKER_LATENCY_RATIO = config.mcp.breaker_latency_ratio
+MCP_BREAKER_RESET_TIMEOUT = config.mcp.breaker_reset_timeout
+MCP_AGENT_MAX_SESSIONS = config.mcp.agent_max_sessions
+MCP_AGENT_SESSION_TTL = config.mcp.agent_session_ttl
+MCP_AGENT_MAX_CONCURRENCY = config.mcp.agent_max_concurrency
 
 # 系统提示词
 NAGA_SYSTEM_PROMPT = config.prompts.naga_system_prompt
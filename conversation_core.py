@@ -277,8 +277,8 @@ class NagaConversation: # 对话主类
         print(f"[DEBUG] 工具调用解析完成，共解析到 {len(tool_calls)} 个调用")
         return tool_calls
 
-    async def _execute_tool_calls(self, tool_calls: list) -> str:
-        """执行工具调用"""
+    async def _execute_tool_calls(self, tool_calls: list, on_agent_delta=None) -> str:
+        """执行工具调用；传入on_agent_delta(agent_name, delta)时Agent调用走流式，增量实时回调"""
         results = []
         for i, tool_call in enumerate(tool_calls):
             try:
@@ -305,6 +305,17 @@ class NagaConversation: # 对话主类
                         
                         if not agent_name or not prompt:
                             result = "Agent调用失败: 缺少agent_name或prompt参数"
+                        elif on_agent_delta:
+                            # 流式调用Agent：边生成边转发给用户，完整结果仍交回主循环
+                            parts = []
+                            async for delta in agent_manager.call_agent_stream(
+                                agent_name, prompt,
+                                max_chars=config.handoff.agent_stream_max_chars,
+                                max_seconds=config.handoff.agent_stream_max_seconds
+                            ):
+                                parts.append(delta)
+                                on_agent_delta(agent_name, delta)
+                            result = "".join(parts)
                         else:
                             # 直接调用Agent
                             result = await agent_manager.call_agent(agent_name, prompt)
@@ -343,7 +354,7 @@ class NagaConversation: # 对话主类
                 results.append(error_result)
         return "\n\n---\n\n".join(results)
 
-    async def handle_tool_call_loop(self, messages: List[Dict], is_streaming: bool = False) -> Dict:
+    async def handle_tool_call_loop(self, messages: List[Dict], is_streaming: bool = False, on_agent_delta=None) -> Dict:
         """处理工具调用循环"""
         recursion_depth = 0
         max_recursion = config.handoff.max_loop_stream if is_streaming else config.handoff.max_loop_non_stream
@@ -369,7 +380,7 @@ class NagaConversation: # 对话主类
                 for i, tool_call in enumerate(tool_calls):
                     print(f"[DEBUG] 工具调用{i+1}: {tool_call}")
                 
-                tool_results = await self._execute_tool_calls(tool_calls)
+                tool_results = await self._execute_tool_calls(tool_calls, on_agent_delta)
                 current_messages.append({'role': 'assistant', 'content': current_ai_content})
                 current_messages.append({'role': 'user', 'content': tool_results})
                 recursion_depth += 1
@@ -382,6 +393,32 @@ class NagaConversation: # 对话主类
             'messages': current_messages
         }
 
+    async def _forward_agent_output(self, loop_task, deltas):
+        """工具调用循环执行期间，把子Agent的流式输出按行转发给用户"""
+        import asyncio
+        buffers = {}
+        
+        def split_lines(name, delta):
+            *lines, buffers[name] = (buffers.get(name, "") + delta).split("\n")
+            return lines
+        
+        while True:
+            getter = asyncio.ensure_future(deltas.get())
+            done, _ = await asyncio.wait({getter, loop_task}, return_when=asyncio.FIRST_COMPLETED)
+            if getter not in done:
+                getter.cancel()
+                break
+            name, delta = getter.result()
+            for line in split_lines(name, delta):
+                yield (name, line)
+        while not deltas.empty():
+            name, delta = deltas.get_nowait()
+            for line in split_lines(name, delta):
+                yield (name, line)
+        for name, rest in buffers.items():
+            if rest:
+                yield (name, rest)
+
     def handle_llm_response(self, a, mcp):
         # 只保留普通文本流式输出逻辑 #
         async def text_stream():
@@ -562,7 +599,19 @@ class NagaConversation: # 对话主类
             
             # 普通模式：走工具调用循环（不等待思考树判断）
             try:
-                result = await self.handle_tool_call_loop(msgs, is_streaming=True)
+                if config.handoff.show_output:
+                    # 显示工具调用输出时，子Agent的回答边生成边转发，不必等整个循环结束
+                    import asyncio
+                    agent_deltas = asyncio.Queue()
+                    loop_task = asyncio.create_task(self.handle_tool_call_loop(
+                        msgs, is_streaming=True,
+                        on_agent_delta=lambda name, delta: agent_deltas.put_nowait((name, delta))
+                    ))
+                    async for speaker, line in self._forward_agent_output(loop_task, agent_deltas):
+                        yield (speaker, line)
+                    result = await loop_task
+                else:
+                    result = await self.handle_tool_call_loop(msgs, is_streaming=True)
                 final_content = result['content']
                 recursion_depth = result['recursion_depth']
                 
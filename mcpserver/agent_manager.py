@@ -7,15 +7,20 @@ Agent管理器 - 独立的Agent注册和调用系统
 
 import os
 import json
+import hashlib
 import asyncio
 import logging
 import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
 from pathlib import Path
-from typing import Dict, Any, Optional, List
+from typing import Dict, Any, Optional, List, Tuple, AsyncIterator
 from dataclasses import dataclass, field
 from datetime import datetime, timedelta
 import re
 
+from config import MCP_AGENT_MAX_SESSIONS, MCP_AGENT_SESSION_TTL, MCP_AGENT_MAX_CONCURRENCY
+
 # 配置日志
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("AgentManager")
@@ -25,6 +30,17 @@ logging.getLogger("httpcore.http11").setLevel(logging.WARNING)
 logging.getLogger("httpx").setLevel(logging.WARNING)
 logging.getLogger("httpcore.connection").setLevel(logging.WARNING)
 
+DEFAULT_API_BASE_URL = "https://api.deepseek.com/v1"
+
+# 占位符：{{AgentName}}等Agent字段、{{CurrentTime}}等时间、{{ENV_VAR}}环境变量，一次扫描完成替换
+_PLACEHOLDER_RE = re.compile(r'\{\{([A-Za-z_][A-Za-z0-9_]*)\}\}')
+_ENV_NAME_RE = re.compile(r'[A-Z_][A-Z0-9_]*')
+_TIME_FORMATS = {
+    "CurrentTime": "%H:%M:%S",
+    "CurrentDate": "%Y-%m-%d",
+    "CurrentDateTime": "%Y-%m-%d %H:%M:%S",
+}
+
 @dataclass
 class AgentConfig:
     """Agent配置类"""
@@ -38,6 +54,7 @@ class AgentConfig:
     model_provider: str = "openai"  # 模型提供商
     api_base_url: str = ""  # API基础URL
     api_key: str = ""  # API密钥
+    max_concurrency: int = 0  # 同时进行的调用上限，0表示使用全局默认值
 
 @dataclass
 class AgentSession:
@@ -46,6 +63,63 @@ class AgentSession:
     history: List[Dict[str, str]] = field(default_factory=list)
     session_id: str = "default_user_session"
 
+class AgentSessionStore:
+    """按 (Agent, 会话ID) 保存会话历史的LRU+TTL存储
+
+    每次访问都刷新时间戳并移到末尾，因此头部总是最久未活动的会话：
+    过期清理和超量淘汰都只需从头部弹出，不依赖后台定时任务。
+    """
+
+    def __init__(self, max_sessions: int = 256, ttl_seconds: float = 86400):
+        self.max_sessions = max(1, max_sessions)
+        self.ttl_seconds = ttl_seconds
+        self._sessions: "OrderedDict[Tuple[str, str], AgentSession]" = OrderedDict()
+        self.stats = {"hits": 0, "created": 0, "expired": 0, "evicted": 0}
+
+    def get(self, agent_name: str, session_id: str) -> AgentSession:
+        """取出会话（不存在或已过期则新建），并标记为最近使用"""
+        now = time.time()
+        key = (agent_name, session_id)
+        session = self._sessions.get(key)
+        if session is not None and now - session.timestamp > self.ttl_seconds:
+            del self._sessions[key]
+            self.stats["expired"] += 1
+            session = None
+        if session is None:
+            session = AgentSession(session_id=session_id)
+            self._sessions[key] = session
+            self.stats["created"] += 1
+        else:
+            self.stats["hits"] += 1
+        session.timestamp = now
+        self._sessions.move_to_end(key)
+        self._evict(now)
+        return session
+
+    def _evict(self, now: float):
+        while self._sessions:
+            key, oldest = next(iter(self._sessions.items()))
+            if now - oldest.timestamp > self.ttl_seconds:
+                self.stats["expired"] += 1
+            elif len(self._sessions) > self.max_sessions:
+                self.stats["evicted"] += 1
+            else:
+                break
+            del self._sessions[key]
+
+    def drop_agent(self, agent_name: str) -> int:
+        """清除某个Agent的全部会话，返回清除数量"""
+        keys = [k for k in self._sessions if k[0] == agent_name]
+        for k in keys:
+            del self._sessions[k]
+        return len(keys)
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return dict(self.stats, size=len(self._sessions), max_sessions=self.max_sessions)
+
 class AgentManager:
     """Agent管理器"""
     
@@ -58,10 +132,17 @@ class AgentManager:
         """
         self.config_dir = Path(config_dir)
         self.agents: Dict[str, AgentConfig] = {}
-        self.agent_sessions: Dict[str, Dict[str, AgentSession]] = {}
         self.max_history_rounds = 7  # 最大历史轮数
-        self.context_ttl_hours = 24  # 上下文TTL（小时）
+        self.context_ttl_hours = MCP_AGENT_SESSION_TTL / 3600  # 上下文TTL（小时）
+        self.agent_sessions = AgentSessionStore(MCP_AGENT_MAX_SESSIONS, MCP_AGENT_SESSION_TTL)
+        self.default_max_concurrency = MCP_AGENT_MAX_CONCURRENCY
         self.debug_mode = True
+        self.generation = 0  # Agent增删改时递增，用于使依赖Agent列表的缓存失效
+        self._config_files: Dict[str, tuple] = {}  # 配置文件路径 -> (内容哈希, Agent键列表)
+        self._clients: Dict[Tuple[str, str], tuple] = {}  # (API地址, 密钥) -> (事件循环, AsyncOpenAI客户端)
+        self._prompt_cache: Dict[str, tuple] = {}  # Agent名 -> (AgentConfig对象, 预编译的系统提示词)
+        self._semaphores: Dict[Tuple[asyncio.AbstractEventLoop, str], tuple] = {}  # (事件循环, Agent名) -> (并发上限, Semaphore)
+        self._call_stats: Dict[str, Dict[str, Any]] = {}
         
         # 确保配置目录存在
         self.config_dir.mkdir(exist_ok=True)
@@ -69,30 +150,51 @@ class AgentManager:
         # 加载Agent配置
         self._load_agent_configs()
         
-        # 启动定期清理任务（只在事件循环中启动）
-        try:
-            loop = asyncio.get_running_loop()
-            asyncio.create_task(self._periodic_cleanup())
-        except RuntimeError:
-            # 没有运行的事件循环，跳过定期清理任务
-            pass
-        
         logger.info(f"AgentManager初始化完成，已加载 {len(self.agents)} 个Agent")
     
-    def _load_agent_configs(self):
-        """从配置文件加载Agent定义"""
-        # 扫描配置文件目录
-        config_files = list(self.config_dir.glob("*.json"))
+    def read_config_files(self) -> Dict[str, bytes]:
+        """读取配置目录中的全部配置文件内容（文件路径 -> 原始字节），读取失败的文件跳过"""
+        raw_files = {}
+        for config_file in self.config_dir.glob("*.json"):
+            try:
+                raw_files[str(config_file)] = config_file.read_bytes()
+            except OSError as e:
+                logger.error(f"读取配置文件 {config_file} 失败: {e}")
+        return raw_files
+    
+    def _load_agent_configs(self, raw_files: Optional[Dict[str, bytes]] = None) -> Dict[str, List[str]]:
+        """从配置文件加载Agent定义
+        
+        按文件内容哈希增量加载：未变化的文件跳过，变化的文件只更新其中的Agent，
+        已删除的文件注销其Agent；manifest注册的Agent不受影响
+        
+        Args:
+            raw_files: 预先读取的配置文件内容（热重载时在监听线程读取），为None时现场读取
         
-        for config_file in config_files:
+        Returns:
+            Dict[str, List[str]]: {"added": [...], "updated": [...], "removed": [...]}
+        """
+        changes = {"added": [], "updated": [], "removed": []}
+        if raw_files is None:
+            raw_files = self.read_config_files()
+        seen = set()
+        
+        # 扫描配置文件目录
+        for file_key, raw in raw_files.items():
+            seen.add(file_key)
             try:
-                with open(config_file, 'r', encoding='utf-8') as f:
-                    config_data = json.load(f)
+                digest = hashlib.blake2b(raw, digest_size=16).hexdigest()
+                old_digest, old_keys = self._config_files.get(file_key, (None, []))
+                if digest == old_digest:
+                    continue
+                
+                config_data = json.loads(raw.decode('utf-8'))
                 
                 # 解析Agent配置
+                file_agents = {}
                 for agent_key, agent_data in config_data.items():
                     if self._validate_agent_config(agent_data):
-                        agent_config = AgentConfig(
+                        file_agents[agent_key] = AgentConfig(
                             id=agent_data.get('model_id', ''),
                             name=agent_data.get('name', agent_key),
                             base_name=agent_data.get('base_name', agent_key),
@@ -102,13 +204,35 @@ class AgentManager:
                             description=agent_data.get('description', f'Assistant {agent_data.get("name", agent_key)}.'),
                             model_provider=agent_data.get('model_provider', 'openai'),
                             api_base_url=agent_data.get('api_base_url', ''),
-                            api_key=agent_data.get('api_key', '')
+                            api_key=agent_data.get('api_key', ''),
+                            max_concurrency=agent_data.get('max_concurrency', 0)
                         )
-                        
-                        self.agents[agent_key] = agent_config
                 
             except Exception as e:
-                logger.error(f"加载配置文件 {config_file} 失败: {e}")
+                logger.error(f"加载配置文件 {file_key} 失败: {e}")
+                continue
+            
+            for agent_key in old_keys:
+                if agent_key not in file_agents and self.unregister_agent(agent_key):
+                    changes["removed"].append(agent_key)
+            for agent_key, agent_config in file_agents.items():
+                previous = self.agents.get(agent_key)
+                if previous == agent_config:
+                    continue
+                self.agents[agent_key] = agent_config
+                changes["updated" if previous else "added"].append(agent_key)
+            self._config_files[file_key] = (digest, list(file_agents))
+        
+        # 已删除的配置文件
+        for file_key in [k for k in self._config_files if k not in seen]:
+            _, old_keys = self._config_files.pop(file_key)
+            for agent_key in old_keys:
+                if self.unregister_agent(agent_key):
+                    changes["removed"].append(agent_key)
+        
+        if any(changes.values()):
+            self.generation += 1
+        return changes
     
     def _validate_agent_config(self, config: Dict[str, Any]) -> bool:
         """验证Agent配置"""
@@ -121,111 +245,89 @@ class AgentManager:
     
     def get_agent_session_history(self, agent_name: str, session_id: str = 'default_user_session') -> List[Dict[str, str]]:
         """获取Agent会话历史"""
-        if agent_name not in self.agent_sessions:
-            self.agent_sessions[agent_name] = {}
-        
-        agent_sessions = self.agent_sessions[agent_name]
-        if session_id not in agent_sessions or self._is_context_expired(agent_sessions[session_id].timestamp):
-            agent_sessions[session_id] = AgentSession(session_id=session_id)
-        
-        return agent_sessions[session_id].history
+        return self.agent_sessions.get(agent_name, session_id).history
     
     def update_agent_session_history(self, agent_name: str, user_message: str, assistant_message: str, session_id: str = 'default_user_session'):
         """更新Agent会话历史"""
-        if agent_name not in self.agent_sessions:
-            self.agent_sessions[agent_name] = {}
-        
-        agent_sessions = self.agent_sessions[agent_name]
-        if session_id not in agent_sessions or self._is_context_expired(agent_sessions[session_id].timestamp):
-            agent_sessions[session_id] = AgentSession(session_id=session_id)
-        
-        session_data = agent_sessions[session_id]
+        session_data = self.agent_sessions.get(agent_name, session_id)
         session_data.history.extend([
             {"role": "user", "content": user_message},
             {"role": "assistant", "content": assistant_message}
         ])
-        session_data.timestamp = time.time()
         
         # 限制历史消息数量
         max_messages = self.max_history_rounds * 2
         if len(session_data.history) > max_messages:
             session_data.history = session_data.history[-max_messages:]
     
-    def _is_context_expired(self, timestamp: float) -> bool:
-        """检查上下文是否过期"""
-        return (time.time() - timestamp) > (self.context_ttl_hours * 3600)
+    @staticmethod
+    def _agent_placeholders(agent_config: Optional[AgentConfig]) -> Dict[str, str]:
+        """Agent配置相关的占位符取值"""
+        if not agent_config:
+            return {}
+        return {
+            "AgentName": agent_config.name,
+            "MaidName": agent_config.name,
+            "BaseName": agent_config.base_name,
+            "Description": agent_config.description,
+            "ModelId": agent_config.id,
+            "Temperature": str(agent_config.temperature),
+            "MaxTokens": str(agent_config.max_output_tokens),
+            "ModelProvider": agent_config.model_provider,
+        }
+    
+    def _compile_template(self, text: str, agent_config: Optional[AgentConfig]) -> List[str]:
+        """把提示词编译为片段列表：偶数位是已替换好的文本，奇数位是时间格式串
+        
+        Agent字段和环境变量在编译时一次性替换，只有时间占位符留到渲染时取当前时间
+        """
+        values = self._agent_placeholders(agent_config)
+        parts, buf, last = [], [], 0
+        for match in _PLACEHOLDER_RE.finditer(text):
+            buf.append(text[last:match.start()])
+            last = match.end()
+            name = match.group(1)
+            if name in values:
+                buf.append(values[name])
+            elif name in _TIME_FORMATS:
+                parts.append(''.join(buf))
+                parts.append(_TIME_FORMATS[name])
+                buf = []
+            elif _ENV_NAME_RE.fullmatch(name):
+                buf.append(os.getenv(name, ''))
+            else:
+                buf.append(match.group(0))
+        buf.append(text[last:])
+        parts.append(''.join(buf))
+        return parts
     
-    async def _periodic_cleanup(self):
-        """定期清理过期的会话上下文"""
-        while True:
-            try:
-                await asyncio.sleep(3600)  # 每小时清理一次
-                
-                if self.debug_mode:
-                    logger.debug("执行定期上下文清理...")
-                
-                for agent_name, sessions in list(self.agent_sessions.items()):
-                    for session_id, session_data in list(sessions.items()):
-                        if self._is_context_expired(session_data.timestamp):
-                            sessions.pop(session_id, None)
-                            if self.debug_mode:
-                                logger.debug(f"清理过期上下文: {agent_name}, session {session_id}")
-                    
-                    if not sessions:
-                        self.agent_sessions.pop(agent_name, None)
-                        
-            except Exception as e:
-                logger.error(f"定期清理任务出错: {e}")
+    @staticmethod
+    def _render_template(parts: List[str]) -> str:
+        if len(parts) == 1:
+            return parts[0]
+        now = datetime.now()
+        return ''.join(part if i % 2 == 0 else now.strftime(part) for i, part in enumerate(parts))
     
     def _replace_placeholders(self, text: str, agent_config: AgentConfig) -> str:
         """替换提示词中的占位符，支持Agent配置和环境变量"""
         if not text:
             return ""
-        
-        processed_text = str(text)
-        
-        # Agent配置相关的占位符替换
-        if agent_config:
-            # 基础Agent信息
-            processed_text = processed_text.replace("{{AgentName}}", agent_config.name)
-            processed_text = processed_text.replace("{{MaidName}}", agent_config.name)
-            processed_text = processed_text.replace("{{BaseName}}", agent_config.base_name)
-            processed_text = processed_text.replace("{{Description}}", agent_config.description)
-            processed_text = processed_text.replace("{{ModelId}}", agent_config.id)
-            
-            # 配置参数
-            processed_text = processed_text.replace("{{Temperature}}", str(agent_config.temperature))
-            processed_text = processed_text.replace("{{MaxTokens}}", str(agent_config.max_output_tokens))
-            processed_text = processed_text.replace("{{ModelProvider}}", agent_config.model_provider)
-        
-        # 环境变量占位符替换
-        import os
-        import re
-        
-        # 匹配 {{ENV_VAR_NAME}} 格式的环境变量
-        env_pattern = r'\{\{([A-Z_][A-Z0-9_]*)\}\}'
-        for match in re.finditer(env_pattern, processed_text):
-            env_var_name = match.group(1)
-            env_value = os.getenv(env_var_name, '')
-            processed_text = processed_text.replace(f"{{{{{env_var_name}}}}}", env_value)
-        
-        # 时间相关占位符
-        from datetime import datetime
-        now = datetime.now()
-        processed_text = processed_text.replace("{{CurrentTime}}", now.strftime("%H:%M:%S"))
-        processed_text = processed_text.replace("{{CurrentDate}}", now.strftime("%Y-%m-%d"))
-        processed_text = processed_text.replace("{{CurrentDateTime}}", now.strftime("%Y-%m-%d %H:%M:%S"))
-        
-        return processed_text
+        return self._render_template(self._compile_template(str(text), agent_config))
     
     def _build_system_message(self, agent_config: AgentConfig) -> Dict[str, str]:
-        """构建系统消息，包含Agent的身份、行为、风格等"""
-        # 处理系统提示词中的占位符
-        processed_system_prompt = self._replace_placeholders(agent_config.system_prompt, agent_config)
+        """构建系统消息，包含Agent的身份、行为、风格等
+        
+        预编译结果按Agent缓存，以AgentConfig对象本身作为版本：配置变化时会换成新对象，缓存随之失效。
+        环境变量取值也随缓存固定，修改后需重新加载Agent配置才会生效。
+        """
+        cached = self._prompt_cache.get(agent_config.base_name)
+        if cached is None or cached[0] is not agent_config:
+            cached = (agent_config, self._compile_template(agent_config.system_prompt or "", agent_config))
+            self._prompt_cache[agent_config.base_name] = cached
         
         return {
             "role": "system",
-            "content": processed_system_prompt
+            "content": self._render_template(cached[1])
         }
     
     def _build_user_message(self, prompt: str, agent_config: AgentConfig) -> Dict[str, str]:
@@ -281,14 +383,7 @@ class AgentManager:
         """
         # 检查Agent是否存在
         if agent_name not in self.agents:
-            available_agents = list(self.agents.keys())
-            error_msg = f"请求的Agent '{agent_name}' 未找到或未正确配置。"
-            if available_agents:
-                error_msg += f" 当前已加载的Agent有: {', '.join(available_agents)}。"
-            else:
-                error_msg += " 当前没有加载任何Agent。请检查配置文件。"
-            error_msg += " 请确认您请求的Agent名称是否准确。"
-            
+            error_msg = self._agent_not_found_error(agent_name)
             logger.error(f"Agent调用失败: {error_msg}")
             return {"status": "error", "error": error_msg}
         
@@ -299,59 +394,219 @@ class AgentManager:
             session_id = f"agent_{agent_config.base_name}_default_user_session"
         
         try:
-            # 获取会话历史
-            history = self.get_agent_session_history(agent_name, session_id)
-            
-            # 构建完整的消息序列
-            messages = []
-            
-            # 1. 系统消息：设定Agent的身份、行为、风格等
-            system_message = self._build_system_message(agent_config)
-            messages.append(system_message)
-            
-            # 2. 历史消息：保留多轮对话的上下文
-            messages.extend(history)
-            
-            # 3. 当前用户输入：本次要处理的任务内容
-            user_message = self._build_user_message(prompt, agent_config)
-            messages.append(user_message)
-            
-            # 验证消息序列
-            if not self._validate_messages(messages):
-                return {"status": "error", "error": "消息序列格式无效"}
-            
-            # 记录调试信息
-            if self.debug_mode:
-                logger.debug(f"Agent调用消息序列:")
-                for i, msg in enumerate(messages):
-                    logger.debug(f"  [{i}] {msg['role']}: {msg['content'][:100]}...")
-            
-            # 调用LLM API
-            response = await self._call_llm_api(agent_config, messages)
-            
-            if response.get("status") == "success":
-                assistant_response = response.get("result", "")
-                
-                # 更新会话历史
-                self.update_agent_session_history(
-                    agent_name, user_message['content'], assistant_response, session_id
-                )
-                
-                return {"status": "success", "result": assistant_response}
-            else:
-                return response
-                
+            async with self._call_slot(agent_name, agent_config):
+                return await self._run_agent_call(agent_name, agent_config, prompt, session_id)
         except Exception as e:
             error_msg = f"调用Agent '{agent_name}' 时发生错误: {str(e)}"
             logger.error(f"Agent调用异常: {error_msg}")
             return {"status": "error", "error": error_msg}
     
+    async def call_agent_stream(self, agent_name: str, prompt: str, session_id: str = None,
+                                max_chars: int = 0, max_seconds: float = 0) -> AsyncIterator[str]:
+        """
+        流式调用指定的Agent，边生成边产出文本增量
+        
+        Args:
+            agent_name: Agent名称
+            prompt: 用户提示词
+            session_id: 会话ID
+            max_chars: 累计输出超过该字符数时截断并提前结束，恰好输出该字符数不算截断，0表示不限制
+            max_seconds: 调用耗时达到该秒数后提前结束，0表示不限制
+            
+        Yields:
+            str: 文本增量；出错时产出一条以"Agent调用失败: "开头的文本后结束
+        
+        提前结束时关闭上游流并产出截断提示，已生成的部分照常写入会话历史
+        """
+        if agent_name not in self.agents:
+            error_msg = self._agent_not_found_error(agent_name)
+            logger.error(f"Agent调用失败: {error_msg}")
+            yield f"Agent调用失败: {error_msg}"
+            return
+        
+        agent_config = self.agents[agent_name]
+        if not session_id:
+            session_id = f"agent_{agent_config.base_name}_default_user_session"
+        
+        async with self._call_slot(agent_name, agent_config):
+            prepared = self._prepare_messages(agent_name, agent_config, prompt, session_id)
+            if isinstance(prepared, str):
+                yield f"Agent调用失败: {prepared}"
+                return
+            messages, user_content = prepared
+            
+            started = time.monotonic()
+            chunks: List[str] = []
+            produced = 0
+            stop_reason = ""
+            stream = None
+            try:
+                client = self._get_client(agent_config)
+                stream = await client.chat.completions.create(
+                    model=agent_config.id,
+                    messages=messages,
+                    max_tokens=agent_config.max_output_tokens,
+                    temperature=agent_config.temperature,
+                    stream=True
+                )
+                iterator = stream.__aiter__()
+                while True:
+                    if max_seconds:
+                        remaining = max_seconds - (time.monotonic() - started)
+                        if remaining <= 0:
+                            stop_reason = f"耗时达到{max_seconds:g}秒"
+                            break
+                        try: # 上游停顿时也按时间预算结束，不必等到下一个分块
+                            chunk = await asyncio.wait_for(iterator.__anext__(), remaining)
+                        except asyncio.TimeoutError:
+                            stop_reason = f"耗时达到{max_seconds:g}秒"
+                            break
+                    else:
+                        chunk = await iterator.__anext__()
+                    delta = chunk.choices[0].delta.content if chunk.choices else None
+                    if not delta:
+                        continue
+                    if max_chars and produced + len(delta) > max_chars:
+                        delta = delta[:max_chars - produced]
+                        stop_reason = f"输出达到{max_chars}字符"
+                    chunks.append(delta)
+                    produced += len(delta)
+                    if delta:
+                        yield delta
+                    if stop_reason:
+                        break
+            except StopAsyncIteration:
+                pass
+            except Exception as e:
+                error_msg = f"LLM API调用失败: {str(e)}"
+                logger.error(f"Agent '{agent_config.name}' 流式调用失败: {error_msg}")
+                yield f"Agent调用失败: {error_msg}"
+                return
+            finally:
+                if stream is not None:
+                    try:
+                        await stream.close() # 提前结束或调用方放弃时关闭上游连接，不再消耗token
+                    except Exception:
+                        pass
+            
+            if stop_reason:
+                notice = f"\n…（{stop_reason}，已提前结束）"
+                chunks.append(notice)
+                yield notice
+            if chunks:
+                self.update_agent_session_history(agent_name, user_content, "".join(chunks), session_id)
+    
+    def _agent_not_found_error(self, agent_name: str) -> str:
+        available_agents = list(self.agents.keys())
+        error_msg = f"请求的Agent '{agent_name}' 未找到或未正确配置。"
+        if available_agents:
+            error_msg += f" 当前已加载的Agent有: {', '.join(available_agents)}。"
+        else:
+            error_msg += " 当前没有加载任何Agent。请检查配置文件。"
+        error_msg += " 请确认您请求的Agent名称是否准确。"
+        return error_msg
+    
+    @asynccontextmanager
+    async def _call_slot(self, agent_name: str, agent_config: AgentConfig):
+        """按Agent限制并发调用数，超出上限的调用排队等待，并记录排队/执行统计"""
+        limit = max(1, agent_config.max_concurrency or self.default_max_concurrency)
+        loop = asyncio.get_running_loop()
+        key = (loop, agent_name) # Semaphore绑定首次使用它的事件循环，按循环分开
+        entry = self._semaphores.get(key)
+        if entry is None or entry[0] != limit: # 上限随配置变化时换新信号量，已借出的名额在旧信号量上归还
+            if entry is None:
+                self._prune_closed_loops()
+            entry = (limit, asyncio.Semaphore(limit))
+            self._semaphores[key] = entry
+        stats = self._call_stats.setdefault(agent_name, {
+            "queued": 0, "running": 0, "completed": 0, "failed": 0,
+            "max_queued": 0, "total_wait_ms": 0.0, "total_run_ms": 0.0
+        })
+        stats["queued"] += 1
+        stats["max_queued"] = max(stats["max_queued"], stats["queued"])
+        enqueued = time.perf_counter()
+        waiting = True
+        try:
+            async with entry[1]:
+                waiting = False
+                stats["queued"] -= 1
+                stats["running"] += 1
+                started = time.perf_counter()
+                stats["total_wait_ms"] += (started - enqueued) * 1000
+                try:
+                    yield
+                    stats["completed"] += 1
+                except BaseException:
+                    stats["failed"] += 1
+                    raise
+                finally:
+                    stats["running"] -= 1
+                    stats["total_run_ms"] += (time.perf_counter() - started) * 1000
+        finally:
+            if waiting: # 排队期间被取消
+                stats["queued"] -= 1
+    
+    def _prepare_messages(self, agent_name: str, agent_config: AgentConfig, prompt: str, session_id: str):
+        """构建完整消息序列，返回 (消息列表, 处理后的用户输入)；配置或消息无效时返回错误描述字符串"""
+        if not agent_config.id:
+            return "Agent配置缺少模型ID"
+        if not agent_config.api_key:
+            return "Agent配置缺少API密钥"
+        
+        # 获取会话历史
+        history = self.get_agent_session_history(agent_name, session_id)
+        
+        # 构建完整的消息序列
+        messages = []
+        
+        # 1. 系统消息：设定Agent的身份、行为、风格等
+        system_message = self._build_system_message(agent_config)
+        messages.append(system_message)
+        
+        # 2. 历史消息：保留多轮对话的上下文
+        messages.extend(history)
+        
+        # 3. 当前用户输入：本次要处理的任务内容
+        user_message = self._build_user_message(prompt, agent_config)
+        messages.append(user_message)
+        
+        # 验证消息序列
+        if not self._validate_messages(messages):
+            return "消息序列格式无效"
+        
+        # 记录调试信息
+        if self.debug_mode:
+            logger.debug(f"Agent调用消息序列:")
+            for i, msg in enumerate(messages):
+                logger.debug(f"  [{i}] {msg['role']}: {msg['content'][:100]}...")
+        
+        return messages, user_message['content']
+    
+    async def _run_agent_call(self, agent_name: str, agent_config: AgentConfig, prompt: str, session_id: str) -> Dict[str, Any]:
+        """构建消息并调用LLM，成功后写回会话历史"""
+        prepared = self._prepare_messages(agent_name, agent_config, prompt, session_id)
+        if isinstance(prepared, str):
+            return {"status": "error", "error": prepared}
+        messages, user_content = prepared
+        
+        # 调用LLM API
+        response = await self._call_llm_api(agent_config, messages)
+        
+        if response.get("status") == "success":
+            assistant_response = response.get("result", "")
+            
+            # 更新会话历史
+            self.update_agent_session_history(
+                agent_name, user_content, assistant_response, session_id
+            )
+            
+            return {"status": "success", "result": assistant_response}
+        else:
+            return response
+    
     async def _call_llm_api(self, agent_config: AgentConfig, messages: List[Dict[str, str]]) -> Dict[str, Any]:
         """调用LLM API，使用Agent配置中的参数"""
         try:
-            # 使用新版本的OpenAI API
-            from openai import AsyncOpenAI
-            
             # 记录调试信息
             if self.debug_mode:
                 logger.debug(f"调用LLM API - Agent: {agent_config.name}")
@@ -369,11 +624,8 @@ class AgentManager:
             if not agent_config.api_key:
                 return {"status": "error", "error": "Agent配置缺少API密钥"}
             
-            # 创建客户端，使用Agent配置中的参数
-            client = AsyncOpenAI(
-                api_key=agent_config.api_key,
-                base_url=agent_config.api_base_url or "https://api.deepseek.com/v1"
-            )
+            # 复用同一API地址和密钥的客户端（及其连接池）
+            client = self._get_client(agent_config)
             
             # 准备API调用参数
             api_params = {
@@ -415,6 +667,74 @@ class AgentManager:
             
             return {"status": "error", "error": error_msg}
     
+    def _prune_closed_loops(self):
+        """丢弃已关闭事件循环上的信号量"""
+        for key in [key for key in self._semaphores if key[0].is_closed()]:
+            del self._semaphores[key]
+    
+    def _get_client(self, agent_config: AgentConfig):
+        """按 (API地址, 密钥) 复用AsyncOpenAI客户端
+        
+        客户端的HTTP连接池绑定创建它的事件循环，在其它事件循环中调用时新建一个替换，
+        被替换的客户端在其所属事件循环上关闭
+        """
+        from openai import AsyncOpenAI
+        
+        base_url = agent_config.api_base_url or DEFAULT_API_BASE_URL
+        key = (base_url, agent_config.api_key)
+        loop = asyncio.get_running_loop()
+        entry = self._clients.get(key)
+        if entry is None or entry[0] is not loop:
+            if entry is not None:
+                self._close_replaced_client(*entry)
+            entry = (loop, AsyncOpenAI(api_key=agent_config.api_key, base_url=base_url))
+            self._clients[key] = entry
+        return entry[1]
+    
+    @staticmethod
+    def _close_replaced_client(loop: asyncio.AbstractEventLoop, client):
+        """在客户端所属的事件循环上关闭它；循环已停止时连接随循环一起释放，无法再关闭"""
+        if loop.is_closed() or not loop.is_running():
+            logger.debug("被替换的API客户端所属事件循环已停止，跳过关闭")
+            return
+        def on_closed(future):
+            if not future.cancelled() and future.exception() is not None:
+                logger.debug(f"关闭被替换的API客户端失败: {future.exception()}")
+        
+        coroutine = client.close()
+        try:
+            asyncio.run_coroutine_threadsafe(coroutine, loop).add_done_callback(on_closed)
+        except RuntimeError as e: # 循环在检查后关闭
+            coroutine.close()
+            logger.debug(f"关闭被替换的API客户端失败: {e}")
+    
+    async def close(self):
+        """关闭复用的API客户端"""
+        clients, self._clients = list(self._clients.values()), {}
+        for _, client in clients:
+            try:
+                await client.close()
+            except Exception as e:
+                logger.debug(f"关闭API客户端失败: {e}")
+    
+    def get_runtime_stats(self) -> Dict[str, Any]:
+        """Agent运行时统计：各Agent的排队/执行情况、会话存储和客户端复用情况"""
+        agents = {}
+        limits = {agent_name: limit for (_, agent_name), (limit, _) in self._semaphores.items()}
+        for agent_name, stats in self._call_stats.items():
+            finished = stats["completed"] + stats["failed"]
+            agents[agent_name] = dict(
+                stats,
+                limit=limits.get(agent_name),
+                avg_wait_ms=round(stats["total_wait_ms"] / finished, 1) if finished else 0.0
+            )
+        return {
+            "agents": agents,
+            "sessions": self.agent_sessions.get_stats(),
+            "clients": len(self._clients),
+            "default_max_concurrency": self.default_max_concurrency
+        }
+    
     def get_available_agents(self) -> List[Dict[str, Any]]:
         """获取所有可用的Agent列表"""
         return [
@@ -446,11 +766,25 @@ class AgentManager:
             "model_provider": agent_config.model_provider
         }
     
-    def reload_configs(self):
-        """重新加载Agent配置"""
-        self.agents.clear()
-        self._load_agent_configs()
-        logger.info("Agent配置已重新加载")
+    def reload_configs(self, raw_files: Optional[Dict[str, bytes]] = None) -> Dict[str, List[str]]:
+        """增量重新加载Agent配置，只处理内容变化的配置文件"""
+        changes = self._load_agent_configs(raw_files)
+        if any(changes.values()):
+            logger.info(f"Agent配置已重新加载: {changes}")
+        return changes
+    
+    def unregister_agent(self, agent_name: str) -> bool:
+        """注销Agent并清理其会话"""
+        if agent_name not in self.agents:
+            return False
+        agent_config = self.agents.pop(agent_name)
+        self.agent_sessions.drop_agent(agent_name)
+        self._prompt_cache.pop(agent_config.base_name, None)
+        for key in [key for key in self._semaphores if key[1] == agent_name]:
+            del self._semaphores[key]
+        self.generation += 1
+        logger.info(f"已注销Agent: {agent_name}")
+        return True
     
     def _register_agent_from_manifest(self, agent_name: str, agent_config: Dict[str, Any]):
         """从manifest注册Agent
@@ -476,11 +810,14 @@ class AgentManager:
                 description=agent_config.get('description', f'Assistant {agent_config.get("name", agent_name)}.'),
                 model_provider=agent_config.get('model_provider', 'openai'),
                 api_base_url=agent_config.get('api_base_url', ''),
-                api_key=agent_config.get('api_key', '')
+                api_key=agent_config.get('api_key', ''),
+                max_concurrency=agent_config.get('max_concurrency', 0)
             )
             
             # 注册到agents字典
-            self.agents[agent_name] = agent_config_obj
+            if self.agents.get(agent_name) != agent_config_obj:
+                self.agents[agent_name] = agent_config_obj
+                self.generation += 1
             logger.info(f"已从manifest注册Agent: {agent_name} ({agent_config_obj.name})")
             return True
             
@@ -558,6 +895,12 @@ async def call_agent(agent_name: str, prompt: str, session_id: str = None) -> Di
     manager = get_agent_manager()
     return await manager.call_agent(agent_name, prompt, session_id)
 
+def call_agent_stream(agent_name: str, prompt: str, session_id: str = None,
+                      max_chars: int = 0, max_seconds: float = 0) -> AsyncIterator[str]:
+    """便捷的Agent流式调用函数"""
+    manager = get_agent_manager()
+    return manager.call_agent_stream(agent_name, prompt, session_id, max_chars, max_seconds)
+
 def list_agents() -> List[Dict[str, Any]]:
     """便捷的Agent列表获取函数"""
     manager = get_agent_manager()
@@ -0,0 +1,106 @@
+# blocking_executor.py # 阻塞型Agent调用的专用线程池
+import asyncio
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+_thread_local = threading.local()
+
+def _run_in_worker(func: Callable[[], Any]) -> Any:
+    """在工作线程中执行func；返回协程时用该线程常驻的事件循环跑完"""
+    result = func()
+    if asyncio.iscoroutine(result):
+        loop = getattr(_thread_local, 'loop', None)
+        if loop is None or loop.is_closed():
+            loop = asyncio.new_event_loop()
+            _thread_local.loop = loop
+        asyncio.set_event_loop(loop)
+        result = loop.run_until_complete(result)
+    return result
+
+class BlockingCallExecutor:
+    """有界线程池 + 每个Agent的并发上限
+
+    声明了blocking的Agent（同步子进程、网络I/O、python-docx读写等）在这里执行，
+    不占用UI/API服务的事件循环；同一Agent超过并发上限的调用在事件循环侧排队等待。
+    """
+
+    def __init__(self, max_workers: int = 8, default_limit: int = 2):
+        self.max_workers = max_workers
+        self.default_limit = max(1, default_limit)
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+        self._stats: Dict[str, Dict[str, Any]] = {}
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="mcp-blocking")
+        return self._executor
+
+    def _semaphore(self, name: str, limit: Optional[int]) -> asyncio.Semaphore:
+        semaphore = self._semaphores.get(name)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(max(1, limit or self.default_limit))
+            self._semaphores[name] = semaphore
+        return semaphore
+
+    async def run(self, name: str, func: Callable[[], Any], limit: Optional[int] = None) -> Any:
+        """在线程池中执行func（可返回协程），同一name最多limit个同时执行
+
+        并发名额在工作线程真正结束时才归还：调用方超时或被取消后线程仍在执行，
+        此时提前释放会让同一Agent实际运行的线程数超过上限。
+        """
+        stats = self._stats.setdefault(name, {
+            "queued": 0, "running": 0, "completed": 0, "failed": 0,
+            "max_queued": 0, "total_wait_ms": 0.0, "total_run_ms": 0.0
+        })
+        semaphore = self._semaphore(name, limit)
+        stats["queued"] += 1
+        stats["max_queued"] = max(stats["max_queued"], stats["queued"])
+        enqueued = time.perf_counter()
+        try:
+            await semaphore.acquire()
+        finally:
+            stats["queued"] -= 1 # 排队期间被取消时同样出队
+        stats["running"] += 1
+        started = time.perf_counter()
+        stats["total_wait_ms"] += (started - enqueued) * 1000
+        loop = asyncio.get_running_loop()
+
+        def finish(future: Future):
+            stats["running"] -= 1
+            stats["total_run_ms"] += (time.perf_counter() - started) * 1000
+            if future.cancelled() or future.exception() is not None:
+                stats["failed"] += 1
+            else:
+                stats["completed"] += 1
+            semaphore.release()
+
+        def on_done(future: Future):
+            # 工作线程中回调，切回事件循环归还名额；循环已关闭时名额随循环一起失效
+            try:
+                loop.call_soon_threadsafe(finish, future)
+            except RuntimeError:
+                pass
+
+        try:
+            future = self._get_executor().submit(_run_in_worker, func)
+        except Exception:
+            stats["running"] -= 1
+            stats["failed"] += 1
+            semaphore.release()
+            raise
+        future.add_done_callback(on_done)
+        return await asyncio.wrap_future(future, loop=loop)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "max_workers": self.max_workers,
+            "agents": {name: dict(stats) for name, stats in self._stats.items()}
+        }
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
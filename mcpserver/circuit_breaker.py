@@ -0,0 +1,98 @@
+# circuit_breaker.py # 按 (服务, 工具) 的熔断器
+import math
+import time
+from collections import deque
+from typing import Any, Dict, Optional
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+class CircuitBreaker:
+    """连续失败或p95延迟过高时熔断，熔断期间快速失败，reset_timeout后放行一次试探调用"""
+
+    def __init__(self, failure_threshold: int = 3, latency_threshold_ms: Optional[float] = None,
+                 reset_timeout: float = 30.0, window: int = 20, min_samples: int = 5):
+        self.failure_threshold = failure_threshold
+        self.latency_threshold_ms = latency_threshold_ms
+        self.reset_timeout = reset_timeout
+        self.min_samples = min_samples
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.open_reason = ""
+        self.latencies = deque(maxlen=window) # 最近成功调用的耗时(ms)
+        self.stats = {"successes": 0, "failures": 0, "timeouts": 0, "rejected": 0, "opened": 0}
+        self._probe_in_flight = False
+
+    def allow(self) -> bool:
+        """是否允许本次调用；熔断中返回False"""
+        if self.state == OPEN:
+            if time.monotonic() - self.opened_at < self.reset_timeout:
+                self.stats["rejected"] += 1
+                return False
+            self.state = HALF_OPEN
+            self._probe_in_flight = False
+        if self.state == HALF_OPEN:
+            if self._probe_in_flight: # 半开状态只放行一个试探调用
+                self.stats["rejected"] += 1
+                return False
+            self._probe_in_flight = True
+        return True
+
+    def record_success(self, latency_ms: float):
+        self.stats["successes"] += 1
+        self.consecutive_failures = 0
+        self.latencies.append(latency_ms)
+        if self.state == HALF_OPEN:
+            self.state = CLOSED
+            self._probe_in_flight = False
+            self.latencies.clear()
+            self.latencies.append(latency_ms)
+            return
+        p95 = self.p95()
+        if self.latency_threshold_ms and p95 is not None and p95 > self.latency_threshold_ms:
+            self._open(f"p95延迟{p95:.0f}ms超过{self.latency_threshold_ms:.0f}ms")
+
+    def record_failure(self, timeout: bool = False):
+        self.stats["failures"] += 1
+        if timeout:
+            self.stats["timeouts"] += 1
+        self.consecutive_failures += 1
+        if self.state == HALF_OPEN:
+            self._open("试探调用失败")
+        elif self.consecutive_failures >= self.failure_threshold:
+            self._open(f"连续失败{self.consecutive_failures}次")
+
+    def _open(self, reason: str):
+        self.state = OPEN
+        self.opened_at = time.monotonic()
+        self.open_reason = reason
+        self._probe_in_flight = False
+        self.stats["opened"] += 1
+
+    def p95(self) -> Optional[float]:
+        if len(self.latencies) < self.min_samples:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, math.ceil(len(ordered) * 0.95) - 1)]
+
+    @property
+    def available(self) -> bool:
+        """供服务列表使用：熔断且尚未到试探时间时视为不可用"""
+        return not (self.state == OPEN and time.monotonic() - self.opened_at < self.reset_timeout)
+
+    def retry_after(self) -> float:
+        if self.state != OPEN:
+            return 0.0
+        return max(0.0, self.reset_timeout - (time.monotonic() - self.opened_at))
+
+    def snapshot(self) -> Dict[str, Any]:
+        return dict(
+            self.stats,
+            state=self.state,
+            available=self.available,
+            reason=self.open_reason if self.state != CLOSED else "",
+            retry_after=round(self.retry_after(), 1),
+            p95_ms=self.p95()
+        )
@@ -0,0 +1,194 @@
+# manifest_watcher.py # 监听manifest/Agent配置文件变化，触发增量重载
+import ctypes
+import ctypes.util
+import fnmatch
+import os
+import select
+import struct
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+# inotify事件掩码（见 <sys/inotify.h>）
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = os.O_NONBLOCK
+WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+EVENT_HEADER = struct.Struct('iIII') # wd, mask, cookie, len
+
+IGNORED_DIRS = {'__pycache__', '.git', 'node_modules'}
+
+class _Inotify:
+    """基于ctypes的最小inotify封装，仅Linux可用"""
+
+    def __init__(self):
+        libc_name = ctypes.util.find_library('c') or 'libc.so.6'
+        self._libc = ctypes.CDLL(libc_name, use_errno=True)
+        self.fd = self._libc.inotify_init1(IN_NONBLOCK)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1失败")
+        self.watches: Dict[int, Path] = {} # wd -> 目录
+
+    def add_watch(self, path: Path) -> int:
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(str(path)), WATCH_MASK)
+        if wd < 0:
+            raise OSError(ctypes.get_errno(), f"inotify_add_watch失败: {path}")
+        self.watches[wd] = path
+        return wd
+
+    def read_events(self, timeout: float) -> List[Tuple[Path, str, int]]:
+        """等待最多timeout秒，返回 (目录, 文件名, 掩码) 列表"""
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return []
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+        events = []
+        offset = 0
+        while offset + EVENT_HEADER.size <= len(data):
+            wd, mask, _, name_len = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = data[offset:offset + name_len].rstrip(b'\0').decode('utf-8', errors='replace')
+            offset += name_len
+            directory = self.watches.get(wd)
+            if directory is not None:
+                events.append((directory, name, mask))
+        return events
+
+    def close(self):
+        try:
+            os.close(self.fd)
+        except OSError:
+            pass
+
+class ManifestWatcher:
+    """监听若干目录中匹配模式的文件，变化（防抖后）时调用on_change
+
+    roots为 (目录, glob模式) 列表，模式以"**/"开头时递归监听子目录。
+    优先使用inotify，不可用（非Linux或初始化失败）时退化为按mtime/大小轮询。
+    on_change只负责触发，具体哪些Agent变化由回调按内容哈希比对。
+    """
+
+    def __init__(self, on_change: Callable[[], None], roots: List[Tuple[str, str]],
+                 interval: float = 2.0, debounce: float = 0.3):
+        self.on_change = on_change
+        self.roots = [(Path(directory), pattern) for directory, pattern in roots]
+        self.interval = interval
+        self.debounce = debounce
+        self.mode: Optional[str] = None # 'inotify' 或 'polling'
+        self.reload_count = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    # --- 公共接口 ---
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="manifest-watcher", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 2.0):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
+
+    # --- 内部实现 ---
+    def _run(self):
+        inotify = None
+        if sys.platform.startswith('linux'):
+            try:
+                inotify = _Inotify()
+                for directory, pattern in self.roots:
+                    self._watch_tree(inotify, directory, pattern.startswith('**/'))
+            except Exception as e:
+                sys.stderr.write(f"inotify不可用，manifest热重载改用轮询: {e}\n")
+                if inotify:
+                    inotify.close()
+                inotify = None
+        try:
+            if inotify:
+                self.mode = 'inotify'
+                self._run_inotify(inotify)
+            else:
+                self.mode = 'polling'
+                self._run_polling()
+        finally:
+            if inotify:
+                inotify.close()
+
+    def _watch_tree(self, inotify: _Inotify, directory: Path, recursive: bool):
+        if not directory.is_dir():
+            return
+        inotify.add_watch(directory)
+        if recursive:
+            for root, dirs, _ in os.walk(directory):
+                dirs[:] = [d for d in dirs if d not in IGNORED_DIRS and not d.startswith('.')]
+                for d in dirs:
+                    inotify.add_watch(Path(root) / d)
+
+    def _matches(self, directory: Path, name: str) -> bool:
+        for root, pattern in self.roots:
+            basename_pattern = pattern.rsplit('/', 1)[-1]
+            if fnmatch.fnmatch(name, basename_pattern) and (directory == root or pattern.startswith('**/')):
+                return True
+        return False
+
+    def _run_inotify(self, inotify: _Inotify):
+        pending = False
+        while not self._stop.is_set():
+            events = inotify.read_events(self.debounce if pending else 1.0)
+            if not events:
+                if pending: # 防抖：事件平静debounce秒后才触发一次重载
+                    pending = False
+                    self._fire()
+                continue
+            for directory, name, mask in events:
+                if mask & IN_ISDIR:
+                    if mask & (IN_CREATE | IN_MOVED_TO) and name not in IGNORED_DIRS:
+                        try: # 新建子目录（如新增Agent目录）加入监听
+                            self._watch_tree(inotify, directory / name, True)
+                        except OSError:
+                            pass
+                        pending = True
+                elif self._matches(directory, name):
+                    pending = True
+
+    def _snapshot(self) -> Dict[str, Tuple[int, int]]:
+        signature = {}
+        for directory, pattern in self.roots:
+            for path in directory.glob(pattern):
+                try:
+                    stat = path.stat()
+                except OSError:
+                    continue
+                signature[str(path)] = (stat.st_mtime_ns, stat.st_size)
+        return signature
+
+    def _run_polling(self):
+        last = self._snapshot()
+        while not self._stop.wait(self.interval):
+            current = self._snapshot()
+            if current != last:
+                last = current
+                self._fire()
+
+    def _fire(self):
+        start = time.perf_counter()
+        try:
+            self.on_change()
+            self.reload_count += 1
+        except Exception as e:
+            sys.stderr.write(f"manifest热重载失败: {e}\n")
+            return
+        sys.stderr.write(f"manifest热重载检查完成，耗时 {(time.perf_counter() - start) * 1000:.0f}ms\n")
@@ -1,8 +1,8 @@
 import asyncio
 import logging
 import inspect
+import time
 from typing import Dict, Optional, List, Any, Callable, Awaitable, Generic, TypeVar, Union, cast
-from contextlib import AsyncExitStack
 import sys
 from pydantic import BaseModel, TypeAdapter
 from dataclasses import dataclass
@@ -11,11 +11,20 @@ from datetime import datetime
 import importlib,os,inspect # 自动注册相关
 from pathlib import Path
 
-from mcp import ClientSession, StdioServerParameters
-from mcp.client.stdio import stdio_client
-from mcpserver.mcp_registry import MCP_REGISTRY # MCP服务注册表
+from mcp import StdioServerParameters
+from mcpserver.mcp_registry import MCP_REGISTRY, MANIFEST_CACHE, add_reload_listener, bind_reload_loop # MCP服务注册表
+from mcpserver.mcp_session_pool import MCPSessionPool # 外部MCP服务会话池
+from mcpserver.tool_result_cache import ToolResultCache, canonical_args, file_stamp # 工具结果缓存
+from mcpserver.blocking_executor import BlockingCallExecutor # 阻塞型Agent线程池
+from mcpserver.circuit_breaker import CircuitBreaker # 工具熔断器
+from mcpserver.trace_logging import get_trace_logger, LazyPayload, payload_size # handoff追踪日志
 
 from config import DEBUG, LOG_LEVEL
+from config import MCP_SESSION_POOL_MIN_SIZE, MCP_SESSION_POOL_MAX_SIZE, MCP_SESSION_PING_INTERVAL, MCP_SESSION_IDLE_TIMEOUT, MCP_TOOLS_CACHE_TTL
+from config import MCP_RESULT_CACHE_ENABLED, MCP_RESULT_CACHE_TTL, MCP_RESULT_CACHE_SIZE
+from config import MCP_BLOCKING_POOL_WORKERS, MCP_BLOCKING_MAX_CONCURRENCY
+from config import HANDOFF_LOG_PAYLOAD_CHARS
+from config import MCP_TOOL_TIMEOUT, MCP_BREAKER_FAILURE_THRESHOLD, MCP_BREAKER_LATENCY_RATIO, MCP_BREAKER_RESET_TIMEOUT
 
 # 配置日志
 logging.basicConfig(
@@ -23,6 +32,7 @@ logging.basicConfig(
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
 )
 logger = logging.getLogger("MCPManager")
+handoff_logger = get_trace_logger("MCPManager.handoff") # 经队列异步写出，级别跟随根日志器
 
 # 屏蔽HTTP库的DEBUG日志
 logging.getLogger("httpcore.http11").setLevel(logging.WARNING)
@@ -123,18 +133,44 @@ class Handoff(Generic[TContext]):
                 raise
             raise HandoffError(f"Handoff执行失败: {str(e)}")
 
+_NOT_HANDLED = object() # Agent实例没有可调用入口
+
+def _is_error_result(result: Any) -> bool:
+    """调用失败的结果（不缓存，计为熔断失败）：None、"调用失败"文本或status为error的JSON"""
+    if result is None:
+        return True
+    if getattr(result, 'isError', False): # MCP CallToolResult
+        return True
+    if isinstance(result, str):
+        if result.startswith("调用失败"):
+            return True
+        try:
+            data = json.loads(result)
+        except ValueError:
+            return False
+        return isinstance(data, dict) and data.get("status") == "error"
+    return isinstance(result, dict) and result.get("status") == "error"
+
 class MCPManager:
     """MCP服务管理器，负责管理所有MCP服务的连接和调用"""
     
     def __init__(self):
         """初始化MCP管理器"""
-        self.services = {}
-        self.tools_cache = {}
-        self.exit_stack = AsyncExitStack()
+        self.services = {} # handoff服务配置
+        self.tools_cache: Dict[str, Dict[str, Any]] = {} # 服务名 -> {"tools": 实时工具列表, "fetched_at": 获取时间}
+        self.tools_ttl = MCP_TOOLS_CACHE_TTL
+        self._tools_refreshing = set()
+        self.result_cache = ToolResultCache(MCP_RESULT_CACHE_SIZE) if MCP_RESULT_CACHE_ENABLED else None
+        self.tool_call_stats: Dict[str, Dict[str, Any]] = {} # "服务.工具" -> 调用次数/缓存命中/错误/耗时
+        self.blocking_executor = BlockingCallExecutor(MCP_BLOCKING_POOL_WORKERS, MCP_BLOCKING_MAX_CONCURRENCY)
+        self.breakers: Dict[tuple, CircuitBreaker] = {} # (服务, 工具) -> 熔断器
+        self.session_pools: Dict[str, MCPSessionPool] = {} # 外部stdio MCP服务会话池，与handoff配置分开存放
+        self._pool_lock = asyncio.Lock()
         self.handoffs = {} # 服务对应的handoff对象
         self.handoff_filters = {} # 服务对应的handoff过滤器
         self.handoff_callbacks = {} # 服务对应的handoff回调
         self.logger = logging.getLogger("MCPManager")
+        add_reload_listener(self._on_manifests_reloaded) # manifest变化后清理对应服务的缓存、熔断器和会话池
         sys.stderr.write("MCPManager初始化\n")
         
 
@@ -180,26 +216,18 @@ class MCPManager:
         metadata: Optional[Dict[str, Any]] = None
     ) -> str:
         """执行handoff"""
+        start = time.perf_counter()
         try:
-            # 通知handoff调用开始
-            
-            # 修复中文编码问题
-            task_json = json.dumps(task, ensure_ascii=False)
-            sys.stderr.write(f"执行handoff: service={service_name}, task={task_json}\n".encode('utf-8', errors='replace').decode('utf-8'))
+            if handoff_logger.isEnabledFor(logging.DEBUG):
+                handoff_logger.debug("执行handoff: service=%s, task=%s", service_name, LazyPayload(task, HANDOFF_LOG_PAYLOAD_CHARS))
             
             if service_name not in self.services:
                 raise ValueError(f"未注册的服务: {service_name}")
                 
             service = self.services[service_name]
-            # 只打印服务配置中的安全字段
-            safe_service_info = {
-                "name": service.get("name", ""),
-                "description": service.get("description", ""),
-                "agent_name": service.get("agent_name", ""),
-                "strict_schema": service.get("strict_schema", False)
-            }
-            safe_info_json = json.dumps(safe_service_info, ensure_ascii=False)
-            sys.stderr.write(f"找到服务配置: {safe_info_json}\n".encode('utf-8', errors='replace').decode('utf-8'))
+            # 只记录服务配置中的安全字段
+            handoff_logger.debug("找到服务配置: agent_name=%s, strict_schema=%s",
+                                 service.get("agent_name", ""), service.get("strict_schema", False))
             
             # 简单验证必需字段
             if service["strict_schema"]:
@@ -213,116 +241,181 @@ class MCPManager:
                 try:
                     task["messages"] = service["filter_fn"](task["messages"])
                 except Exception as e:
-                    sys.stderr.write(f"消息过滤失败: {e}\n".encode('utf-8', errors='replace').decode('utf-8'))
+                    handoff_logger.warning("消息过滤失败: %s", e)
                     # 继续执行，使用原始消息
                 
             # 创建代理实例
             from mcpserver.mcp_registry import MCP_REGISTRY # 统一注册中心
             agent_name = service["agent_name"]
-            agent = MCP_REGISTRY.get(agent_name)
+            agent = await MCP_REGISTRY.get_async(agent_name)
             if not agent:
                 raise ValueError(f"找不到已注册的Agent实例: {agent_name}")
-            sys.stderr.write(f"使用注册中心中的Agent实例: {agent_name}\n".encode('utf-8', errors='replace').decode('utf-8'))
             # 执行handoff
-            sys.stderr.write("开始执行代理handoff\n".encode('utf-8', errors='replace').decode('utf-8'))
             result = await agent.handle_handoff(task)
-            sys.stderr.write(f"代理handoff执行结果: {result}\n".encode('utf-8', errors='replace').decode('utf-8'))
-            
-            # 通知handoff调用成功
+            handoff_logger.info("handoff完成: service=%s, agent=%s, 耗时%.0fms, 结果长度=%s",
+                                service_name, agent_name, (time.perf_counter() - start) * 1000, payload_size(result))
+            handoff_logger.debug("handoff结果: %s", LazyPayload(result, HANDOFF_LOG_PAYLOAD_CHARS))
             
             return result
             
         except Exception as e:
             error_msg = f"Handoff执行失败: {str(e)}"
-            sys.stderr.write(f"{error_msg}\n".encode('utf-8', errors='replace').decode('utf-8'))
-            import traceback
-            traceback.print_exc(file=sys.stderr)
-            
-            # 通知handoff调用失败
+            handoff_logger.error("%s (service=%s, 耗时%.0fms)", error_msg, service_name,
+                                 (time.perf_counter() - start) * 1000,
+                                 exc_info=handoff_logger.isEnabledFor(logging.DEBUG))
             
             return json.dumps({
                 "status": "error",
                 "message": error_msg
             }, ensure_ascii=False)
             
-    async def connect_service(self, service_name: str) -> Optional[ClientSession]:
-        """连接到指定的MCP服务
+    def _server_params(self, service_name: str) -> Optional[StdioServerParameters]:
+        """从manifest读取外部stdio MCP服务的启动参数
+        
+        支持 "mcpServer": {"command": ..., "args": [...], "env": {...}}，
+        以及旧格式 "type": "python"/"node" + "script_path"
+        """
+        manifest = MANIFEST_CACHE.get(service_name) or {}
+        server = manifest.get('mcpServer')
+        if isinstance(server, dict) and server.get('command'):
+            return StdioServerParameters(
+                command=server['command'],
+                args=list(server.get('args', [])),
+                env=server.get('env')
+            )
+        if manifest.get('script_path'):
+            command = "python" if manifest.get('type', 'python') == "python" else "node"
+            return StdioServerParameters(command=command, args=[manifest['script_path']], env=None)
+        return None
+    
+    async def connect_service(self, service_name: str) -> Optional[MCPSessionPool]:
+        """连接到指定的外部MCP服务
         
         Args:
             service_name: MCP服务名称
             
         Returns:
-            Optional[ClientSession]: 成功返回会话对象，失败返回None
+            Optional[MCPSessionPool]: 成功返回该服务的会话池，失败返回None
         """
-        # 直接返回None，或根据MCP_REGISTRY判断服务是否存在
-        if service_name not in MCP_REGISTRY:
-            logger.warning(f"MCP服务 {service_name} 不存在")
-            return None
-            
-        # 如果已连接，直接返回会话
-        if service_name in self.services:
-            return self.services[service_name]
-            
-        service_config = MCP_REGISTRY[service_name]
-        command = "python" if service_config["type"] == "python" else "node"
-        
-        try:
-            logger.info(f"正在连接MCP服务: {service_name}")
-            server_params = StdioServerParameters(
-                command=command,
-                args=[service_config["script_path"]],
-                env=None
-            )
-            
-            # 创建服务连接
-            stdio_transport = await self.exit_stack.enter_async_context(
-                stdio_client(server_params)
-            )
-            stdio, write = stdio_transport
-            
-            # 创建并初始化会话
-            session = await self.exit_stack.enter_async_context(
-                ClientSession(stdio, write)
-            )
-            await session.initialize()
-            
-            # 缓存会话
-            self.services[service_name] = session
-            logger.info(f"MCP服务 {service_name} 连接成功")
-            return session
+        pool = self.session_pools.get(service_name)
+        if pool is not None:
+            return pool
             
-        except Exception as e:
-            logger.error(f"连接MCP服务 {service_name} 失败: {str(e)}")
-            import traceback;traceback.print_exc(file=sys.stderr)
+        server_params = self._server_params(service_name)
+        if server_params is None:
+            logger.warning(f"MCP服务 {service_name} 不存在或未配置stdio启动参数")
             return None
+        
+        async with self._pool_lock:
+            pool = self.session_pools.get(service_name)
+            if pool is not None:
+                return pool
+            server = (MANIFEST_CACHE.get(service_name) or {}).get('mcpServer') or {}
+            try:
+                logger.info(f"正在连接MCP服务: {service_name}")
+                pool = MCPSessionPool(
+                    service_name,
+                    server_params,
+                    min_size=server.get('minSessions', MCP_SESSION_POOL_MIN_SIZE),
+                    max_size=server.get('maxSessions', MCP_SESSION_POOL_MAX_SIZE),
+                    ping_interval=MCP_SESSION_PING_INTERVAL,
+                    idle_timeout=MCP_SESSION_IDLE_TIMEOUT,
+                    on_reconnect=lambda: self.invalidate_tools(service_name) # 子进程重建后工具列表可能变化
+                )
+                await pool.start()
+                self.session_pools[service_name] = pool
+                logger.info(f"MCP服务 {service_name} 连接成功")
+                return pool
+                
+            except Exception as e:
+                logger.error(f"连接MCP服务 {service_name} 失败: {str(e)}")
+                import traceback;traceback.print_exc(file=sys.stderr)
+                return None
             
-    async def get_service_tools(self, service_name: str) -> list:
-        """获取指定MCP服务的可用工具列表
+    async def fetch_service_tools(self, service_name: str, force: bool = False) -> List[Dict[str, Any]]:
+        """通过MCP会话实时获取工具列表并写入缓存（未过期且非force时直接返回缓存）
         
         Args:
             service_name: MCP服务名称
+            force: 是否忽略缓存强制刷新
             
         Returns:
-            list: 工具列表
+            List[Dict[str, Any]]: 工具列表，失败时退回manifest声明的工具
         """
-        # 检查缓存
-        if service_name in self.tools_cache:
-            return self.tools_cache[service_name]
+        entry = self.tools_cache.get(service_name)
+        if entry and not force and time.monotonic() - entry["fetched_at"] < self.tools_ttl:
+            return entry["tools"]
             
-        session = await self.connect_service(service_name)
-        if not session:
-            return []
+        pool = await self.connect_service(service_name)
+        if not pool:
+            return self._manifest_tools(service_name)
             
         try:
-            response = await session.list_tools()
-            tools = response.tools
+            response = await pool.list_tools()
+            tools = [
+                {
+                    "name": tool.name,
+                    "description": tool.description or "",
+                    "input_schema": tool.inputSchema or {}
+                }
+                for tool in response.tools
+            ]
             # 缓存工具列表
-            self.tools_cache[service_name] = tools
+            self.tools_cache[service_name] = {"tools": tools, "fetched_at": time.monotonic()}
             return tools
         except Exception as e:
             logger.error(f"获取服务 {service_name} 的工具列表失败: {str(e)}")
             import traceback;traceback.print_exc(file=sys.stderr)
-            return []
+            return entry["tools"] if entry else self._manifest_tools(service_name)
+    
+    def _manifest_tools(self, service_name: str) -> List[Dict[str, Any]]:
+        from mcpserver.mcp_registry import get_available_tools # 服务目录索引
+        return get_available_tools(service_name)
+    
+    def _schedule_tools_refresh(self, service_name: str):
+        """在后台刷新工具列表，不阻塞调用方；没有运行中的事件循环时跳过"""
+        if service_name in self._tools_refreshing:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        self._tools_refreshing.add(service_name)
+        
+        async def refresh():
+            try:
+                await self.fetch_service_tools(service_name, force=True)
+            finally:
+                self._tools_refreshing.discard(service_name)
+        
+        loop.create_task(refresh())
+    
+    def _on_manifests_reloaded(self, changes: Dict[str, List[str]]):
+        """manifest热重载回调（在服务事件循环中执行）：变化和删除的服务丢弃旧状态"""
+        for name in changes.get("updated", []) + changes.get("removed", []):
+            self.invalidate_service(name)
+    
+    def invalidate_service(self, service_name: str):
+        """丢弃服务的工具列表缓存、结果缓存、熔断器和会话池，下次调用按新manifest重建"""
+        self.tools_cache.pop(service_name, None)
+        if self.result_cache is not None:
+            self.result_cache.invalidate(service_name)
+        for key in [key for key in self.breakers if key[0] == service_name]:
+            del self.breakers[key]
+        pool = self.session_pools.pop(service_name, None)
+        if pool is not None:
+            try:
+                asyncio.get_running_loop().create_task(pool.close())
+            except RuntimeError: # 没有运行中的事件循环，会话池随进程退出
+                pass
+        logger.info(f"服务 {service_name} 的manifest已变化，已清理缓存状态")
+    
+    def invalidate_tools(self, service_name: Optional[str] = None):
+        """使工具列表缓存失效（服务重连、manifest变化时调用），不传service_name则全部失效"""
+        if service_name is None:
+            self.tools_cache.clear()
+        else:
+            self.tools_cache.pop(service_name, None)
             
     async def call_service_tool(self, service_name: str, tool_name: str, args: dict):
         """调用指定MCP服务的工具
@@ -335,13 +428,13 @@ class MCPManager:
         Returns:
             工具调用结果
         """
-        session = await self.connect_service(service_name)
-        if not session:
+        pool = await self.connect_service(service_name)
+        if not pool:
             return None
             
         try:
             logger.debug(f"调用工具: {service_name}.{tool_name} 参数: {args}")
-            result = await session.call_tool(tool_name, args)
+            result = await pool.call_tool(tool_name, args)
             logger.debug(f"工具调用结果: {result}")
             return result
         except Exception as e:
@@ -352,6 +445,11 @@ class MCPManager:
     async def unified_call(self, service_name: str, tool_name: str, args: dict):
         """统一调用接口，支持MCP服务和Agent服务
         
+        工具别名先按manifest的aliases解析为规范工具名，缓存、超时、熔断和统计都按规范名计算。
+        manifest中声明cacheable的工具按 (服务, 工具, 规范化参数) 缓存结果，
+        fileArgs指定的文件变化后缓存失效；声明mutating的工具调用前清除该服务的缓存结果。
+        每个 (服务, 工具) 按manifest的timeout设置调用期限，连续失败或p95延迟过高时熔断，熔断期间直接返回失败
+        
         Args:
             service_name: 服务名称
             tool_name: 工具名称
@@ -360,28 +458,152 @@ class MCPManager:
         Returns:
             调用结果
         """
+        start = time.perf_counter()
+        bind_reload_loop(asyncio.get_running_loop()) # manifest热重载切到本循环中应用
+        from mcpserver.mcp_registry import resolve_tool_name, get_cache_policy, is_mutating_tool, get_tool_timeout # 服务目录索引
+        canonical_name = resolve_tool_name(service_name, tool_name) # 调度仍使用调用方给出的名称
+        stats = self.tool_call_stats.setdefault(
+            f"{service_name}.{canonical_name}", {"calls": 0, "cache_hits": 0, "errors": 0, "rejected": 0, "total_ms": 0.0}
+        )
+        stats["calls"] += 1
+        
+        policy = None
+        if self.result_cache is not None:
+            policy = get_cache_policy(service_name, canonical_name)
+            if policy is not None:
+                # 参数里的tool_name可能是别名，已由canonical_name体现，不参与缓存键
+                key = (service_name, canonical_name, canonical_args(args, [*policy["ignore_args"], "tool_name"]))
+                stamp = file_stamp(args, policy["file_args"])
+                hit, result = self.result_cache.get(key, stamp)
+                if hit:
+                    stats["cache_hits"] += 1
+                    logger.info(f"工具结果缓存命中: {service_name}.{canonical_name}")
+                    return result
+            elif is_mutating_tool(service_name, canonical_name):
+                self.result_cache.invalidate(service_name)
+        
+        timeout = get_tool_timeout(service_name, canonical_name) or MCP_TOOL_TIMEOUT
+        breaker = self._get_breaker(service_name, canonical_name, timeout)
+        if not breaker.allow():
+            stats["rejected"] += 1
+            return (f"调用失败: 工具 {service_name}.{tool_name} 暂时不可用（{breaker.open_reason}），"
+                    f"请约{breaker.retry_after():.0f}秒后再试或改用其它方式")
+        
         try:
-            # 首先尝试作为handoff服务调用
-            if service_name in self.services:
-                return await self.handoff(service_name, args)
-            
-            # 然后尝试作为MCP服务调用
-            if service_name in MCP_REGISTRY:
-                agent = MCP_REGISTRY[service_name]
-                if hasattr(agent, 'handle_handoff'):
-                    return await agent.handle_handoff(args)
-                elif hasattr(agent, tool_name):
-                    method = getattr(agent, tool_name)
-                    if callable(method):
-                        return await method(**args) if asyncio.iscoroutinefunction(method) else method(**args)
-            
-            # 最后尝试作为传统MCP服务调用
-            return await self.call_service_tool(service_name, tool_name, args)
-            
+            result = await asyncio.wait_for(self._dispatch_call(service_name, tool_name, args), timeout)
+        except asyncio.TimeoutError:
+            stats["errors"] += 1
+            breaker.record_failure(timeout=True)
+            logger.error(f"统一调用超时 {service_name}.{tool_name}: {timeout:g}秒")
+            return f"调用失败: 工具 {service_name}.{tool_name} 超时（{timeout:g}秒）"
         except Exception as e:
+            stats["errors"] += 1
+            breaker.record_failure()
             logger.error(f"统一调用失败 {service_name}.{tool_name}: {str(e)}")
             import traceback;traceback.print_exc(file=sys.stderr)
             return f"调用失败: {str(e)}"
+        finally:
+            stats["total_ms"] += (time.perf_counter() - start) * 1000
+        
+        if _is_error_result(result):
+            breaker.record_failure()
+        else:
+            breaker.record_success((time.perf_counter() - start) * 1000)
+        
+        if policy is not None and not _is_error_result(result):
+            ttl = policy["ttl"] if policy["ttl"] is not None else MCP_RESULT_CACHE_TTL
+            self.result_cache.put(key, result, ttl, stamp)
+        return result
+    
+    async def _dispatch_call(self, service_name: str, tool_name: str, args: dict):
+        # 首先尝试作为handoff服务调用
+        if service_name in self.services:
+            return await self.handoff(service_name, args)
+        
+        # 外部stdio MCP服务走会话池，可并发调用
+        if service_name in self.session_pools or self._server_params(service_name) is not None:
+            return await self.call_service_tool(service_name, tool_name, args)
+        
+        # 然后尝试作为MCP服务调用
+        if service_name in MCP_REGISTRY:
+            from mcpserver.mcp_registry import get_execution_policy # 服务执行策略
+            policy = get_execution_policy(service_name)
+            if policy["blocking"]:
+                # 阻塞型Agent：实例创建和调用都放到专用线程池，避免卡住事件循环
+                return await self.blocking_executor.run(
+                    service_name,
+                    lambda: self._invoke_agent(MCP_REGISTRY[service_name], tool_name, args),
+                    policy["max_concurrency"]
+                )
+            agent = MCP_REGISTRY.peek(service_name)
+            if agent is None: # 首次使用时在线程池中创建实例，构造函数可能有网络请求
+                agent = await asyncio.get_running_loop().run_in_executor(None, MCP_REGISTRY.__getitem__, service_name)
+            result = self._invoke_agent(agent, tool_name, args)
+            if result is not _NOT_HANDLED:
+                return await result if inspect.isawaitable(result) else result
+        
+        # 最后尝试作为传统MCP服务调用
+        return await self.call_service_tool(service_name, tool_name, args)
+    
+    @staticmethod
+    def _invoke_agent(agent: Any, tool_name: str, args: dict) -> Any:
+        """调用Agent实例的handle_handoff或同名方法，返回结果或协程；无可调用入口时返回_NOT_HANDLED"""
+        if hasattr(agent, 'handle_handoff'):
+            return agent.handle_handoff(args)
+        method = getattr(agent, tool_name, None)
+        if callable(method):
+            return method(**args)
+        return _NOT_HANDLED
+    
+    def _get_breaker(self, service_name: str, tool_name: str, timeout: float) -> CircuitBreaker:
+        breaker = self.breakers.get((service_name, tool_name))
+        if breaker is None:
+            breaker = CircuitBreaker(
+                failure_threshold=MCP_BREAKER_FAILURE_THRESHOLD,
+                latency_threshold_ms=timeout * 1000 * MCP_BREAKER_LATENCY_RATIO,
+                reset_timeout=MCP_BREAKER_RESET_TIMEOUT
+            )
+            self.breakers[(service_name, tool_name)] = breaker
+        return breaker
+    
+    def get_unavailable_tools(self) -> Dict[str, set]:
+        """熔断中的工具：服务名 -> 工具名集合"""
+        unavailable: Dict[str, set] = {}
+        for (service_name, tool_name), breaker in self.breakers.items():
+            if not breaker.available:
+                unavailable.setdefault(service_name, set()).add(tool_name)
+        return unavailable
+    
+    def _hide_unavailable_tools(self, services: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """从服务摘要中去掉熔断中的工具，工具全部熔断的服务整体隐藏（不修改共享的目录摘要）"""
+        unavailable = self.get_unavailable_tools()
+        if not unavailable:
+            return list(services)
+        visible = []
+        for service in services:
+            blocked = unavailable.get(service.get("name"))
+            if not blocked:
+                visible.append(service)
+                continue
+            tools = service.get("available_tools", [])
+            remaining = [tool for tool in tools if tool.get("name") not in blocked]
+            if tools and not remaining:
+                continue
+            visible.append(dict(service, available_tools=remaining, unavailable_tools=sorted(blocked)))
+        return visible
+    
+    def get_breaker_states(self) -> Dict[str, Dict[str, Any]]:
+        """各工具熔断器状态，键为 服务.工具"""
+        return {f"{service}.{tool}": breaker.snapshot() for (service, tool), breaker in self.breakers.items()}
+    
+    def get_tool_call_stats(self) -> Dict[str, Any]:
+        """获取工具调用统计（含结果缓存命中情况）"""
+        return {
+            "tools": {name: dict(stats) for name, stats in self.tool_call_stats.items()},
+            "result_cache": self.result_cache.get_stats() if self.result_cache is not None else None,
+            "blocking_pool": self.blocking_executor.get_stats(),
+            "breakers": self.get_breaker_states()
+        }
             
     def get_available_services(self) -> list:
         """获取所有可用的MCP服务列表
@@ -389,20 +611,8 @@ class MCPManager:
         Returns:
             list: 可用服务列表
         """
-        from mcpserver.mcp_registry import get_all_services_info # 动态服务池查询
-        services_info = get_all_services_info()
-        
-        return [
-            {
-                "name": name,
-                "description": info.get('description', ''),
-                "display_name": info.get('display_name', name),
-                "version": info.get('version', '1.0.0'),
-                "available_tools": info.get('available_tools', []),
-                "id": name
-            }
-            for name, info in services_info.items()
-        ]
+        from mcpserver.mcp_registry import get_service_summaries # 服务目录索引
+        return self._hide_unavailable_tools(get_service_summaries())
             
     def get_available_services_filtered(self) -> dict:
         """获取过滤后的服务列表，分为MCP服务和Agent服务
@@ -410,25 +620,12 @@ class MCPManager:
         Returns:
             dict: 包含mcp_services和agent_services的服务列表
         """
-        from mcpserver.mcp_registry import get_all_services_info, get_service_statistics # 动态服务池查询
+        from mcpserver.mcp_registry import get_service_summaries # 服务目录索引
         
-        mcp_services = []
+        # 动态服务池中的服务都是MCP类型，摘要在每个注册表代次只构建一次；熔断中的工具不展示给模型
+        mcp_services = self._hide_unavailable_tools(get_service_summaries())
         agent_services = []
         
-        # 从动态服务池获取所有已注册的MCP服务信息
-        services_info = get_all_services_info()
-        for name, info in services_info.items():
-            service_info = {
-                "name": name,
-                "description": info.get('description', ''),
-                "display_name": info.get('display_name', name),
-                "version": info.get('version', '1.0.0'),
-                "available_tools": info.get('available_tools', []),
-                "id": name
-            }
-            # 动态服务池中的服务都是MCP类型，归类为mcp_services
-            mcp_services.append(service_info)
-        
         # 从handoff服务中获取Agent服务信息（这些是handoff配置）
         for service_name, service_config in self.services.items():
             agent_service_info = {
@@ -454,7 +651,7 @@ class MCPManager:
         Returns:
             Optional[Dict[str, Any]]: 服务详细信息
         """
-        from mcpserver.mcp_registry import get_service_info # 动态服务池查询
+        from mcpserver.mcp_registry import get_service_info # 服务目录索引
         return get_service_info(service_name)
     
     def query_services_by_capability(self, capability: str) -> List[Dict[str, Any]]:
@@ -466,13 +663,12 @@ class MCPManager:
         Returns:
             List[Dict[str, Any]]: 匹配的服务列表
         """
-        from mcpserver.mcp_registry import query_services_by_capability, get_service_info # 动态服务池查询
+        from mcpserver.mcp_registry import query_services_by_capability, get_catalog # 服务目录索引
         
-        matching_service_names = query_services_by_capability(capability)
+        catalog = get_catalog()
         matching_services = []
-        
-        for service_name in matching_service_names:
-            service_info = get_service_info(service_name)
+        for service_name in query_services_by_capability(capability):
+            service_info = catalog.services.get(service_name)
             if service_info:
                 matching_services.append({
                     "name": service_name,
@@ -491,10 +687,13 @@ class MCPManager:
             Dict[str, Any]: 统计信息
         """
         from mcpserver.mcp_registry import get_service_statistics # 动态服务池查询
-        return get_service_statistics()
+        return dict(get_service_statistics(), tool_calls=self.get_tool_call_stats())
     
     def get_service_tools(self, service_name: str) -> List[Dict[str, Any]]:
-        """获取指定服务的可用工具列表
+        """获取指定服务的可用工具列表，不等待MCP往返
+        
+        外部stdio MCP服务返回实时列表缓存，缓存缺失或过期时在后台刷新，
+        刷新完成前返回旧缓存或manifest声明的工具；其它服务直接返回manifest声明的工具
         
         Args:
             service_name: 服务名称
@@ -502,8 +701,14 @@ class MCPManager:
         Returns:
             List[Dict[str, Any]]: 工具列表
         """
-        from mcpserver.mcp_registry import get_available_tools # 动态服务池查询
-        return get_available_tools(service_name)
+        if service_name not in self.session_pools and self._server_params(service_name) is None:
+            return self._manifest_tools(service_name)
+        entry = self.tools_cache.get(service_name)
+        if entry is None or time.monotonic() - entry["fetched_at"] >= self.tools_ttl:
+            self._schedule_tools_refresh(service_name)
+        if entry is not None:
+            return entry["tools"]
+        return self._manifest_tools(service_name)
             
     def format_available_services(self) -> str:
         """格式化可用服务列表为字符串
@@ -511,14 +716,21 @@ class MCPManager:
         Returns:
             str: 格式化后的服务列表字符串
         """
-        from mcpserver.mcp_registry import get_all_services_info # 动态服务池查询
+        from mcpserver.mcp_registry import get_service_summaries # 服务目录索引
         
-        services_info = get_all_services_info()
         formatted_services = []
         
-        for name, info in services_info.items():
+        unavailable = self.get_unavailable_tools()
+        for info in get_service_summaries():
+            name = info['name']
             description = info.get('description', '')
-            tools = info.get('available_tools', [])
+            tools = self.get_service_tools(name)
+            blocked = unavailable.get(name)
+            if blocked:
+                remaining = [tool for tool in tools if tool.get('name') not in blocked]
+                if tools and not remaining:
+                    continue
+                tools = remaining
             tool_names = [tool.get('name', '') for tool in tools]
             
             if description:
@@ -534,13 +746,21 @@ class MCPManager:
         """清理所有MCP服务连接"""
         logger.info("正在清理MCP服务连接...")
         try:
-            await self.exit_stack.aclose()
+            pools, self.session_pools = self.session_pools, {}
+            await asyncio.gather(*(pool.close() for pool in pools.values()), return_exceptions=True)
             self.services.clear();self.tools_cache.clear()
+            if self.result_cache is not None:
+                self.result_cache.invalidate()
+            self.blocking_executor.shutdown()
             logger.info("MCP服务连接清理完成")
         except Exception as e:
             logger.error(f"清理MCP服务连接时出错: {str(e)}")
             import traceback;traceback.print_exc(file=sys.stderr)
 
+    def get_session_pool_stats(self) -> Dict[str, Dict[str, Any]]:
+        """获取各外部MCP服务会话池的统计信息"""
+        return {name: pool.get_stats() for name, pool in self.session_pools.items()}
+
     def get_mcp(self, name): return MCP_REGISTRY.get(name) # 获取MCP服务
     def list_mcps(self): return list(MCP_REGISTRY.keys()) # 列出所有MCP服务 
 
@@ -1,13 +1,130 @@
 # mcp_registry.py # 动态扫描JSON元数据文件注册MCP服务
+import asyncio
+import hashlib
 import json
 import os
 import importlib
 import inspect
+import threading
+import time
+from collections.abc import MutableMapping
+from concurrent.futures import ThreadPoolExecutor, Future
+import concurrent.futures
 from pathlib import Path
 import sys
-from typing import Dict, Any, Optional, List
+from typing import Callable, Dict, Any, Optional, List
 
-MCP_REGISTRY = {} # 全局MCP服务池
+MANIFEST_DISK_CACHE = Path(__file__).parent / '.manifest_cache.json' # manifest磁盘缓存，按mtime失效
+
+class AgentCreationError(KeyError):
+    """agent实例创建失败；继承KeyError以保持MCP_REGISTRY.get()返回None的旧行为"""
+
+    def __str__(self):
+        return str(self.args[0]) if self.args else ""
+
+class LazyAgentRegistry(MutableMapping):
+    """MCP服务池：注册时只记录manifest，首次访问时才创建agent实例"""
+
+    def __init__(self):
+        self._manifests: Dict[str, Dict[str, Any]] = {} # 服务名 -> manifest
+        self._instances: Dict[str, Any] = {} # 服务名 -> 已创建的实例
+        self._lock = threading.Lock()
+        self._name_locks: Dict[str, threading.Lock] = {}
+        self.creation_errors: Dict[str, str] = {} # 服务名 -> 最近一次实例创建失败原因，下次访问时重试
+        self.generation = 0 # 服务增删时递增，用于使服务目录和提示词缓存失效
+
+    def register(self, name: str, manifest: Dict[str, Any]):
+        """登记服务，不创建实例"""
+        with self._lock:
+            self._manifests[name] = manifest
+            self._instances.pop(name, None)
+            self.generation += 1
+
+    def _name_lock(self, name: str) -> threading.Lock:
+        with self._lock:
+            return self._name_locks.setdefault(name, threading.Lock())
+
+    def __getitem__(self, name: str) -> Any:
+        instance = self._instances.get(name)
+        if instance is not None:
+            return instance
+        if name not in self._manifests:
+            raise KeyError(name)
+        with self._name_lock(name): # 同一服务只创建一次，不同服务可并发创建
+            instance = self._instances.get(name)
+            if instance is None:
+                manifest = self._manifests.get(name)
+                if manifest is None:
+                    raise KeyError(name)
+                start = time.perf_counter()
+                try:
+                    instance = _create_agent_instance(manifest)
+                except Exception as e: # 保留manifest只记录错误，下次访问时重试
+                    self.creation_errors[name] = str(e)
+                    sys.stderr.write(f"创建agent实例失败 {name}: {e}\n")
+                    raise AgentCreationError(f"创建agent实例失败 {name}: {e}") from e
+                self.creation_errors.pop(name, None)
+                self._instances[name] = instance
+                sys.stderr.write(f"✅ 已创建MCP Agent实例: {name} ({(time.perf_counter() - start) * 1000:.0f}ms)\n")
+        return instance
+
+    def __setitem__(self, name: str, instance: Any):
+        with self._lock:
+            self._instances[name] = instance
+            if name not in self._manifests:
+                self._manifests[name] = MANIFEST_CACHE.get(name, {})
+                self.generation += 1
+
+    def __delitem__(self, name: str):
+        with self._lock:
+            if name not in self._manifests and name not in self._instances:
+                raise KeyError(name)
+            self._manifests.pop(name, None)
+            self._instances.pop(name, None)
+            self.generation += 1
+
+    def __contains__(self, name: object) -> bool:
+        return name in self._manifests or name in self._instances
+
+    def __iter__(self):
+        return iter(list(self._manifests))
+
+    def __len__(self) -> int:
+        return len(self._manifests)
+
+    def bump_generation(self):
+        """登记内容未变但依赖注册表的缓存需失效时调用（如Agent类型manifest变化）"""
+        with self._lock:
+            self.generation += 1
+
+    async def get_async(self, name: str, default: Any = None) -> Any:
+        """获取实例，未创建时在线程池中创建（部分Agent的构造函数有网络请求），不阻塞事件循环"""
+        instance = self._instances.get(name)
+        if instance is not None:
+            return instance
+        try:
+            return await asyncio.get_running_loop().run_in_executor(None, self.__getitem__, name)
+        except KeyError:
+            return default
+
+    def peek(self, name: str) -> Optional[Any]:
+        """返回已创建的实例，不触发创建"""
+        return self._instances.get(name)
+
+    def is_instantiated(self, name: str) -> bool:
+        return name in self._instances
+
+    def warm_up(self, names: Optional[List[str]] = None, max_workers: int = 4) -> List[Future]:
+        """在后台线程池中预创建实例，返回Future列表"""
+        names = [n for n in (names or list(self._manifests)) if n not in self._instances]
+        if not names:
+            return []
+        executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="mcp-warmup")
+        futures = [executor.submit(self.get, name) for name in names]
+        executor.shutdown(wait=False)
+        return futures
+
+MCP_REGISTRY = LazyAgentRegistry() # 全局MCP服务池
 MANIFEST_CACHE = {} # 缓存manifest信息
 
 def load_manifest_file(manifest_path: Path) -> Optional[Dict[str, Any]]:
@@ -19,94 +136,430 @@ def load_manifest_file(manifest_path: Path) -> Optional[Dict[str, Any]]:
         sys.stderr.write(f"加载manifest文件失败 {manifest_path}: {e}\n")
         return None
 
+def _load_disk_cache() -> Dict[str, Any]:
+    try:
+        with open(MANIFEST_DISK_CACHE, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except Exception:
+        return {}
+
+def _save_disk_cache(cache: Dict[str, Any]):
+    try:
+        tmp_path = MANIFEST_DISK_CACHE.with_suffix('.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(cache, f, ensure_ascii=False)
+        os.replace(tmp_path, MANIFEST_DISK_CACHE)
+    except Exception as e:
+        sys.stderr.write(f"写入manifest缓存失败: {e}\n")
+
+def load_manifests_cached(manifest_files: List[Path]) -> Dict[Path, Dict[str, Any]]:
+    """批量加载manifest，mtime和大小未变化的文件直接使用磁盘缓存"""
+    cache = _load_disk_cache()
+    new_cache = {}
+    manifests = {}
+    for manifest_file in manifest_files:
+        key = str(manifest_file.resolve())
+        try:
+            stat = manifest_file.stat()
+        except OSError:
+            continue
+        entry = cache.get(key)
+        if entry and entry.get('mtime_ns') == stat.st_mtime_ns and entry.get('size') == stat.st_size:
+            manifest = entry.get('manifest')
+        else:
+            manifest = load_manifest_file(manifest_file)
+        if manifest:
+            manifests[manifest_file] = manifest
+            new_cache[key] = {'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size, 'manifest': manifest}
+    if new_cache != cache:
+        _save_disk_cache(new_cache)
+    return manifests
+
+def _create_agent_instance(manifest: Dict[str, Any]) -> Any:
+    """根据manifest创建agent实例，失败时抛出异常"""
+    entry_point = manifest.get('entryPoint', {})
+    module_name = entry_point.get('module')
+    class_name = entry_point.get('class')
+    
+    if not module_name or not class_name:
+        raise ValueError(f"manifest缺少entryPoint信息: {manifest.get('name', 'unknown')}")
+        
+    # 动态导入模块
+    module = importlib.import_module(module_name)
+    agent_class = getattr(module, class_name)
+    
+    # 创建实例
+    return agent_class()
+
 def create_agent_instance(manifest: Dict[str, Any]) -> Optional[Any]:
     """根据manifest创建agent实例"""
     try:
-        entry_point = manifest.get('entryPoint', {})
-        module_name = entry_point.get('module')
-        class_name = entry_point.get('class')
-        
-        if not module_name or not class_name:
-            sys.stderr.write(f"manifest缺少entryPoint信息: {manifest.get('name', 'unknown')}\n")
-            return None
-            
-        # 动态导入模块
-        module = importlib.import_module(module_name)
-        agent_class = getattr(module, class_name)
-        
-        # 创建实例
-        instance = agent_class()
-        return instance
-        
+        return _create_agent_instance(manifest)
     except Exception as e:
         sys.stderr.write(f"创建agent实例失败 {manifest.get('name', 'unknown')}: {e}\n")
         return None
 
+def _manifest_digest(manifest: Dict[str, Any]) -> str:
+    """manifest内容哈希，与格式化空白和字段顺序无关"""
+    data = json.dumps(manifest, sort_keys=True, ensure_ascii=False).encode('utf-8')
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+def _register_manifest(manifest_file: Path, manifest: Dict[str, Any]) -> Optional[str]:
+    """按agentType登记单个manifest，返回登记名称（失败返回None）"""
+    agent_type = manifest.get('agentType')
+    agent_name = manifest.get('name')
+    
+    if not agent_name:
+        sys.stderr.write(f"manifest缺少name字段: {manifest_file}\n")
+        return None
+    
+    # 根据agentType进行分类处理
+    if agent_type == 'mcp':
+        # MCP类型：登记到MCP_REGISTRY，实例在首次使用时创建
+        MANIFEST_CACHE[agent_name] = manifest
+        MCP_REGISTRY.register(agent_name, manifest)
+        sys.stderr.write(f"✅ 已注册MCP Agent: {agent_name}\n")
+        return agent_name
+            
+    elif agent_type == 'agent':
+        # Agent类型：转交给AgentManager处理
+        try:
+            from mcpserver.agent_manager import get_agent_manager
+            agent_manager = get_agent_manager()
+            
+            # 从manifest构建Agent配置
+            agent_config = {
+                'model_id': manifest.get('modelId', 'deepseek-chat'),
+                'name': manifest.get('displayName', agent_name),
+                'base_name': agent_name,
+                'system_prompt': manifest.get('systemPrompt', f'You are a helpful AI assistant named {manifest.get("displayName", agent_name)}.'),
+                'max_output_tokens': manifest.get('maxOutputTokens', 8192),
+                'temperature': manifest.get('temperature', 0.7),
+                'description': manifest.get('description', f'Assistant {manifest.get("displayName", agent_name)}.'),
+                'model_provider': manifest.get('modelProvider', 'openai'),
+                'api_base_url': manifest.get('apiBaseUrl', ''),
+                'api_key': manifest.get('apiKey', ''),
+                'max_concurrency': manifest.get('maxConcurrency', 0)
+            }
+            
+            # 注册到AgentManager
+            agent_manager._register_agent_from_manifest(agent_name, agent_config)
+            sys.stderr.write(f"✅ 已注册Agent到AgentManager: {agent_name}\n")
+            return f"agent:{agent_name}"
+            
+        except Exception as e:
+            sys.stderr.write(f"注册Agent到AgentManager失败 {agent_name}: {e}\n")
+            return None
+    return None
+
+def _unregister_manifest(manifest: Dict[str, Any]) -> Optional[str]:
+    """撤销单个manifest的登记，返回撤销的名称"""
+    agent_type = manifest.get('agentType')
+    agent_name = manifest.get('name')
+    if not agent_name:
+        return None
+    if agent_type == 'mcp':
+        MANIFEST_CACHE.pop(agent_name, None)
+        if agent_name in MCP_REGISTRY: # 不用pop，避免触发实例创建
+            del MCP_REGISTRY[agent_name]
+        sys.stderr.write(f"🗑️ 已注销MCP Agent: {agent_name}\n")
+        return agent_name
+    elif agent_type == 'agent':
+        try:
+            from mcpserver.agent_manager import get_agent_manager
+            get_agent_manager().unregister_agent(agent_name)
+            sys.stderr.write(f"🗑️ 已从AgentManager注销Agent: {agent_name}\n")
+            return f"agent:{agent_name}"
+        except Exception as e:
+            sys.stderr.write(f"从AgentManager注销Agent失败 {agent_name}: {e}\n")
+    return None
+
+_MANIFEST_STATE: Dict[str, tuple] = {} # manifest路径 -> (内容哈希, manifest)，用于热重载比对
+_RELOAD_LOCK = threading.Lock()
+
 def scan_and_register_mcp_agents(mcp_dir: str = 'mcpserver') -> list:
     """扫描目录中的JSON元数据文件，注册MCP类型的agent和Agent类型的agent"""
     d = Path(mcp_dir)
     registered_agents = []
     
-    # 扫描所有agent-manifest.json文件
-    for manifest_file in d.glob('**/agent-manifest.json'):
-        try:
-            # 加载manifest
-            manifest = load_manifest_file(manifest_file)
-            if not manifest:
-                continue
-                
-            agent_type = manifest.get('agentType')
-            agent_name = manifest.get('name')
-            
-            if not agent_name:
-                sys.stderr.write(f"manifest缺少name字段: {manifest_file}\n")
+    # 扫描所有agent-manifest.json文件（未变化的manifest走磁盘缓存）
+    manifests = load_manifests_cached(list(d.glob('**/agent-manifest.json')))
+    with _RELOAD_LOCK:
+        for manifest_file, manifest in manifests.items():
+            try:
+                registered = _register_manifest(manifest_file, manifest)
+                if registered:
+                    registered_agents.append(registered)
+                    _MANIFEST_STATE[str(manifest_file.resolve())] = (_manifest_digest(manifest), manifest)
+            except Exception as e:
+                sys.stderr.write(f"处理manifest文件失败 {manifest_file}: {e}\n")
                 continue
-            
-            # 根据agentType进行分类处理
-            if agent_type == 'mcp':
-                # MCP类型：注册到MCP_REGISTRY
-                MANIFEST_CACHE[agent_name] = manifest
-                agent_instance = create_agent_instance(manifest)
-                if agent_instance:
-                    MCP_REGISTRY[agent_name] = agent_instance
-                    registered_agents.append(agent_name)
-                    sys.stderr.write(f"✅ 已注册MCP Agent: {agent_name}\n")
-                    
-            elif agent_type == 'agent':
-                # Agent类型：转交给AgentManager处理
-                try:
-                    from mcpserver.agent_manager import get_agent_manager
-                    agent_manager = get_agent_manager()
-                    
-                    # 从manifest构建Agent配置
-                    agent_config = {
-                        'model_id': manifest.get('modelId', 'deepseek-chat'),
-                        'name': manifest.get('displayName', agent_name),
-                        'base_name': agent_name,
-                        'system_prompt': manifest.get('systemPrompt', f'You are a helpful AI assistant named {manifest.get("displayName", agent_name)}.'),
-                        'max_output_tokens': manifest.get('maxOutputTokens', 8192),
-                        'temperature': manifest.get('temperature', 0.7),
-                        'description': manifest.get('description', f'Assistant {manifest.get("displayName", agent_name)}.'),
-                        'model_provider': manifest.get('modelProvider', 'openai'),
-                        'api_base_url': manifest.get('apiBaseUrl', ''),
-                        'api_key': manifest.get('apiKey', '')
-                    }
-                    
-                    # 注册到AgentManager
-                    agent_manager._register_agent_from_manifest(agent_name, agent_config)
-                    registered_agents.append(f"agent:{agent_name}")
-                    sys.stderr.write(f"✅ 已注册Agent到AgentManager: {agent_name}\n")
-                    
-                except Exception as e:
-                    sys.stderr.write(f"注册Agent到AgentManager失败 {agent_name}: {e}\n")
-                    continue
-                    
-        except Exception as e:
-            sys.stderr.write(f"处理manifest文件失败 {manifest_file}: {e}\n")
-            continue
     
     return registered_agents
 
+def reload_manifests(mcp_dir: str = 'mcpserver', manifests: Optional[Dict[Path, Dict[str, Any]]] = None) -> Dict[str, List[str]]:
+    """按内容哈希比对manifest，只重新登记新增/变化的Agent、注销已删除的Agent
+    
+    Args:
+        manifests: 预先读取的manifest（热重载时在监听线程读取），为None时现场扫描mcp_dir
+    
+    Returns:
+        Dict[str, List[str]]: {"added": [...], "updated": [...], "removed": [...]}
+    """
+    changes = {"added": [], "updated": [], "removed": []}
+    if manifests is None:
+        manifests = load_manifests_cached(list(Path(mcp_dir).glob('**/agent-manifest.json')))
+    current = {str(path.resolve()): (path, manifest) for path, manifest in manifests.items()}
+    with _RELOAD_LOCK:
+        for key in [k for k in _MANIFEST_STATE if k not in current]:
+            _, old_manifest = _MANIFEST_STATE.pop(key)
+            removed = _unregister_manifest(old_manifest)
+            if removed:
+                changes["removed"].append(removed)
+
+        for key, (path, manifest) in current.items():
+            digest = _manifest_digest(manifest)
+            old = _MANIFEST_STATE.get(key)
+            if old and old[0] == digest:
+                continue
+            try:
+                if old and (old[1].get('name'), old[1].get('agentType')) != (manifest.get('name'), manifest.get('agentType')):
+                    _unregister_manifest(old[1]) # 改名或改类型：先注销旧登记
+                registered = _register_manifest(path, manifest)
+            except Exception as e:
+                sys.stderr.write(f"处理manifest文件失败 {path}: {e}\n")
+                continue
+            if registered:
+                _MANIFEST_STATE[key] = (digest, manifest)
+                changes["updated" if old else "added"].append(registered)
+            elif old: # 新内容无效，撤销旧登记
+                _MANIFEST_STATE.pop(key, None)
+                removed = _unregister_manifest(old[1])
+                if removed:
+                    changes["removed"].append(removed)
+
+        if any(changes.values()):
+            MCP_REGISTRY.bump_generation() # Agent类型的变化也要使服务目录和提示词缓存失效
+            sys.stderr.write(f"manifest已重载: {changes}\n")
+    return changes
+
+_WATCHER = None
+_RELOAD_LOOP: Optional[asyncio.AbstractEventLoop] = None # 服务所在事件循环，热重载在其中应用
+_RELOAD_LISTENERS: List[Callable[[Dict[str, List[str]]], None]] = []
+RELOAD_APPLY_TIMEOUT = 30.0
+
+def bind_reload_loop(loop: asyncio.AbstractEventLoop):
+    """登记服务所在的事件循环（由MCPManager在调用时登记），原循环已停止时替换"""
+    global _RELOAD_LOOP
+    current = _RELOAD_LOOP
+    if current is loop:
+        return
+    if current is None or current.is_closed() or not current.is_running():
+        _RELOAD_LOOP = loop
+
+def add_reload_listener(listener: Callable[[Dict[str, List[str]]], None]):
+    """登记重载回调listener(changes)，与登记表变更在同一事件循环中执行"""
+    if listener not in _RELOAD_LISTENERS:
+        _RELOAD_LISTENERS.append(listener)
+
+def _run_on_reload_loop(func: Callable[[], Any]) -> Any:
+    """在服务事件循环中执行func并等待结果；事件循环未运行时没有并发读取方，直接执行"""
+    loop = _RELOAD_LOOP
+    if loop is None or loop.is_closed() or not loop.is_running():
+        return func()
+    future: concurrent.futures.Future = concurrent.futures.Future()
+
+    def run():
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            future.set_result(func())
+        except BaseException as e:
+            future.set_exception(e)
+
+    loop.call_soon_threadsafe(run)
+    try:
+        return future.result(timeout=RELOAD_APPLY_TIMEOUT)
+    except concurrent.futures.TimeoutError:
+        future.cancel()
+        raise
+
+def start_manifest_watcher(mcp_dir: str = 'mcpserver', interval: float = 2.0):
+    """启动manifest热重载监听（重复调用只启动一次）"""
+    global _WATCHER
+    if _WATCHER is not None:
+        return _WATCHER
+    from mcpserver.manifest_watcher import ManifestWatcher
+    from mcpserver.agent_manager import get_agent_manager
+    agent_manager = get_agent_manager()
+
+    def on_change():
+        # 文件读取在监听线程完成；登记表和AgentManager的修改切到服务事件循环中执行，不与读取方并发
+        manifests = load_manifests_cached(list(Path(mcp_dir).glob('**/agent-manifest.json')))
+        raw_files = agent_manager.read_config_files()
+
+        def apply():
+            changes = reload_manifests(mcp_dir, manifests)
+            agent_changes = agent_manager.reload_configs(raw_files)
+            for key in changes:
+                changes[key] += [f"agent:{name}" for name in agent_changes.get(key, [])]
+            if any(changes.values()):
+                for listener in list(_RELOAD_LISTENERS):
+                    try:
+                        listener(changes)
+                    except Exception as e:
+                        sys.stderr.write(f"manifest重载回调失败: {e}\n")
+            return changes
+
+        _run_on_reload_loop(apply)
+
+    _WATCHER = ManifestWatcher(
+        on_change,
+        [(mcp_dir, '**/agent-manifest.json'), (str(agent_manager.config_dir), '*.json')],
+        interval=interval
+    )
+    _WATCHER.start()
+    return _WATCHER
+
+def stop_manifest_watcher():
+    global _WATCHER
+    if _WATCHER is not None:
+        _WATCHER.stop()
+        _WATCHER = None
+
+def _text_grams(text: str) -> set:
+    """返回小写文本的1-gram和2-gram，用于子串检索的倒排索引"""
+    text = text.lower()
+    grams = set(text)
+    grams.update(text[i:i + 2] for i in range(len(text) - 1))
+    return grams
+
+def _build_tools(manifest: Dict[str, Any]) -> List[Dict[str, Any]]:
+    capabilities = manifest.get('capabilities', {})
+    invocation_commands = capabilities.get('invocationCommands', [])
+    return [
+        {
+            "name": cmd.get('command', ''),
+            "description": cmd.get('description', ''),
+            "example": cmd.get('example', ''),
+            "input_schema": manifest.get('inputSchema', {})
+        }
+        for cmd in invocation_commands
+    ]
+
+def _build_cache_policies(manifest: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+    """读取invocationCommands上的cacheable/ttl/ignoreArgs/fileArgs声明"""
+    policies = {}
+    for cmd in manifest.get('capabilities', {}).get('invocationCommands', []):
+        if cmd.get('cacheable'):
+            policies[cmd.get('command', '')] = {
+                "ttl": cmd.get('ttl'),
+                "ignore_args": list(cmd.get('ignoreArgs', [])),
+                "file_args": list(cmd.get('fileArgs', []))
+            }
+    return policies
+
+def _build_tool_aliases(manifest: Dict[str, Any]) -> Dict[str, str]:
+    """读取invocationCommands上的aliases声明：别名 -> 规范工具名"""
+    aliases = {}
+    for cmd in manifest.get('capabilities', {}).get('invocationCommands', []):
+        for alias in cmd.get('aliases', []):
+            aliases[alias] = cmd.get('command', '')
+    return aliases
+
+def _build_mutating_tools(manifest: Dict[str, Any]) -> set:
+    """读取invocationCommands上的mutating声明：调用后需使该服务的结果缓存失效的工具"""
+    return {
+        cmd.get('command', '')
+        for cmd in manifest.get('capabilities', {}).get('invocationCommands', [])
+        if cmd.get('mutating')
+    }
+
+class ServiceCatalog:
+    """服务目录索引，每个注册表代次构建一次：服务->工具、工具名->服务、描述倒排索引"""
+
+    def __init__(self, generation: int):
+        self.generation = generation
+        self.services: Dict[str, Dict[str, Any]] = {} # 服务名 -> 静态服务信息（不含实例）
+        self.summaries: List[Dict[str, Any]] = [] # 提示词/REST列表使用的服务摘要
+        self.tools: Dict[str, List[Dict[str, Any]]] = {} # 服务名 -> 工具列表
+        self.tool_services: Dict[str, List[str]] = {} # 工具名 -> 服务名列表
+        self.cache_policies: Dict[str, Dict[str, Dict[str, Any]]] = {} # 服务名 -> {工具名: 结果缓存策略}
+        self.tool_aliases: Dict[str, Dict[str, str]] = {} # 服务名 -> {别名: 规范工具名}
+        self.mutating_tools: Dict[str, set] = {} # 服务名 -> 声明mutating的工具名集合
+        self.search_text: Dict[str, tuple] = {} # 服务名 -> (小写描述, 小写显示名)
+        self.gram_index: Dict[str, set] = {} # n-gram -> 服务名集合
+        self.total_tools = 0
+
+        for name in list(MCP_REGISTRY):
+            manifest = MANIFEST_CACHE.get(name, {})
+            tools = _build_tools(manifest)
+            info = {
+                "name": name,
+                "manifest": manifest,
+                "description": manifest.get('description', ''),
+                "display_name": manifest.get('displayName', name),
+                "version": manifest.get('version', '1.0.0'),
+                "capabilities": manifest.get('capabilities', {}),
+                "input_schema": manifest.get('inputSchema', {}),
+                "available_tools": tools
+            }
+            self.services[name] = info
+            self.tools[name] = tools
+            self.cache_policies[name] = _build_cache_policies(manifest)
+            self.tool_aliases[name] = _build_tool_aliases(manifest)
+            self.mutating_tools[name] = _build_mutating_tools(manifest)
+            self.total_tools += len(tools)
+            self.summaries.append({
+                "name": name,
+                "description": info["description"],
+                "display_name": info["display_name"],
+                "version": info["version"],
+                "available_tools": tools,
+                "id": name
+            })
+            for tool in tools:
+                self.tool_services.setdefault(tool["name"], []).append(name)
+
+        # 能力检索沿用旧语义：关键词是描述或显示名的子串，检索范围为全部已加载manifest
+        for name, manifest in MANIFEST_CACHE.items():
+            description = manifest.get('description', '').lower()
+            display_name = manifest.get('displayName', '').lower()
+            self.search_text[name] = (description, display_name)
+            for gram in _text_grams(description) | _text_grams(display_name):
+                self.gram_index.setdefault(gram, set()).add(name)
+
+    def search(self, capability: str) -> List[str]:
+        keyword = capability.lower()
+        if not keyword:
+            return list(self.search_text)
+        grams = [keyword] if len(keyword) == 1 else [keyword[i:i + 2] for i in range(len(keyword) - 1)]
+        candidates = None
+        for gram in set(grams):
+            names = self.gram_index.get(gram)
+            if not names:
+                return []
+            candidates = set(names) if candidates is None else candidates & names
+        return [
+            name for name, (description, display_name) in self.search_text.items()
+            if name in candidates and (keyword in description or keyword in display_name)
+        ]
+
+_CATALOG: Optional[ServiceCatalog] = None
+_CATALOG_LOCK = threading.Lock()
+
+def get_catalog() -> ServiceCatalog:
+    """获取当前代次的服务目录，注册表变化后自动重建"""
+    global _CATALOG
+    catalog = _CATALOG
+    if catalog is None or catalog.generation != MCP_REGISTRY.generation:
+        with _CATALOG_LOCK:
+            catalog = _CATALOG
+            if catalog is None or catalog.generation != MCP_REGISTRY.generation:
+                catalog = ServiceCatalog(MCP_REGISTRY.generation)
+                _CATALOG = catalog
+    return catalog
+
 def get_service_info(service_name: str) -> Optional[Dict[str, Any]]:
     """获取指定服务的详细信息
     
@@ -116,23 +569,11 @@ def get_service_info(service_name: str) -> Optional[Dict[str, Any]]:
     Returns:
         Optional[Dict[str, Any]]: 服务信息，包含manifest和实例信息
     """
-    if service_name not in MCP_REGISTRY:
+    info = get_catalog().services.get(service_name)
+    if info is None:
         return None
-        
-    manifest = MANIFEST_CACHE.get(service_name, {})
-    instance = MCP_REGISTRY[service_name]
-    
-    return {
-        "name": service_name,
-        "manifest": manifest,
-        "instance": instance,
-        "description": manifest.get('description', ''),
-        "display_name": manifest.get('displayName', service_name),
-        "version": manifest.get('version', '1.0.0'),
-        "capabilities": manifest.get('capabilities', {}),
-        "input_schema": manifest.get('inputSchema', {}),
-        "available_tools": get_available_tools(service_name)
-    }
+    # 查询信息不触发实例创建
+    return dict(info, instance=MCP_REGISTRY.peek(service_name))
 
 def get_available_tools(service_name: str) -> List[Dict[str, Any]]:
     """获取指定服务可用的工具列表
@@ -143,23 +584,58 @@ def get_available_tools(service_name: str) -> List[Dict[str, Any]]:
     Returns:
         List[Dict[str, Any]]: 工具列表
     """
-    if service_name not in MANIFEST_CACHE:
-        return []
-        
-    manifest = MANIFEST_CACHE[service_name]
-    capabilities = manifest.get('capabilities', {})
-    invocation_commands = capabilities.get('invocationCommands', [])
-    
-    tools = []
-    for cmd in invocation_commands:
-        tools.append({
-            "name": cmd.get('command', ''),
-            "description": cmd.get('description', ''),
-            "example": cmd.get('example', ''),
-            "input_schema": manifest.get('inputSchema', {})
-        })
-    
-    return tools
+    catalog = get_catalog()
+    if service_name in catalog.tools:
+        return catalog.tools[service_name]
+    if service_name in MANIFEST_CACHE: # 未进入服务池的manifest（如实例创建失败）
+        return _build_tools(MANIFEST_CACHE[service_name])
+    return []
+
+def get_services_by_tool(tool_name: str) -> List[str]:
+    """根据工具名查找提供该工具的服务"""
+    return list(get_catalog().tool_services.get(tool_name, []))
+
+def get_cache_policy(service_name: str, tool_name: str) -> Optional[Dict[str, Any]]:
+    """获取工具的结果缓存策略，未声明cacheable时返回None"""
+    policies = get_catalog().cache_policies.get(service_name)
+    if policies is None and service_name in MANIFEST_CACHE:
+        policies = _build_cache_policies(MANIFEST_CACHE[service_name])
+    return (policies or {}).get(tool_name)
+
+def resolve_tool_name(service_name: str, tool_name: str) -> str:
+    """把manifest中声明的工具别名解析为规范工具名，未声明的名称原样返回"""
+    aliases = get_catalog().tool_aliases.get(service_name)
+    if aliases is None and service_name in MANIFEST_CACHE:
+        aliases = _build_tool_aliases(MANIFEST_CACHE[service_name])
+    return (aliases or {}).get(tool_name, tool_name)
+
+def is_mutating_tool(service_name: str, tool_name: str) -> bool:
+    """工具是否在manifest中声明了mutating（调用后使该服务的结果缓存失效）"""
+    mutating = get_catalog().mutating_tools.get(service_name)
+    if mutating is None and service_name in MANIFEST_CACHE:
+        mutating = _build_mutating_tools(MANIFEST_CACHE[service_name])
+    return tool_name in (mutating or set())
+
+def get_execution_policy(service_name: str) -> Dict[str, Any]:
+    """获取manifest顶层的执行策略：blocking表示需放入线程池执行，maxConcurrency为该Agent并发上限"""
+    manifest = MANIFEST_CACHE.get(service_name) or {}
+    return {
+        "blocking": bool(manifest.get('blocking', False)),
+        "max_concurrency": manifest.get('maxConcurrency')
+    }
+
+def get_tool_timeout(service_name: str, tool_name: str) -> Optional[float]:
+    """获取工具调用超时（秒）：优先invocationCommands中的timeout，其次communication.timeout（均为毫秒）"""
+    manifest = MANIFEST_CACHE.get(service_name) or {}
+    for cmd in manifest.get('capabilities', {}).get('invocationCommands', []):
+        if cmd.get('command') == tool_name and cmd.get('timeout'):
+            return cmd['timeout'] / 1000
+    timeout = manifest.get('communication', {}).get('timeout')
+    return timeout / 1000 if timeout else None
+
+def get_service_summaries() -> List[Dict[str, Any]]:
+    """获取所有服务的摘要列表（名称、描述、工具），供提示词构建和REST列表使用"""
+    return get_catalog().summaries
 
 def get_all_services_info() -> Dict[str, Any]:
     """获取所有已注册服务的详细信息
@@ -167,13 +643,10 @@ def get_all_services_info() -> Dict[str, Any]:
     Returns:
         Dict[str, Any]: 所有服务信息
     """
-    services_info = {}
-    for service_name in MCP_REGISTRY.keys():
-        service_info = get_service_info(service_name)
-        if service_info:
-            services_info[service_name] = service_info
-    
-    return services_info
+    return {
+        name: dict(info, instance=MCP_REGISTRY.peek(name))
+        for name, info in get_catalog().services.items()
+    }
 
 def query_services_by_capability(capability: str) -> List[str]:
     """根据能力查询服务
@@ -184,16 +657,7 @@ def query_services_by_capability(capability: str) -> List[str]:
     Returns:
         List[str]: 匹配的服务名称列表
     """
-    matching_services = []
-    
-    for service_name, manifest in MANIFEST_CACHE.items():
-        description = manifest.get('description', '').lower()
-        display_name = manifest.get('displayName', '').lower()
-        
-        if capability.lower() in description or capability.lower() in display_name:
-            matching_services.append(service_name)
-    
-    return matching_services
+    return get_catalog().search(capability)
 
 def get_service_statistics() -> Dict[str, Any]:
     """获取服务统计信息
@@ -201,23 +665,31 @@ def get_service_statistics() -> Dict[str, Any]:
     Returns:
         Dict[str, Any]: 统计信息
     """
-    total_services = len(MCP_REGISTRY)
-    total_tools = sum(len(get_available_tools(name)) for name in MCP_REGISTRY.keys())
-    
+    catalog = get_catalog()
     return {
-        "total_services": total_services,
-        "total_tools": total_tools,
-        "registered_services": list(MCP_REGISTRY.keys()),
+        "total_services": len(catalog.services),
+        "total_tools": catalog.total_tools,
+        "registered_services": list(catalog.services),
+        "generation": catalog.generation,
         "last_update": "动态更新"
     }
 
 # 自动扫描并注册
-def auto_register_mcp():
-    """自动注册所有MCP服务"""
+def auto_register_mcp(warm_up: bool = False, hot_reload: bool = False, hot_reload_interval: float = 2.0):
+    """自动注册所有MCP服务，warm_up为True时在后台线程池中预创建实例，hot_reload为True时监听manifest变化"""
+    start = time.perf_counter()
     registered = scan_and_register_mcp_agents()
-    sys.stderr.write(f"MCP注册完成，共注册 {len(registered)} 个服务: {registered}\n")
+    sys.stderr.write(f"MCP注册完成，共注册 {len(registered)} 个服务，耗时 {(time.perf_counter() - start) * 1000:.0f}ms: {registered}\n")
+    if warm_up:
+        MCP_REGISTRY.warm_up()
+    if hot_reload:
+        start_manifest_watcher(interval=hot_reload_interval)
     return registered
 
-# 执行自动注册
-auto_register_mcp()
+# 执行自动注册（仅解析manifest，不创建实例）
+try:
+    from config import MCP_WARM_UP_AGENTS, MCP_HOT_RELOAD, MCP_HOT_RELOAD_INTERVAL
+except Exception:
+    MCP_WARM_UP_AGENTS, MCP_HOT_RELOAD, MCP_HOT_RELOAD_INTERVAL = False, False, 2.0
+auto_register_mcp(warm_up=MCP_WARM_UP_AGENTS, hot_reload=MCP_HOT_RELOAD, hot_reload_interval=MCP_HOT_RELOAD_INTERVAL)
 
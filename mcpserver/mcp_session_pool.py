@@ -0,0 +1,256 @@
+# mcp_session_pool.py # 外部stdio MCP服务的会话池
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager
+from typing import Any, Callable, Dict, List, Optional
+
+from mcp import ClientSession, StdioServerParameters
+from mcp.client.stdio import stdio_client
+
+logger = logging.getLogger("MCPSessionPool")
+
+class PooledSession:
+    """单个stdio子进程会话
+
+    连接在独立的owner任务中建立和关闭：stdio_client内部使用anyio任务组，
+    必须在进入上下文的同一任务中退出，不能挂在共享的AsyncExitStack上跨任务关闭。
+    """
+
+    def __init__(self, server_params: StdioServerParameters):
+        self.server_params = server_params
+        self.session: Optional[ClientSession] = None
+        self.error: Optional[BaseException] = None
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+        self.in_use = False
+        self._ready = asyncio.Event()
+        self._closing = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def alive(self) -> bool:
+        return self.session is not None and self._task is not None and not self._task.done()
+
+    async def _run(self):
+        try:
+            async with stdio_client(self.server_params) as (read, write):
+                async with ClientSession(read, write) as session:
+                    await session.initialize()
+                    self.session = session
+                    self._ready.set()
+                    await self._closing.wait()
+        except Exception as e:
+            self.error = e
+        finally:
+            self._ready.set()
+
+    async def start(self, timeout: float):
+        self._task = asyncio.create_task(self._run())
+        try:
+            await asyncio.wait_for(self._ready.wait(), timeout)
+        except asyncio.TimeoutError:
+            await self.close()
+            raise TimeoutError(f"MCP会话初始化超时({timeout}s)")
+        if not self.alive:
+            raise ConnectionError(f"MCP会话启动失败: {self.error}")
+
+    async def ping(self, timeout: float) -> bool:
+        if not self.alive:
+            return False
+        try:
+            await asyncio.wait_for(self.session.send_ping(), timeout)
+            return True
+        except Exception:
+            return False
+
+    async def close(self, timeout: float = 5.0):
+        self._closing.set()
+        if self._task is None or self._task.done():
+            return
+        try:
+            await asyncio.wait_for(asyncio.shield(self._task), timeout)
+        except Exception:
+            self._task.cancel()
+
+class MCPSessionPool:
+    """同一外部MCP服务的多个stdio会话：按需扩容到max_size，空闲会话保活探测，
+    失效会话自动重建，超过idle_timeout的多余会话被回收（保留min_size个）"""
+
+    def __init__(self, name: str, server_params: StdioServerParameters, min_size: int = 1, max_size: int = 4,
+                 ping_interval: float = 30.0, ping_timeout: float = 5.0, idle_timeout: float = 300.0,
+                 init_timeout: float = 15.0, on_reconnect: Optional[Callable[[], None]] = None):
+        self.name = name
+        self.server_params = server_params
+        self.min_size = max(0, min_size)
+        self.max_size = max(1, max_size, self.min_size)
+        self.ping_interval = ping_interval
+        self.ping_timeout = ping_timeout
+        self.idle_timeout = idle_timeout
+        self.init_timeout = init_timeout
+        self.on_reconnect = on_reconnect # 失效会话被重建时回调（如使工具列表缓存失效）
+        self._sessions: List[PooledSession] = []
+        self._starting = 0 # 正在启动的会话数，计入容量
+        self._condition = asyncio.Condition()
+        self._maintenance: Optional[asyncio.Task] = None
+        self._closed = False
+        self.stats = {"spawned": 0, "respawned": 0, "reaped": 0, "failed_pings": 0, "requests": 0, "waits": 0}
+
+    # --- 生命周期 ---
+    async def start(self):
+        """启动min_size个会话和后台维护任务"""
+        await asyncio.gather(*(self._spawn() for _ in range(self.min_size)), return_exceptions=True)
+        if self._maintenance is None and self.ping_interval > 0:
+            self._maintenance = asyncio.create_task(self._maintain())
+
+    async def close(self):
+        self._closed = True
+        if self._maintenance:
+            self._maintenance.cancel()
+            self._maintenance = None
+        async with self._condition:
+            sessions, self._sessions = self._sessions, []
+            self._condition.notify_all()
+        await asyncio.gather(*(s.close() for s in sessions), return_exceptions=True)
+
+    async def _spawn(self) -> PooledSession:
+        async with self._condition:
+            self._starting += 1
+        pooled = PooledSession(self.server_params)
+        try:
+            await pooled.start(self.init_timeout)
+        except Exception:
+            async with self._condition:
+                self._starting -= 1
+                self._condition.notify_all()
+            raise
+        async with self._condition:
+            self._starting -= 1
+            self._sessions.append(pooled)
+            self.stats["spawned"] += 1
+            self._condition.notify_all()
+        logger.info(f"MCP服务 {self.name} 新建会话，当前 {len(self._sessions)} 个")
+        return pooled
+
+    async def _discard(self, pooled: PooledSession):
+        async with self._condition:
+            if pooled in self._sessions:
+                self._sessions.remove(pooled)
+            self._condition.notify_all()
+        await pooled.close()
+
+    # --- 借出/归还 ---
+    @asynccontextmanager
+    async def acquire(self):
+        """借出一个空闲会话，会话用完自动归还；调用出错且会话已失效时丢弃该会话"""
+        pooled = await self._checkout()
+        try:
+            yield pooled.session
+        except Exception as e:
+            if not await pooled.ping(self.ping_timeout):
+                await self._discard(pooled)
+                pooled = None
+                self._notify_reconnect()
+                raise ConnectionError(f"MCP服务 {self.name} 会话已失效: {e}") from e
+            raise
+        finally:
+            if pooled is not None:
+                async with self._condition:
+                    pooled.in_use = False
+                    pooled.last_used = time.monotonic()
+                    self._condition.notify()
+
+    async def _checkout(self) -> PooledSession:
+        if self._closed:
+            raise ConnectionError(f"MCP服务 {self.name} 会话池已关闭")
+        while True:
+            spawn = False
+            async with self._condition:
+                for pooled in self._sessions:
+                    if not pooled.in_use and pooled.alive:
+                        pooled.in_use = True
+                        self.stats["requests"] += 1
+                        return pooled
+                if len(self._sessions) + self._starting < self.max_size:
+                    spawn = True
+                else:
+                    self.stats["waits"] += 1
+                    await self._condition.wait()
+            if spawn:
+                await self._spawn() # 失败时异常直接抛给调用方
+
+    async def call_tool(self, tool_name: str, args: Dict[str, Any], retries: int = 1):
+        """在池中任一空闲会话上调用工具，会话失效时换新会话重试"""
+        for attempt in range(retries + 1):
+            try:
+                async with self.acquire() as session:
+                    return await session.call_tool(tool_name, args)
+            except ConnectionError as e:
+                if attempt >= retries:
+                    raise
+                logger.warning(f"MCP服务 {self.name} 会话失效，重试: {e}")
+
+    async def list_tools(self):
+        async with self.acquire() as session:
+            return await session.list_tools()
+
+    # --- 维护 ---
+    async def _maintain(self):
+        while not self._closed:
+            await asyncio.sleep(self.ping_interval)
+            try:
+                await self._health_check()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"MCP服务 {self.name} 会话维护失败: {e}")
+
+    async def _health_check(self):
+        now = time.monotonic()
+        async with self._condition:
+            idle = [s for s in self._sessions if not s.in_use]
+            for pooled in idle:
+                pooled.in_use = True # 探测期间不借出
+        dead, reap = [], []
+        for pooled in idle:
+            if not await pooled.ping(self.ping_timeout):
+                self.stats["failed_pings"] += 1
+                dead.append(pooled)
+            elif now - pooled.last_used > self.idle_timeout:
+                reap.append(pooled)
+        keep = max(0, len(self._sessions) - len(dead) - self.min_size)
+        reap = reap[:keep]
+        for pooled in dead + reap:
+            await self._discard(pooled)
+        self.stats["reaped"] += len(reap)
+        async with self._condition:
+            for pooled in idle:
+                pooled.in_use = False
+            self._condition.notify_all()
+            missing = self.min_size - len(self._sessions) - self._starting
+        if dead:
+            logger.warning(f"MCP服务 {self.name} 有 {len(dead)} 个会话失效，已移除")
+            self._notify_reconnect()
+        for _ in range(max(0, missing)):
+            try:
+                await self._spawn()
+                self.stats["respawned"] += 1
+            except Exception as e:
+                logger.error(f"MCP服务 {self.name} 重建会话失败: {e}")
+                break
+
+    def _notify_reconnect(self):
+        if self.on_reconnect:
+            try:
+                self.on_reconnect()
+            except Exception as e:
+                logger.error(f"MCP服务 {self.name} 重连回调失败: {e}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        return dict(
+            self.stats,
+            size=len(self._sessions),
+            busy=sum(1 for s in self._sessions if s.in_use),
+            min_size=self.min_size,
+            max_size=self.max_size
+        )
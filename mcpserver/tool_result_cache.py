@@ -0,0 +1,77 @@
+# tool_result_cache.py # 幂等MCP工具调用的结果缓存
+import json
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+def canonical_args(args: Dict[str, Any], ignore: Iterable[str] = ()) -> str:
+    """参数规范化为稳定字符串：键排序、去掉忽略的参数和空值"""
+    ignore = set(ignore)
+    cleaned = {k: v for k, v in (args or {}).items() if k not in ignore and v not in (None, "")}
+    return json.dumps(cleaned, sort_keys=True, ensure_ascii=False, separators=(',', ':'), default=str)
+
+def file_stamp(args: Dict[str, Any], file_args: Iterable[str]) -> Tuple:
+    """文件类参数对应文件的 (路径, mtime, 大小)，文件变化后缓存自动失效"""
+    stamp = []
+    for name in file_args:
+        path = (args or {}).get(name)
+        if not path:
+            continue
+        try:
+            stat = os.stat(path)
+            stamp.append((path, stat.st_mtime_ns, stat.st_size))
+        except OSError:
+            stamp.append((path, None, None))
+    return tuple(stamp)
+
+class ToolResultCache:
+    """按 (服务, 工具, 规范化参数) 缓存结果的LRU+TTL缓存"""
+
+    def __init__(self, max_entries: int = 512):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Tuple[str, str, str], Tuple[float, Tuple, Any]]" = OrderedDict() # 键 -> (过期时间, 文件戳, 结果)
+        self.stats = {"hits": 0, "misses": 0, "expired": 0, "stale_files": 0, "invalidations": 0}
+
+    def get(self, key: Tuple[str, str, str], stamp: Tuple = ()) -> Tuple[bool, Any]:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.stats["misses"] += 1
+            return False, None
+        expires_at, cached_stamp, result = entry
+        if time.monotonic() >= expires_at:
+            self.stats["expired"] += 1
+        elif cached_stamp != stamp:
+            self.stats["stale_files"] += 1
+        else:
+            self._entries.move_to_end(key)
+            self.stats["hits"] += 1
+            return True, result
+        del self._entries[key]
+        self.stats["misses"] += 1
+        return False, None
+
+    def put(self, key: Tuple[str, str, str], result: Any, ttl: float, stamp: Tuple = ()):
+        self._entries[key] = (time.monotonic() + ttl, stamp, result)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, service_name: Optional[str] = None) -> int:
+        """清除某个服务（不传则全部）的缓存结果，返回清除条数"""
+        if service_name is None:
+            removed = len(self._entries)
+            self._entries.clear()
+        else:
+            keys = [k for k in self._entries if k[0] == service_name]
+            for k in keys:
+                del self._entries[k]
+            removed = len(keys)
+        if removed:
+            self.stats["invalidations"] += 1
+        return removed
+
+    def get_stats(self) -> Dict[str, Any]:
+        lookups = self.stats["hits"] + self.stats["misses"]
+        return dict(self.stats, size=len(self._entries),
+                    hit_rate=round(self.stats["hits"] / lookups, 3) if lookups else 0.0)
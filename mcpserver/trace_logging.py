@@ -0,0 +1,77 @@
+# trace_logging.py # 工具调用追踪日志：按级别门控、惰性格式化、截断负载、队列异步写出
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+import threading
+from typing import Any, List
+
+DEFAULT_MAX_CHARS = 500
+
+class LazyPayload:
+    """日志参数包装：只有记录真正被输出时才序列化并截断
+
+    只保存对象引用，不复制；记录在后台线程格式化，调用方不应在记录后原地修改该对象。
+    """
+    __slots__ = ("obj", "max_chars")
+
+    def __init__(self, obj: Any, max_chars: int = DEFAULT_MAX_CHARS):
+        self.obj = obj
+        self.max_chars = max_chars
+
+    def __str__(self) -> str:
+        obj = self.obj
+        if isinstance(obj, str):
+            text = obj
+        else:
+            try:
+                text = json.dumps(obj, ensure_ascii=False, default=str)
+            except (TypeError, ValueError):
+                text = repr(obj)
+        if self.max_chars and len(text) > self.max_chars:
+            return f"{text[:self.max_chars]}...(共{len(text)}字符)"
+        return text
+
+    __repr__ = __str__
+
+def payload_size(obj: Any) -> int:
+    """结果长度（只对字符串/字节计算，其它类型返回-1，避免为统计而序列化）"""
+    return len(obj) if isinstance(obj, (str, bytes)) else -1
+
+class _DeferredQueueHandler(logging.handlers.QueueHandler):
+    """入队时不格式化消息，把格式化（含LazyPayload序列化）留给监听线程"""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        if record.exc_info: # 异常信息在调用线程渲染，traceback对象不跨线程保留
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+_listeners: List[logging.handlers.QueueListener] = []
+_setup_lock = threading.Lock()
+
+def get_trace_logger(name: str) -> logging.Logger:
+    """获取追踪日志器：日志经队列由后台线程写到stderr，不阻塞调用方"""
+    logger = logging.getLogger(name)
+    with _setup_lock:
+        if not any(isinstance(h, _DeferredQueueHandler) for h in logger.handlers):
+            log_queue: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+            stream = logging.StreamHandler(sys.stderr)
+            stream.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+            listener = logging.handlers.QueueListener(log_queue, stream, respect_handler_level=True)
+            listener.start()
+            logger.addHandler(_DeferredQueueHandler(log_queue))
+            logger.propagate = False # 不再经根日志器同步输出一次
+            if not _listeners:
+                atexit.register(_stop_listeners)
+            _listeners.append(listener)
+    return logger
+
+def _stop_listeners():
+    for listener in _listeners:
+        try:
+            listener.stop() # 退出前写完队列中剩余日志
+        except Exception:
+            pass
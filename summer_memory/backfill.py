@@ -0,0 +1,205 @@
+"""
+历史对话日志回填
+流式解析 logs/YYYY-MM-DD.txt，按文件记录字节偏移断点，有限并发提取三元组写入知识图谱
+
+用法: python -m summer_memory.backfill [--log-dir logs] [--concurrency 4] [--reset]
+"""
+import argparse
+import asyncio
+import glob
+import json
+import logging
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterator, Optional, Tuple
+
+from .extractor_ds_tri import extract_triples
+from .graph import store_triples, flush_graph_writes
+from .memory_manager import memory_manager
+from .vector_index import triple_to_text
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_FILE = "backfill_checkpoint.json"
+TURN_SEPARATOR = b'-' * 50
+USER_PREFIX = "用户: "
+AI_PREFIX = "娜迦: "
+
+
+def iter_log_turns(path: str, start_offset: int = 0) -> Iterator[Tuple[str, int]]:
+    """逐行流式解析日志，产出 (对话文本, 该轮结束处的字节偏移)
+
+    对话文本格式与 add_conversation_memory 一致，便于共享去重记录
+    """
+    with open(path, 'rb') as f:
+        f.seek(start_offset)
+        offset = start_offset
+        lines = []
+        for raw in f:
+            if raw.rstrip(b'\r\n') == TURN_SEPARATOR:
+                turn = _parse_turn(lines)
+                if turn:
+                    yield turn, offset
+                lines = []
+            else:
+                lines.append(raw.decode('utf-8', errors='replace'))
+            offset += len(raw)
+        turn = _parse_turn(lines)
+        if turn:
+            yield turn, offset
+
+
+def _parse_turn(lines) -> Optional[str]:
+    user, ai, current = [], [], None
+    for line in lines:
+        if line.startswith(USER_PREFIX) and current is None:
+            current = user
+            line = line[len(USER_PREFIX):]
+        elif line.startswith(AI_PREFIX) and current is user:
+            current = ai
+            line = line[len(AI_PREFIX):]
+        elif current is None:
+            continue  # 时间行等头部信息
+        current.append(line)
+    user_text, ai_text = ''.join(user).strip(), ''.join(ai).strip()
+    if not user_text or not ai_text:
+        return None
+    return f"{USER_PREFIX}{user_text}\n{AI_PREFIX}{ai_text}"
+
+
+class LogBackfill:
+    """可断点续传的日志回填任务"""
+
+    def __init__(self, log_dir: str = "logs", checkpoint_path: str = CHECKPOINT_FILE,
+                 concurrency: int = 4, report_interval: int = 20):
+        self.log_dir = log_dir
+        self.checkpoint_path = checkpoint_path
+        self.concurrency = max(1, concurrency)
+        self.report_interval = report_interval
+        self.dedup = memory_manager.extraction_cache
+        self.checkpoint = self._load_checkpoint()
+        self.stats = {"files": 0, "turns": 0, "skipped": 0, "extracted": 0, "empty": 0, "failed": 0, "triples": 0}
+        self._executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="backfill")
+        self._started = 0.0
+
+    # --- 断点 ---
+    def _load_checkpoint(self) -> Dict:
+        try:
+            with open(self.checkpoint_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return {}
+
+    def _save_checkpoint(self):
+        tmp_path = f"{self.checkpoint_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.checkpoint, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.checkpoint_path)
+
+    def _start_offset(self, path: str) -> int:
+        name = os.path.basename(path)
+        offset = self.checkpoint.get(name, {}).get("offset", 0)
+        if offset > os.path.getsize(path):  # 文件被截断或替换，从头开始
+            return 0
+        return offset
+
+    # --- 处理 ---
+    async def _process_turn(self, text: str):
+        loop = asyncio.get_running_loop()
+        if text in self.dedup:
+            self.stats["skipped"] += 1
+            return
+        try:
+            triples = await loop.run_in_executor(self._executor, extract_triples, text)
+            if not triples:
+                self.stats["empty"] += 1
+                return
+            await loop.run_in_executor(self._executor, store_triples, triples)
+            await loop.run_in_executor(self._executor, memory_manager._index_texts,
+                                       [triple_to_text(t) for t in triples], "triple")
+            self.dedup.add(text)
+            self.stats["extracted"] += 1
+            self.stats["triples"] += len(triples)
+        except Exception as e:
+            self.stats["failed"] += 1
+            logger.error(f"回填对话失败: {e}")
+
+    async def _process_file(self, path: str):
+        name = os.path.basename(path)
+        size = os.path.getsize(path)
+        start = self._start_offset(path)
+        if start >= size:
+            return
+        logger.info(f"回填 {name}，从偏移 {start}/{size} 开始")
+        window = deque()  # (结束偏移, 任务)，按文件顺序完成后推进断点
+        for text, end_offset in iter_log_turns(path, start):
+            window.append((end_offset, asyncio.ensure_future(self._process_turn(text))))
+            self.stats["turns"] += 1
+            if len(window) >= self.concurrency * 2:
+                await self._advance(name, size, window.popleft())
+        while window:
+            await self._advance(name, size, window.popleft())
+        self.checkpoint[name] = {"offset": size, "size": size}
+        self._save_checkpoint()
+        self.stats["files"] += 1
+
+    async def _advance(self, name: str, size: int, item):
+        end_offset, task = item
+        await task
+        self.checkpoint[name] = {"offset": end_offset, "size": size}
+        done = self.stats["skipped"] + self.stats["extracted"] + self.stats["empty"] + self.stats["failed"]
+        if self.report_interval and done % self.report_interval == 0:
+            self._save_checkpoint()
+            self.report()
+
+    def report(self):
+        elapsed = max(time.perf_counter() - self._started, 1e-6)
+        done = self.stats["skipped"] + self.stats["extracted"] + self.stats["empty"] + self.stats["failed"]
+        logger.info(
+            f"回填进度: 文件 {self.stats['files']}，对话 {done}/{self.stats['turns']}，"
+            f"跳过 {self.stats['skipped']}，提取 {self.stats['extracted']}，失败 {self.stats['failed']}，"
+            f"三元组 {self.stats['triples']}，{done / elapsed:.2f} 轮/秒"
+        )
+
+    async def run(self) -> Dict:
+        """按日期顺序回填全部日志文件，返回统计信息"""
+        self._started = time.perf_counter()
+        files = sorted(glob.glob(os.path.join(self.log_dir, "*.txt")))
+        try:
+            for path in files:
+                await self._process_file(path)
+        finally:
+            self._save_checkpoint()
+            self.dedup.save()
+            await asyncio.get_running_loop().run_in_executor(self._executor, flush_graph_writes)
+            self._executor.shutdown(wait=False)
+        self.report()
+        return dict(self.stats, seconds=time.perf_counter() - self._started)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="将历史对话日志回填到GRAG知识图谱")
+    parser.add_argument("--log-dir", default="logs", help="日志目录")
+    parser.add_argument("--concurrency", type=int, default=4, help="并发提取数")
+    parser.add_argument("--checkpoint", default=CHECKPOINT_FILE, help="断点文件")
+    parser.add_argument("--reset", action="store_true", help="忽略已有断点，从头回填")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    if args.reset and os.path.exists(args.checkpoint):
+        os.remove(args.checkpoint)
+    backfill = LogBackfill(args.log_dir, args.checkpoint, args.concurrency)
+    try:
+        stats = asyncio.run(backfill.run())
+    except KeyboardInterrupt:
+        print("\n已中断，进度已保存，再次运行将从断点继续。")
+        return 1
+    print(f"回填完成: {stats}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
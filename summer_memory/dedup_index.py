@@ -0,0 +1,175 @@
+"""
+三元组提取去重索引
+以blake2b摘要标识已处理文本，摘要追加写入磁盘并限制总量；
+内存中常驻持久化的布隆过滤器，绝大多数新文本无需加载摘要文件即可判定未处理
+"""
+import hashlib
+import logging
+import os
+import threading
+from typing import Optional, Set
+
+logger = logging.getLogger(__name__)
+
+DEDUP_FILE_PREFIX = "extraction_dedup"
+DIGEST_SIZE = 16
+
+
+def content_digest(text: str) -> bytes:
+    """稳定的内容摘要（不受Python hash()随机盐影响），空白差异不影响结果"""
+    normalized = " ".join(text.split())
+    return hashlib.blake2b(normalized.encode('utf-8'), digest_size=DIGEST_SIZE).digest()
+
+
+class BloomFilter:
+    """定长布隆过滤器，位置由摘要双重哈希得到"""
+
+    def __init__(self, num_bits: int, num_hashes: int, data: Optional[bytearray] = None):
+        self.num_bits = num_bits
+        self.num_hashes = num_hashes
+        self.bits = data if data is not None else bytearray((num_bits + 7) // 8)
+
+    def _positions(self, digest: bytes):
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:16], 'little') | 1
+        for i in range(self.num_hashes):
+            yield (h1 + i * h2) % self.num_bits
+
+    def add(self, digest: bytes):
+        for pos in self._positions(digest):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+
+    def __contains__(self, digest: bytes) -> bool:
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(digest))
+
+
+class ContentDedupIndex:
+    """持久化去重索引：布隆过滤器前置 + 有上限的摘要文件"""
+
+    def __init__(self, prefix: str = DEDUP_FILE_PREFIX, max_entries: int = 200_000,
+                 bloom_bits: int = 1 << 21, num_hashes: int = 7):
+        self.digest_path = f"{prefix}.digests"
+        self.bloom_path = f"{prefix}.bloom"
+        self.max_entries = max_entries
+        self._bloom_bits = bloom_bits
+        self._num_hashes = num_hashes
+        self._lock = threading.RLock()
+        self._digests: Optional[Set[bytes]] = None  # 仅在布隆过滤器命中时才加载
+        self._count = 0
+        self._bloom_dirty = False
+        self._load_bloom()
+
+    # --- 加载 ---
+    def _record_count(self) -> int:
+        try:
+            return os.path.getsize(self.digest_path) // DIGEST_SIZE
+        except OSError:
+            return 0
+
+    def _read_digests(self, start: int = 0):
+        with open(self.digest_path, 'rb') as f:
+            f.seek(start * DIGEST_SIZE)
+            while True:
+                record = f.read(DIGEST_SIZE)
+                if len(record) < DIGEST_SIZE:
+                    return
+                yield record
+
+    def _load_bloom(self):
+        """加载布隆过滤器快照，并补齐快照之后追加的摘要"""
+        self._count = self._record_count()
+        covered = 0
+        self._bloom = BloomFilter(self._bloom_bits, self._num_hashes)
+        try:
+            with open(self.bloom_path, 'rb') as f:
+                header = f.read(16)
+                data = bytearray(f.read())
+            covered = int.from_bytes(header[:8], 'little')
+            bits = int.from_bytes(header[8:16], 'little')
+            if bits == self._bloom_bits and len(data) == len(self._bloom.bits) and covered <= self._count:
+                self._bloom.bits = data
+            else:
+                covered = 0
+        except OSError:
+            covered = 0
+        if covered < self._count:
+            for digest in self._read_digests(covered):
+                self._bloom.add(digest)
+            self._bloom_dirty = True
+            self.save()
+
+    def _ensure_digests(self) -> Set[bytes]:
+        if self._digests is None:
+            self._digests = set(self._read_digests()) if self._count else set()
+        return self._digests
+
+    # --- 查询/写入 ---
+    def contains_digest(self, digest: bytes) -> bool:
+        with self._lock:
+            if digest not in self._bloom:
+                return False
+            return digest in self._ensure_digests()
+
+    def __contains__(self, text: str) -> bool:
+        return self.contains_digest(content_digest(text))
+
+    def add(self, text: str) -> bool:
+        """记录已处理文本，返回是否为新文本"""
+        digest = content_digest(text)
+        with self._lock:
+            if self.contains_digest(digest):
+                return False
+            with open(self.digest_path, 'ab') as f:
+                f.write(digest)
+            self._bloom.add(digest)
+            if self._digests is not None:
+                self._digests.add(digest)
+            self._count += 1
+            self._bloom_dirty = True
+            if self._count > self.max_entries * 1.25:
+                self._evict()
+            return True
+
+    def _evict(self):
+        """只保留最近的max_entries条摘要，并重建布隆过滤器"""
+        keep = list(self._read_digests(self._count - self.max_entries))
+        tmp_path = f"{self.digest_path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(b''.join(keep))
+        os.replace(tmp_path, self.digest_path)
+        self._bloom = BloomFilter(self._bloom_bits, self._num_hashes)
+        for digest in keep:
+            self._bloom.add(digest)
+        self._digests = set(keep) if self._digests is not None else None
+        self._count = len(keep)
+        self._bloom_dirty = True
+        self.save()
+        logger.info(f"去重索引已裁剪至 {self._count} 条")
+
+    def save(self):
+        """持久化布隆过滤器快照"""
+        with self._lock:
+            if not self._bloom_dirty:
+                return
+            header = self._count.to_bytes(8, 'little') + self._bloom_bits.to_bytes(8, 'little')
+            tmp_path = f"{self.bloom_path}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(header + bytes(self._bloom.bits))
+            os.replace(tmp_path, self.bloom_path)
+            self._bloom_dirty = False
+
+    def clear(self):
+        """清空去重记录"""
+        with self._lock:
+            for path in (self.digest_path, self.bloom_path):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            self._bloom = BloomFilter(self._bloom_bits, self._num_hashes)
+            self._digests = set()
+            self._count = 0
+            self._bloom_dirty = False
+
+    def __len__(self) -> int:
+        return self._count
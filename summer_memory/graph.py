@@ -1,8 +1,13 @@
 import json as _json
-from py2neo import Graph, Node, Relationship
+from py2neo import Graph
+import atexit
 import logging
 import sys
 import os
+from .triple_store import get_triple_store, LEGACY_TRIPLES_FILE
+from .neo4j_writer import Neo4jBatchWriter
+from .retrieval import GraphRetriever
+from .local_graph import get_local_graph
 
 # 添加项目根目录到路径，以便导入config
 sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
@@ -10,6 +15,7 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
 # 优先从config.json读取Neo4j配置
 CONFIG_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'config.json')
 GRAG_ENABLED = False
+GRAG_BACKEND = 'auto'  # auto: 本地索引优先、Neo4j兜底；local: 仅本地索引；neo4j: 仅Neo4j
 try:
     with open(CONFIG_PATH, 'r', encoding='utf-8') as f:
         _cfg = _json.load(f)
@@ -19,8 +25,10 @@ try:
     NEO4J_PASSWORD = grag_cfg['neo4j_password']
     NEO4J_DATABASE = grag_cfg['neo4j_database']
     GRAG_ENABLED = grag_cfg.get('enabled', True)
+    GRAG_BACKEND = grag_cfg.get('backend', 'auto')
     try:
-        graph = Graph(NEO4J_URI, auth=(NEO4J_USER, NEO4J_PASSWORD), name=NEO4J_DATABASE) if GRAG_ENABLED else None
+        use_neo4j = GRAG_ENABLED and GRAG_BACKEND != 'local'
+        graph = Graph(NEO4J_URI, auth=(NEO4J_USER, NEO4J_PASSWORD), name=NEO4J_DATABASE) if use_neo4j else None
     except Exception as e:
         print(f"[GRAG] Neo4j连接失败: {e}", file=sys.stderr)
         graph = None
@@ -31,58 +39,82 @@ except Exception as e:
     GRAG_ENABLED = False
 
 logger = logging.getLogger(__name__)
-TRIPLES_FILE = "triples.json"
+
+graph_writer = None
+graph_retriever = None
+if graph is not None:
+    graph_writer = Neo4jBatchWriter(graph)
+    graph_writer.ensure_schema()
+    atexit.register(graph_writer.close)
+    graph_retriever = GraphRetriever(graph)
+    graph_retriever.ensure_index()
+
+TRIPLES_FILE = LEGACY_TRIPLES_FILE  # 兼容旧版变量名，实际存储见triple_store
 
 
 def load_triples():
-    try:
-        with open(TRIPLES_FILE, 'r', encoding='utf-8') as f:
-            return set(tuple(t) for t in _json.load(f))
-    except FileNotFoundError:
-        return set()
+    return get_triple_store().all()
 
 
 def save_triples(triples):
-    with open(TRIPLES_FILE, 'w', encoding='utf-8') as f:
-        _json.dump(list(triples), f, ensure_ascii=False, indent=2)
+    get_triple_store().add(triples)
 
 
 def store_triples(new_triples):
-    all_triples = load_triples()
-    all_triples.update(new_triples)  # 集合自动去重
-
-    # 持久化到文件
-    save_triples(all_triples)
-
-    # 同步更新Neo4j图谱数据库（仅在GRAG_ENABLED时）
-    if graph is not None:
-        for head, rel, tail in new_triples:
-            if not head or not tail:
-                logger.warning(f"跳过无效三元组，head或tail为空: {(head, rel, tail)}")
-                continue
-            h_node = Node("Entity", name=head)
-            t_node = Node("Entity", name=tail)
-            r = Relationship(h_node, rel, t_node)
-            graph.merge(h_node, "Entity", "name")
-            graph.merge(t_node, "Entity", "name")
-            graph.merge(r)
+    new_triples = list(new_triples)
+    # 追加写入本地日志，内存集合自动去重
+    store = get_triple_store()
+    store.add(new_triples)
+    # 本地图谱索引按日志位置回放新追加的部分（也用作关键词提取的实体词典），backend仅决定查询时是否使用
+    get_local_graph().sync_log(store)
+
+    # 同步更新Neo4j图谱数据库（仅在GRAG_ENABLED时），由后台线程批量写入
+    if graph_writer is not None:
+        graph_writer.submit(new_triples)
+
+
+def flush_graph_writes():
+    """等待已提交的Neo4j写入完成"""
+    if graph_writer is not None:
+        graph_writer.flush()
+
+
+def get_graph_write_metrics():
+    """获取Neo4j批量写入统计"""
+    return graph_writer.get_metrics() if graph_writer is not None else {}
 
 
 def get_all_triples():
     return load_triples()
 
 
-def query_graph_by_keywords(keywords):
-    results = []
-    if graph is not None:
-        for kw in keywords:
-            query = f"""
-            MATCH (e1:Entity)-[r]->(e2:Entity)
-            WHERE e1.name CONTAINS '{kw}' OR e2.name CONTAINS '{kw}' OR type(r) CONTAINS '{kw}'
-            RETURN e1.name, type(r), e2.name
-            LIMIT 5
-            """
-            res = graph.run(query).data()
-            for record in res:
-                results.append((record['e1.name'], record['type(r)'], record['e2.name']))
-    return results
+def query_local_graph(keywords, limit=None):
+    """仅查询进程内图谱索引"""
+    if GRAG_BACKEND == 'neo4j':
+        return []
+    return get_local_graph().search(keywords, limit=limit)
+
+
+def query_graph_by_keywords(keywords, limit=None):
+    """按关键词检索三元组，结果按命中数和度数排序；本地索引优先，未命中时查询Neo4j"""
+    results = query_local_graph(keywords, limit=limit)
+    if results or graph_retriever is None:
+        return results
+    return graph_retriever.search(keywords, limit=limit)
+
+
+def get_entity_names(start=0):
+    """返回图谱中的实体名，start用于增量获取"""
+    return get_local_graph().entity_names(start)
+
+
+def get_entity_count():
+    return get_local_graph().entity_count()
+
+
+def save_local_graph_snapshot():
+    """保存本地图谱索引快照"""
+    get_local_graph().save_snapshot()
+
+
+atexit.register(save_local_graph_snapshot)
@@ -0,0 +1,169 @@
+"""
+本地关键词提取器
+基于图谱实体名构建Aho-Corasick自动机，一次扫描即可找出问题中提到的所有已知实体，
+命中时无需再调用LLM提取关键词
+"""
+import logging
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class AhoCorasick:
+    """Aho-Corasick多模式匹配自动机（大小写不敏感）"""
+
+    def __init__(self, patterns: Iterable[str]):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._output: List[List[str]] = [[]]  # 节点 -> 在此结束的原始模式
+        for pattern in patterns:
+            self._insert(pattern)
+        self._build_fail()
+
+    def _insert(self, pattern: str):
+        node = 0
+        for ch in pattern.casefold():
+            nxt = self._goto[node].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[node][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append([])
+            node = nxt
+        self._output[node].append(pattern)
+
+    def _build_fail(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, child in self._goto[node].items():
+                queue.append(child)
+                fail = self._fail[node]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[child] = self._goto[fail].get(ch, 0)
+                self._output[child] = self._output[child] + self._output[self._fail[child]]
+
+    def find_all(self, text: str) -> List[tuple]:
+        """返回 (结束位置, 模式) 列表"""
+        matches = []
+        node = 0
+        for i, ch in enumerate(text.casefold()):
+            while node and ch not in self._goto[node]:
+                node = self._fail[node]
+            node = self._goto[node].get(ch, 0)
+            for pattern in self._output[node]:
+                matches.append((i, pattern))
+        return matches
+
+
+class EntityKeywordExtractor:
+    """基于实体词典的关键词提取器，带问题->关键词缓存
+
+    新实体先进入待合并集合，提取时与自动机结果一起逐个子串匹配；
+    待合并实体达到rebuild_batch个或最早一个等待超过rebuild_interval秒后，才整体重建自动机。
+    缓存只淘汰包含新实体的问题，其余问题的提取结果不受新实体影响。
+    """
+
+    def __init__(self, min_length: int = 2, max_keywords: int = 10, cache_size: int = 512,
+                 rebuild_batch: int = 256, rebuild_interval: float = 60.0):
+        self.min_length = min_length  # 过滤“我”“你”等过短实体，避免噪声
+        self.max_keywords = max_keywords
+        self.cache_size = cache_size
+        self.rebuild_batch = rebuild_batch
+        self.rebuild_interval = rebuild_interval
+        self._entities = set()
+        self._automaton: Optional[AhoCorasick] = None
+        self._pending: Dict[str, str] = {}  # 尚未合入自动机的实体 -> casefold形式
+        self._pending_since = 0.0
+        self._cache: "OrderedDict[str, List[str]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def update(self, names: Iterable[str]) -> int:
+        """加入实体名，返回新增数量；自动机按批次重建，只淘汰受影响的缓存"""
+        added = []
+        with self._lock:
+            for name in names:
+                if isinstance(name, str) and len(name.strip()) >= self.min_length and name not in self._entities:
+                    self._entities.add(name)
+                    added.append(name)
+            if added:
+                if not self._pending:
+                    self._pending_since = time.monotonic()
+                for name in added:
+                    self._pending[name] = name.casefold()
+                self._evict_affected(added)
+        return len(added)
+
+    def _evict_affected(self, names: List[str]):
+        """淘汰文本中包含新实体的缓存问题（调用方持有锁）"""
+        if not self._cache:
+            return
+        matcher = AhoCorasick(names)
+        stale = [question for question in self._cache if matcher.find_all(question)]
+        for question in stale:
+            del self._cache[question]
+
+    def __len__(self) -> int:
+        return len(self._entities)
+
+    def _ensure_automaton(self):
+        """返回 (自动机, 待合并实体)；待合并实体过多或等待过久时重建自动机"""
+        with self._lock:
+            if self._pending and (
+                self._automaton is None
+                or len(self._pending) >= self.rebuild_batch
+                or time.monotonic() - self._pending_since >= self.rebuild_interval
+            ):
+                self._automaton = AhoCorasick(self._entities)
+                self._pending.clear()
+                logger.debug(f"实体自动机已重建: {len(self._entities)} 个实体")
+            return self._automaton, list(self._pending.items())
+
+    def extract(self, text: str) -> List[str]:
+        """返回文本中出现的实体名，按出现位置排序，已被更长匹配覆盖的短实体会被剔除"""
+        automaton, pending = self._ensure_automaton()
+        if automaton is None or not text:
+            return []
+        spans = []
+        for end, pattern in automaton.find_all(text):
+            spans.append((end - len(pattern) + 1, end, pattern))
+        if pending:
+            folded_text = text.casefold()
+            for pattern, folded in pending:
+                start = folded_text.find(folded)
+                while start != -1:
+                    spans.append((start, start + len(folded) - 1, pattern))
+                    start = folded_text.find(folded, start + 1)
+        # 优先保留更长的实体，丢弃被其完全覆盖的子串实体
+        spans.sort(key=lambda s: (-(s[1] - s[0]), s[0]))
+        kept = []
+        for start, end, pattern in spans:
+            if any(k_start <= start and end <= k_end for k_start, k_end, _ in kept):
+                continue
+            kept.append((start, end, pattern))
+        kept.sort(key=lambda s: s[0])
+        keywords = []
+        for _, _, pattern in kept:
+            if pattern not in keywords:
+                keywords.append(pattern)
+        return keywords[:self.max_keywords]
+
+    # --- 缓存 ---
+    def get_cached(self, question: str) -> Optional[List[str]]:
+        with self._lock:
+            keywords = self._cache.get(question)
+            if keywords is not None:
+                self._cache.move_to_end(question)
+            return keywords
+
+    def put_cached(self, question: str, keywords: List[str]):
+        with self._lock:
+            self._cache[question] = list(keywords)
+            self._cache.move_to_end(question)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
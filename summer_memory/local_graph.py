@@ -0,0 +1,269 @@
+"""
+进程内图谱索引
+Neo4j不可用时的本地图谱后端：实体/关系名驻留为整数ID，边存于数组，
+实体名建立1-gram/2-gram倒排索引用于子串查找，支持磁盘快照；
+快照记录对应的三元组日志位置，启动时只回放之后追加的日志
+"""
+import heapq
+import logging
+import os
+import pickle
+import threading
+from array import array
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from .retrieval import DEFAULT_LIMIT_PER_KEYWORD, normalize_keywords
+from .triple_store import LogPosition, TripleStore, get_triple_store
+
+logger = logging.getLogger(__name__)
+
+Triple = Tuple[str, str, str]
+
+SNAPSHOT_FILE = "graph_index.pkl"
+SNAPSHOT_VERSION = 2
+
+
+def _grams(text: str) -> Set[str]:
+    """返回文本的全部1-gram和2-gram"""
+    grams = set(text)
+    grams.update(text[i:i + 2] for i in range(len(text) - 1))
+    return grams
+
+
+class LocalGraphIndex:
+    """紧凑邻接表 + n-gram倒排索引的内存图谱"""
+
+    def __init__(self, snapshot_path: Optional[str] = SNAPSHOT_FILE):
+        self.snapshot_path = snapshot_path
+        self._lock = threading.RLock()
+        self._reset()
+
+    def _reset(self):
+        self._names: List[str] = []  # 实体ID -> 名称
+        self._name_ids: Dict[str, int] = {}
+        self._rels: List[str] = []  # 关系ID -> 类型
+        self._rel_ids: Dict[str, int] = {}
+        self._heads = array('i')  # 边ID -> 头实体ID
+        self._edge_rels = array('i')  # 边ID -> 关系ID
+        self._tails = array('i')  # 边ID -> 尾实体ID
+        self._adjacency: List[array] = []  # 实体ID -> 关联边ID（出边和入边）
+        self._rel_edges: List[array] = []  # 关系ID -> 边ID
+        self._edge_keys: Set[Tuple[int, int, int]] = set()
+        self._grams: Dict[str, Set[int]] = defaultdict(set)  # n-gram -> 实体ID
+        self._log_position: Optional[LogPosition] = None  # 已同步到的三元组日志位置
+        self._dirty = False
+
+    # --- 构建 ---
+    def _intern_entity(self, name: str) -> int:
+        eid = self._name_ids.get(name)
+        if eid is None:
+            eid = len(self._names)
+            self._names.append(name)
+            self._name_ids[name] = eid
+            self._adjacency.append(array('i'))
+            for gram in _grams(name.casefold()):
+                self._grams[gram].add(eid)
+        return eid
+
+    def _intern_rel(self, rel: str) -> int:
+        rid = self._rel_ids.get(rel)
+        if rid is None:
+            rid = len(self._rels)
+            self._rels.append(rel)
+            self._rel_ids[rel] = rid
+            self._rel_edges.append(array('i'))
+        return rid
+
+    def add_triples(self, triples: Iterable[Triple]) -> int:
+        """添加三元组，返回新增边数"""
+        added = 0
+        with self._lock:
+            for head, rel, tail in triples:
+                if not head or not rel or not tail:
+                    continue
+                h = self._intern_entity(head)
+                r = self._intern_rel(rel)
+                t = self._intern_entity(tail)
+                key = (h, r, t)
+                if key in self._edge_keys:
+                    continue
+                self._edge_keys.add(key)
+                edge_id = len(self._heads)
+                self._heads.append(h)
+                self._edge_rels.append(r)
+                self._tails.append(t)
+                self._adjacency[h].append(edge_id)
+                if t != h:
+                    self._adjacency[t].append(edge_id)
+                self._rel_edges[r].append(edge_id)
+                added += 1
+            if added:
+                self._dirty = True
+        return added
+
+    # --- 查询 ---
+    def match_entities(self, keyword: str) -> Set[int]:
+        """返回名称包含keyword的实体ID（大小写不敏感）"""
+        kw = keyword.casefold()
+        if not kw:
+            return set()
+        grams = [kw] if len(kw) == 1 else [kw[i:i + 2] for i in range(len(kw) - 1)]
+        postings = []
+        for gram in set(grams):
+            ids = self._grams.get(gram)
+            if not ids:
+                return set()
+            postings.append(ids)
+        postings.sort(key=len)
+        candidates = set(postings[0])
+        for ids in postings[1:]:
+            candidates &= ids
+            if not candidates:
+                return candidates
+        if len(kw) <= 2:
+            return candidates
+        return {eid for eid in candidates if kw in self._names[eid].casefold()}
+
+    def _degree(self, eid: int) -> int:
+        return len(self._adjacency[eid])
+
+    def _triple(self, edge_id: int) -> Triple:
+        return (self._names[self._heads[edge_id]], self._rels[self._edge_rels[edge_id]],
+                self._names[self._tails[edge_id]])
+
+    def search(self, keywords: Iterable, limit: Optional[int] = None) -> List[Triple]:
+        """检索实体名或关系类型包含关键词的三元组，按命中关键词数和度数排序"""
+        keywords = normalize_keywords(keywords)
+        if not keywords:
+            return []
+        if limit is None:
+            limit = DEFAULT_LIMIT_PER_KEYWORD * len(keywords)
+        with self._lock:
+            hits: Dict[int, int] = defaultdict(int)
+            for kw in keywords:
+                edges = set()
+                for eid in self.match_entities(kw):
+                    edges.update(self._adjacency[eid])
+                folded = kw.casefold()
+                for rid, rel in enumerate(self._rels):
+                    if folded in rel.casefold():
+                        edges.update(self._rel_edges[rid])
+                for edge_id in edges:
+                    hits[edge_id] += 1
+            ranked = heapq.nsmallest(
+                limit, hits,
+                key=lambda e: (-hits[e], -(self._degree(self._heads[e]) + self._degree(self._tails[e])), e)
+            )
+            return [self._triple(e) for e in ranked]
+
+    def neighbors(self, entity: str) -> List[Triple]:
+        """返回与实体直接相连的三元组"""
+        with self._lock:
+            eid = self._name_ids.get(entity)
+            if eid is None:
+                return []
+            return [self._triple(e) for e in self._adjacency[eid]]
+
+    def edges(self, start: int = 0) -> List[Triple]:
+        """按插入顺序返回边，start用于增量获取（边ID只增不减）"""
+        with self._lock:
+            return [self._triple(e) for e in range(start, len(self._heads))]
+
+    def entity_names(self, start: int = 0) -> List[str]:
+        """返回实体名，start用于增量获取（实体ID只增不减）"""
+        with self._lock:
+            return self._names[start:]
+
+    def entity_count(self) -> int:
+        return len(self._names)
+
+    def __len__(self) -> int:
+        return len(self._heads)
+
+    # --- 快照 ---
+    def save_snapshot(self, force: bool = False) -> bool:
+        """将索引写入磁盘快照（原子替换）"""
+        if not self.snapshot_path or (not self._dirty and not force):
+            return False
+        with self._lock:
+            data = {
+                "version": SNAPSHOT_VERSION,
+                "names": self._names,
+                "rels": self._rels,
+                "heads": self._heads.tobytes(),
+                "edge_rels": self._edge_rels.tobytes(),
+                "tails": self._tails.tobytes(),
+                "log_position": self._log_position,
+            }
+            tmp_path = f"{self.snapshot_path}.tmp"
+            with open(tmp_path, 'wb') as f:
+                pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, self.snapshot_path)
+            self._dirty = False
+        logger.info(f"本地图谱索引快照已保存: {len(self)} 条边")
+        return True
+
+    def load_snapshot(self) -> bool:
+        """从磁盘快照恢复索引，n-gram索引和邻接表在加载时重建"""
+        if not self.snapshot_path or not os.path.exists(self.snapshot_path):
+            return False
+        try:
+            with open(self.snapshot_path, 'rb') as f:
+                data = pickle.load(f)
+            if data.get("version") != SNAPSHOT_VERSION:
+                logger.warning("本地图谱索引快照版本不匹配，忽略快照")
+                return False
+            heads, edge_rels, tails = array('i'), array('i'), array('i')
+            heads.frombytes(data["heads"])
+            edge_rels.frombytes(data["edge_rels"])
+            tails.frombytes(data["tails"])
+        except Exception as e:
+            logger.warning(f"加载本地图谱索引快照失败: {e}")
+            return False
+        with self._lock:
+            self._reset()
+            names, rels = data["names"], data["rels"]
+            for name in names:
+                self._intern_entity(name)
+            for rel in rels:
+                self._intern_rel(rel)
+            self.add_triples((names[h], rels[r], names[t]) for h, r, t in zip(heads, edge_rels, tails))
+            self._log_position = data.get("log_position")
+            self._dirty = False
+        logger.info(f"本地图谱索引已从快照加载: {len(self)} 条边")
+        return True
+
+    def sync_log(self, store: TripleStore) -> int:
+        """回放三元组日志中尚未同步的部分（包括其他进程追加的内容），返回新增边数"""
+        with self._lock:
+            triples, position, reset = store.read_since(self._log_position)
+            if position is None:
+                return 0
+            if reset and self._log_position is not None:  # 日志被替换，快照已失效
+                logger.info("三元组日志已被替换，重建本地图谱索引")
+                self._reset()
+            added = self.add_triples(triples)
+            if position != self._log_position:
+                self._log_position = position
+                self._dirty = True
+        if added:
+            logger.info(f"本地图谱索引补齐 {added} 条边")
+        return added
+
+
+_index: Optional[LocalGraphIndex] = None
+_index_lock = threading.Lock()
+
+
+def get_local_graph(store: Optional[TripleStore] = None) -> LocalGraphIndex:
+    """获取全局本地图谱索引，首次调用时加载快照并回放快照之后的日志"""
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                index = LocalGraphIndex()
+                index.load_snapshot()
+                index.sync_log(store or get_triple_store())
+                _index = index
+    return _index
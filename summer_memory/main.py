@@ -4,10 +4,9 @@ import subprocess
 import atexit
 import logging
 import traceback
-import webbrowser
 
 from .extractor_ds_tri import extract_triples
-from .graph import store_triples
+from .graph import store_triples, flush_graph_writes
 from .visualize import visualize_triples
 from .rag_query_tri import query_knowledge, set_context
 
@@ -103,6 +102,7 @@ def batch_add_texts(texts):# 批量处理文本，提取三元组并存储
             return False
 
         store_triples(valid_triples)
+        flush_graph_writes()  # 等待批量写入完成后再查询
         set_context(texts)# 设置查询上下文
         return True
     except Exception as e:
@@ -161,8 +161,7 @@ def main(): # 主程序
             return
 
         if success:
-            webbrowser.open("graph.html")
-            print("\n知识图谱已生成：graph.html")
+            visualize_triples()
             print("请输入查询问题（输入空行退出）：")
             while True:
                 query = input("> ")
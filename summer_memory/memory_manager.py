@@ -1,9 +1,13 @@
+import atexit
 import logging
 import asyncio
+import threading
 from typing import List, Dict, Optional, Tuple
 from .extractor_ds_tri import extract_triples
-from .graph import store_triples, query_graph_by_keywords, get_all_triples
+from .graph import store_triples, query_graph_by_keywords, get_all_triples, get_entity_count
 from .rag_query_tri import query_knowledge, set_context
+from .dedup_index import ContentDedupIndex
+from .vector_index import VectorIndex, create_embedder, triple_to_text
 import config
 
 logger = logging.getLogger(__name__)
@@ -17,7 +21,10 @@ class GRAGMemoryManager:
         self.context_length = config.GRAG_CONTEXT_LENGTH
         self.similarity_threshold = config.GRAG_SIMILARITY_THRESHOLD
         self.recent_context = [] # 最近对话上下文
-        self.extraction_cache = set() # 避免重复提取
+        self.extraction_cache = ContentDedupIndex() # 持久化去重，避免重复提取
+        atexit.register(self.extraction_cache.save)
+        self.vector_index = None # 向量召回索引，首次使用时加载
+        self._vector_lock = threading.Lock()
         
         if not self.enabled:
             logger.info("GRAG记忆系统已禁用")
@@ -30,6 +37,29 @@ class GRAGMemoryManager:
         except Exception as e:
             logger.error(f"GRAG记忆系统初始化失败: {e}")
             self.enabled = False
+            return
+        # 后台线程预热索引，首次查询不在事件循环中加载
+        threading.Thread(target=self._warm_up, name="grag-warmup", daemon=True).start()
+
+    def _warm_up(self):
+        """加载本地图谱索引快照并回放之后的日志，再构建向量索引（嵌入已有三元组）"""
+        try:
+            get_entity_count()
+        except Exception as e:
+            logger.warning(f"预热本地图谱索引失败: {e}")
+        try:
+            self._get_vector_index()
+        except Exception as e:
+            logger.warning(f"预热向量索引失败: {e}")
+
+    @staticmethod
+    def _log_background_error(future):
+        """后台任务的完成回调：记录未被处理的异常"""
+        if future.cancelled():
+            return
+        error = future.exception()
+        if error is not None:
+            logger.error(f"后台记忆任务失败: {error}")
     
     async def add_conversation_memory(self, user_input: str, ai_response: str) -> bool:
         """添加对话记忆到知识图谱（仅写入三元组，不影响主对话历史）"""
@@ -38,6 +68,9 @@ class GRAGMemoryManager:
         try:
             # 只拼接本轮内容，不写入recent_context
             conversation_text = f"用户: {user_input}\n娜迦: {ai_response}"
+            # 对话片段写入向量索引，供recall_memory召回
+            future = asyncio.get_event_loop().run_in_executor(None, self._index_texts, [conversation_text[:500]], "conversation")
+            future.add_done_callback(self._log_background_error)
             # 仅用于三元组提取和写入，不存储到self.recent_context
             if self.auto_extract:
                 # 启动异步任务，不阻塞主流程
@@ -50,9 +83,8 @@ class GRAGMemoryManager:
     async def _extract_and_store_triples(self, text: str) -> bool:
         """提取并存储三元组"""
         try:
-            # 检查是否已处理过
-            text_hash = hash(text)
-            if text_hash in self.extraction_cache:
+            # 检查是否已处理过（跨进程重启有效）
+            if text in self.extraction_cache:
                 return True
                 
             # 异步提取三元组
@@ -62,7 +94,8 @@ class GRAGMemoryManager:
             if triples:
                 # 异步存储到Neo4j
                 await loop.run_in_executor(None, store_triples, triples)
-                self.extraction_cache.add(text_hash)
+                await loop.run_in_executor(None, self._index_texts, [triple_to_text(t) for t in triples], "triple")
+                self.extraction_cache.add(text)
                 logger.info(f"成功提取并存储 {len(triples)} 个三元组")
                 return True
             return False
@@ -91,15 +124,63 @@ class GRAGMemoryManager:
             logger.error(f"查询记忆失败: {e}")
             return None
     
+    def _get_vector_index(self):
+        """加载向量索引，首次加载时补齐已有三元组"""
+        if self.vector_index is None and config.config.grag.vector_recall:
+            with self._vector_lock:
+                if self.vector_index is None:
+                    grag_cfg = config.config.grag
+                    embedder = create_embedder(
+                        grag_cfg.embedding_model,
+                        grag_cfg.embedding_base_url or config.config.api.base_url,
+                        grag_cfg.embedding_api_key or config.config.api.api_key,
+                    )
+                    index = VectorIndex(embedder)
+                    index.add((triple_to_text(t) for t in get_all_triples()), kind="triple")
+                    self.vector_index = index
+        return self.vector_index
+
+    def _index_texts(self, texts: List[str], kind: str) -> int:
+        """写入向量索引（同步，供线程池调用）"""
+        try:
+            index = self._get_vector_index()
+            return index.add(texts, kind=kind) if index is not None else 0
+        except Exception as e:
+            logger.error(f"写入向量索引失败: {e}")
+            return 0
+
+    def recall_memory(self, question: str, k: int = 3) -> List[Dict]:
+        """按向量相似度召回相关三元组和对话片段，返回 [{"text", "kind", "score"}]
+
+        同步方法（查询需要嵌入，可能是网络请求），异步代码应使用recall_memory_async
+        """
+        if not self.enabled:
+            return []
+        try:
+            index = self._get_vector_index()
+            if index is None:
+                return []
+            return index.search(question, k=k, min_score=config.config.grag.vector_min_score)
+        except Exception as e:
+            logger.error(f"向量召回记忆失败: {e}")
+            return []
+
+    async def recall_memory_async(self, question: str, k: int = 3) -> List[Dict]:
+        """在线程池中执行recall_memory，不阻塞事件循环"""
+        if not self.enabled:
+            return []
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(None, self.recall_memory, question, k)
+
     async def get_relevant_memories(self, query: str, limit: int = 3) -> List[Tuple[str, str, str]]:
         """获取相关记忆"""
         if not self.enabled:
             return []
             
         try:
-            # 从Neo4j查询相关三元组
+            # 本地图谱索引优先，未命中时查询Neo4j；索引可能仍在预热，放到线程池执行
             loop = asyncio.get_event_loop()
-            triples = await loop.run_in_executor(None, query_graph_by_keywords, [query])
+            triples = await loop.run_in_executor(None, query_graph_by_keywords, [query], limit)
             
             # 限制返回数量
             return triples[:limit]
@@ -118,7 +199,8 @@ class GRAGMemoryManager:
                 "enabled": True,
                 "total_triples": len(all_triples),
                 "context_length": len(self.recent_context),
-                "cache_size": len(self.extraction_cache)
+                "cache_size": len(self.extraction_cache),
+                "vector_count": len(self.vector_index) if self.vector_index is not None else 0
             }
         except Exception as e:
             logger.error(f"获取记忆统计失败: {e}")
@@ -0,0 +1,251 @@
+"""
+Neo4j批量写入器
+每批三元组按关系类型分组，在一个事务内执行参数化的 UNWIND $rows AS row MERGE ... 语句，
+替代逐条三次 graph.merge 的写法；支持后台异步提交、指数退避重试和吞吐量统计
+"""
+import logging
+import queue
+import re
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+Triple = Tuple[str, str, str]
+
+ENTITY_CONSTRAINT_QUERY = (
+    "CREATE CONSTRAINT entity_name_unique IF NOT EXISTS "
+    "FOR (e:Entity) REQUIRE e.name IS UNIQUE"
+)
+
+_MERGE_QUERY_TEMPLATE = """
+UNWIND $rows AS row
+MERGE (h:Entity {name: row.head})
+MERGE (t:Entity {name: row.tail})
+MERGE (h)-[:`%s`]->(t)
+"""
+
+
+def build_merge_query(rel: str) -> str:
+    """关系类型无法参数化，转义反引号后拼入语句"""
+    return _MERGE_QUERY_TEMPLATE % rel.replace('`', '``')
+
+
+def group_rows(triples: Iterable[Triple]) -> Dict[str, List[Dict[str, str]]]:
+    """按关系类型分组为UNWIND参数行，过滤非法三元组"""
+    grouped = defaultdict(list)
+    for head, rel, tail in triples:
+        if not head or not tail or not rel:
+            logger.warning(f"跳过无效三元组，head/rel/tail为空: {(head, rel, tail)}")
+            continue
+        grouped[rel].append({"head": head, "rel": rel, "tail": tail})
+    return grouped
+
+
+class Neo4jBatchWriter:
+    """Neo4j批量写入器，graph需提供py2neo风格的 run/begin/commit/rollback 接口"""
+
+    def __init__(self, graph, batch_size: int = 500, max_retries: int = 3,
+                 backoff_base: float = 0.5, flush_interval: float = 1.0):
+        self.graph = graph
+        self.batch_size = batch_size
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base  # 重试等待 backoff_base * 2^n 秒
+        self.flush_interval = flush_interval  # 后台线程攒批的最长等待时间
+        self._queue: "queue.Queue[Optional[Triple]]" = queue.Queue()
+        self._worker: Optional[threading.Thread] = None
+        self._worker_lock = threading.Lock()
+        self._metrics_lock = threading.Lock()
+        self._metrics = {
+            "submitted": 0,
+            "written": 0,
+            "batches": 0,
+            "transactions": 0,
+            "retries": 0,
+            "failed_batches": 0,
+            "dropped": 0,
+            "write_seconds": 0.0,
+            "last_error": None,
+        }
+
+    # --- 初始化 ---
+    def ensure_schema(self) -> bool:
+        """创建 Entity.name 唯一约束，MERGE 可走索引"""
+        try:
+            self.graph.run(ENTITY_CONSTRAINT_QUERY)
+            return True
+        except Exception as e:
+            logger.warning(f"创建Entity.name唯一约束失败: {e}")
+            return False
+
+    # --- 同步写入 ---
+    def write(self, triples: Iterable[Triple]) -> int:
+        """同步批量写入，返回成功写入的三元组数"""
+        triples = list(triples)
+        written = 0
+        for i in range(0, len(triples), self.batch_size):
+            written += self._write_batch(triples[i:i + self.batch_size])
+        return written
+
+    def _write_batch(self, batch: List[Triple]) -> int:
+        grouped = group_rows(batch)
+        count = sum(len(rows) for rows in grouped.values())
+        if not count:
+            return 0
+        for attempt in range(self.max_retries + 1):
+            start = time.perf_counter()
+            tx = None
+            try:
+                tx = self.graph.begin()
+                for rel, rows in grouped.items():
+                    tx.run(build_merge_query(rel), rows=rows)
+                self.graph.commit(tx)
+                elapsed = time.perf_counter() - start
+                with self._metrics_lock:
+                    self._metrics["written"] += count
+                    self._metrics["batches"] += 1
+                    self._metrics["transactions"] += 1
+                    self._metrics["write_seconds"] += elapsed
+                logger.debug(f"Neo4j批量写入 {count} 条三元组，耗时 {elapsed * 1000:.1f}ms")
+                return count
+            except Exception as e:
+                if tx is not None:
+                    try:
+                        self.graph.rollback(tx)
+                    except Exception:
+                        pass
+                with self._metrics_lock:
+                    self._metrics["last_error"] = str(e)
+                if attempt >= self.max_retries:
+                    with self._metrics_lock:
+                        self._metrics["failed_batches"] += 1
+                        self._metrics["dropped"] += count
+                    logger.error(f"Neo4j批量写入失败，已放弃 {count} 条三元组: {e}")
+                    return 0
+                delay = self.backoff_base * (2 ** attempt)
+                with self._metrics_lock:
+                    self._metrics["retries"] += 1
+                logger.warning(f"Neo4j批量写入失败，{delay:.1f}s 后重试({attempt + 1}/{self.max_retries}): {e}")
+                time.sleep(delay)
+        return 0
+
+    # --- 异步提交 ---
+    def submit(self, triples: Iterable[Triple]):
+        """异步提交，由后台线程攒批写入"""
+        self._ensure_worker()
+        n = 0
+        for t in triples:
+            self._queue.put(tuple(t))
+            n += 1
+        with self._metrics_lock:
+            self._metrics["submitted"] += n
+
+    def _ensure_worker(self):
+        if self._worker is not None and self._worker.is_alive():
+            return
+        with self._worker_lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name="Neo4jBatchWriter", daemon=True)
+                self._worker.start()
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                self._queue.task_done()
+                return
+            batch = [item]
+            deadline = time.monotonic() + self.flush_interval
+            stop = False
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    nxt = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if nxt is None:
+                    stop = True
+                    break
+                batch.append(nxt)
+            try:
+                self._write_batch(batch)
+            finally:
+                for _ in range(len(batch) + (1 if stop else 0)):
+                    self._queue.task_done()
+            if stop:
+                return
+
+    def flush(self):
+        """阻塞等待所有已提交的三元组写入完成"""
+        if self._worker is not None and self._worker.is_alive():
+            self._queue.join()
+
+    def close(self):
+        """写完剩余数据并停止后台线程"""
+        if self._worker is not None and self._worker.is_alive():
+            self._queue.put(None)
+            self._worker.join()
+        self._worker = None
+
+    # --- 统计 ---
+    def get_metrics(self) -> Dict:
+        """返回写入统计，throughput为每秒写入三元组数（按事务耗时计）"""
+        with self._metrics_lock:
+            metrics = dict(self._metrics)
+        metrics["pending"] = self._queue.qsize()
+        seconds = metrics["write_seconds"]
+        metrics["throughput"] = metrics["written"] / seconds if seconds > 0 else 0.0
+        return metrics
+
+
+class _LocalTransaction:
+    """LocalGraph的事务对象，提交前只记录语句"""
+
+    def __init__(self, graph: "LocalGraph"):
+        self.graph = graph
+        self.statements = []
+
+    def run(self, query: str, **params):
+        self.statements.append((query, params))
+
+
+class LocalGraph:
+    """本地替身驱动，实现Neo4jBatchWriter所需接口，用于无Neo4j环境下的测试"""
+
+    _REL_PATTERN = re.compile(r"-\[:`((?:[^`]|``)*)`\]->")
+
+    def __init__(self, fail_times: int = 0):
+        self.nodes = set()
+        self.edges = set()
+        self.queries = []
+        self.commits = 0
+        self.fail_times = fail_times  # 模拟前若干次提交失败
+
+    def run(self, query: str, **params):
+        self.queries.append((query, params))
+
+    def begin(self) -> _LocalTransaction:
+        return _LocalTransaction(self)
+
+    def commit(self, tx: _LocalTransaction):
+        if self.fail_times > 0:
+            self.fail_times -= 1
+            raise ConnectionError("模拟Neo4j提交失败")
+        for query, params in tx.statements:
+            self.queries.append((query, params))
+            match = self._REL_PATTERN.search(query)
+            if not match:
+                continue
+            rel = match.group(1).replace('``', '`')
+            for row in params.get("rows", []):
+                self.nodes.add(row["head"])
+                self.nodes.add(row["tail"])
+                self.edges.add((row["head"], rel, row["tail"]))
+        self.commits += 1
+
+    def rollback(self, tx: _LocalTransaction):
+        tx.statements.clear()
@@ -8,6 +8,7 @@ import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
 
 from config import config
+from .keyword_extractor import EntityKeywordExtractor
 API_URL = f"{config.api.base_url.rstrip('/')}/chat/completions"
 
 # 设置日志
@@ -23,8 +24,46 @@ def set_context(texts):
     recent_context = texts[:0]  # 限制上下文长度
     logger.info(f"更新查询上下文: {recent_context}")
 
-def query_knowledge(user_question):
-    """使用 DeepSeek API 提取关键词并查询知识图谱"""
+# 本地实体词典关键词提取器，命中已知实体时跳过LLM
+_keyword_extractor = EntityKeywordExtractor()
+_synced_entity_count = 0
+
+
+def _sync_entity_dictionary():
+    """增量同步图谱实体名到本地关键词提取器"""
+    global _synced_entity_count
+    from .graph import get_entity_names, get_entity_count
+    count = get_entity_count()
+    if count > _synced_entity_count:
+        _keyword_extractor.update(get_entity_names(_synced_entity_count))
+        _synced_entity_count = count
+
+
+def extract_keywords(user_question):
+    """提取问题关键词：缓存 -> 本地实体匹配 -> LLM，返回 (关键词列表, 错误提示)"""
+    try:
+        _sync_entity_dictionary()
+    except Exception as e:
+        logger.warning(f"同步实体词典失败: {e}")
+
+    cached = _keyword_extractor.get_cached(user_question)
+    if cached is not None:
+        logger.info(f"命中关键词缓存: {cached}")
+        return cached, None
+
+    keywords = _keyword_extractor.extract(user_question)
+    if keywords:
+        logger.info(f"本地实体匹配关键词: {keywords}")
+    else:
+        keywords, error = _extract_keywords_by_llm(user_question)
+        if error:
+            return [], error
+    _keyword_extractor.put_cached(user_question, keywords)
+    return keywords, None
+
+
+def _extract_keywords_by_llm(user_question):
+    """使用 DeepSeek API 提取关键词，返回 (关键词列表, 错误提示)"""
     context_str = "\n".join(recent_context) if recent_context else "无上下文"
     prompt = (
         f"基于以下上下文和用户问题，提取与知识图谱相关的关键词（如实体、关系），"
@@ -70,7 +109,7 @@ def query_knowledge(user_question):
 
         if "choices" not in content or not content["choices"]:
             logger.error("DeepSeek API 响应中未找到 'choices' 字段")
-            return "无法处理 API 响应，请稍后重试。"
+            return [], "无法处理 API 响应，请稍后重试。"
 
         raw_content = content["choices"][0]["message"]["content"]
         try:
@@ -82,7 +121,24 @@ def query_knowledge(user_question):
                 raise ValueError("关键词应为列表")
         except (json.JSONDecodeError, ValueError) as e:
             logger.error(f"解析 DeepSeek 响应失败: {raw_content}, 错误: {e}")
-            return "无法解析关键词，请检查问题格式。"
+            return [], "无法解析关键词，请检查问题格式。"
+
+        return keywords, None
+
+    except requests.exceptions.HTTPError as e:
+        logger.error(f"DeepSeek API HTTP 错误: {e}")
+        return [], "调用 DeepSeek API 失败，请检查 API 密钥或网络连接。"
+    except requests.exceptions.RequestException as e:
+        logger.error(f"DeepSeek API 请求失败: {e}")
+        return [], "无法连接到 DeepSeek API，请检查网络。"
+
+
+def query_knowledge(user_question):
+    """提取关键词并查询知识图谱，已知实体在本地匹配，仅在未命中时调用 DeepSeek API"""
+    try:
+        keywords, error = extract_keywords(user_question)
+        if error:
+            return error
 
         if not keywords:
             logger.warning("未提取到关键词")
@@ -100,12 +156,6 @@ def query_knowledge(user_question):
             answer += f"- {h} —[{r}]→ {t}\n"
         return answer
 
-    except requests.exceptions.HTTPError as e:
-        logger.error(f"DeepSeek API HTTP 错误: {e}")
-        return "调用 DeepSeek API 失败，请检查 API 密钥或网络连接。"
-    except requests.exceptions.RequestException as e:
-        logger.error(f"DeepSeek API 请求失败: {e}")
-        return "无法连接到 DeepSeek API，请检查网络。"
     except Exception as e:
         logger.error(f"查询过程中发生未知错误: {e}")
         return "查询过程中发生未知错误，请稍后重试。"
@@ -0,0 +1,167 @@
+"""
+知识图谱关键词检索引擎
+所有关键词合并为一次参数化查询，实体名走 Entity.name 全文索引，关系类型先在类型列表中按子串筛选再按类型匹配，
+结果按命中关键词数和节点度数排序并去重
+"""
+import logging
+import threading
+import time
+from typing import Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+Triple = Tuple[str, str, str]
+
+FULLTEXT_INDEX_NAME = "entity_name_fulltext"
+DEFAULT_LIMIT_PER_KEYWORD = 5  # 未指定limit时，每个关键词最多贡献的结果数（与旧实现一致）
+REL_TYPES_TTL = 60.0  # 关系类型列表的缓存时间（秒），新写入的关系类型最迟在此时间后参与匹配
+
+FULLTEXT_INDEX_QUERY = (
+    f"CREATE FULLTEXT INDEX {FULLTEXT_INDEX_NAME} IF NOT EXISTS "
+    "FOR (e:Entity) ON EACH [e.name]"
+)
+
+# 全文索引查询：每个关键词一次索引查找，命中节点展开一跳关系；
+# 关系类型在客户端从类型列表中按子串预先筛出（term.rel_types），没有匹配类型的关键词不扫描关系
+FULLTEXT_SEARCH_QUERY = """
+UNWIND $terms AS term
+CALL {
+    WITH term
+    CALL db.index.fulltext.queryNodes($index, term.query) YIELD node
+    MATCH (node)-[r]-(:Entity)
+    RETURN r
+    UNION
+    WITH term
+    WITH term WHERE size(term.rel_types) > 0  // 导入变量的WITH不能带WHERE，单独过滤
+    MATCH (:Entity)-[r]->(:Entity)
+    WHERE type(r) IN term.rel_types
+    RETURN r
+}
+WITH startNode(r) AS e1, r, endNode(r) AS e2, term.keyword AS kw
+WITH e1, r, e2, count(DISTINCT kw) AS hits
+RETURN e1.name AS head, type(r) AS rel, e2.name AS tail, hits,
+       COUNT { (e1)--() } + COUNT { (e2)--() } AS degree
+ORDER BY hits DESC, degree DESC
+LIMIT $limit
+"""
+
+RELATIONSHIP_TYPES_QUERY = "CALL db.relationshipTypes() YIELD relationshipType RETURN relationshipType"
+
+# 无全文索引时的兜底查询：仍为单次参数化查询，同时匹配关系类型
+CONTAINS_SEARCH_QUERY = """
+MATCH (e1:Entity)-[r]->(e2:Entity)
+WITH e1, r, e2, [kw IN $keywords WHERE e1.name CONTAINS kw OR e2.name CONTAINS kw OR type(r) CONTAINS kw] AS matched
+WHERE size(matched) > 0
+RETURN e1.name AS head, type(r) AS rel, e2.name AS tail, size(matched) AS hits,
+       COUNT { (e1)--() } + COUNT { (e2)--() } AS degree
+ORDER BY hits DESC, degree DESC
+LIMIT $limit
+"""
+
+
+# 全文索引或过程不存在时的错误特征；其它错误（网络、驱动等）视为暂时性错误
+_MISSING_FULLTEXT_MARKERS = (
+    "ProcedureNotFound", "There is no procedure", "IndexNotFound",
+    "no such fulltext", "no such index", "There is no such"
+)
+
+
+def is_missing_fulltext_error(error: Exception) -> bool:
+    """判断异常是否表示全文索引/全文检索过程不可用"""
+    text = f"{getattr(error, 'code', '') or ''} {error}"
+    return any(marker.lower() in text.lower() for marker in _MISSING_FULLTEXT_MARKERS)
+
+
+def normalize_keywords(keywords: Iterable) -> List[str]:
+    """去除空值、非字符串和重复关键词，保持原顺序"""
+    result = []
+    seen = set()
+    for kw in keywords or []:
+        if not isinstance(kw, str):
+            continue
+        kw = kw.strip()
+        if kw and kw not in seen:
+            seen.add(kw)
+            result.append(kw)
+    return result
+
+
+def to_fulltext_query(keyword: str) -> str:
+    """将关键词转为Lucene短语查询，转义引号和反斜杠"""
+    escaped = keyword.replace('\\', '\\\\').replace('"', '\\"')
+    return f'"{escaped}"'
+
+
+class GraphRetriever:
+    """基于Neo4j全文索引的关键词检索引擎"""
+
+    def __init__(self, graph, index_name: str = FULLTEXT_INDEX_NAME):
+        self.graph = graph
+        self.index_name = index_name
+        self.fulltext_available = True
+        self._lock = threading.Lock()
+        self._rel_types: List[str] = []
+        self._rel_types_loaded_at: Optional[float] = None
+
+    def ensure_index(self) -> bool:
+        """创建 Entity.name 全文索引，失败时退化为CONTAINS查询"""
+        try:
+            self.graph.run(FULLTEXT_INDEX_QUERY)
+            return True
+        except Exception as e:
+            logger.warning(f"创建全文索引失败，将使用CONTAINS查询: {e}")
+            self.fulltext_available = False
+            return False
+
+    def relationship_types(self) -> List[str]:
+        """图谱中的关系类型列表，按REL_TYPES_TTL缓存；查询失败时沿用上一次的列表"""
+        now = time.monotonic()
+        with self._lock:
+            if self._rel_types_loaded_at is not None and now - self._rel_types_loaded_at < REL_TYPES_TTL:
+                return self._rel_types
+        try:
+            rel_types = [record['relationshipType'] for record in self.graph.run(RELATIONSHIP_TYPES_QUERY).data()]
+        except Exception as e:
+            logger.warning(f"获取关系类型列表失败: {e}")
+            rel_types = self._rel_types
+        with self._lock:
+            self._rel_types = rel_types
+            self._rel_types_loaded_at = now
+        return rel_types
+
+    def search(self, keywords: Iterable, limit: Optional[int] = None) -> List[Triple]:
+        """单次查询检索所有关键词相关的三元组"""
+        keywords = normalize_keywords(keywords)
+        if not keywords or self.graph is None:
+            return []
+        if limit is None:
+            limit = DEFAULT_LIMIT_PER_KEYWORD * len(keywords)
+
+        records = None
+        if self.fulltext_available:
+            rel_types = self.relationship_types()
+            terms = [
+                {"keyword": kw, "query": to_fulltext_query(kw), "rel_types": [t for t in rel_types if kw in t]}
+                for kw in keywords
+            ]
+            try:
+                records = self.graph.run(FULLTEXT_SEARCH_QUERY, terms=terms, index=self.index_name,
+                                         limit=limit).data()
+            except Exception as e:
+                if is_missing_fulltext_error(e):
+                    with self._lock:
+                        self.fulltext_available = False
+                    logger.warning(f"全文索引不可用，改用CONTAINS查询: {e}")
+                else:  # 暂时性错误只影响本次查询
+                    logger.warning(f"全文索引查询失败，本次改用CONTAINS查询: {e}")
+        if records is None:
+            records = self.graph.run(CONTAINS_SEARCH_QUERY, keywords=keywords, limit=limit).data()
+
+        results = []
+        seen = set()
+        for record in records:
+            triple = (record['head'], record['rel'], record['tail'])
+            if triple not in seen:  # 同一对节点间的平行关系只保留一条
+                seen.add(triple)
+                results.append(triple)
+        return results
@@ -0,0 +1,225 @@
+"""
+追加写三元组存储
+使用JSONL日志替代每次全量重写triples.json，启动时一次性加载去重集合，写入加锁
+写入前先与去重集合比对，日志中不会出现重复行，因此不做压缩
+"""
+import json
+import logging
+import os
+import threading
+from contextlib import contextmanager
+from typing import Iterable, List, Optional, Set, Tuple
+
+try:
+    import fcntl  # POSIX文件锁
+except ImportError:  # Windows
+    fcntl = None
+try:
+    import msvcrt  # Windows文件锁
+except ImportError:
+    msvcrt = None
+
+logger = logging.getLogger(__name__)
+
+Triple = Tuple[str, str, str]
+LogPosition = Tuple[int, int, int]  # (st_dev, st_ino, 字节偏移)
+
+TRIPLES_LOG_FILE = "triples.jsonl"  # 追加写日志
+LEGACY_TRIPLES_FILE = "triples.json"  # 旧版全量文件，首次启动时迁移
+
+
+@contextmanager
+def _process_lock(lock_path: str):
+    """跨进程写锁，平台不支持时退化为无操作"""
+    with open(lock_path, 'a+') as lock_file:
+        try:
+            if fcntl is not None:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            elif msvcrt is not None:
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+        except OSError as e:
+            logger.debug(f"获取文件锁失败，继续执行: {e}")
+        try:
+            yield
+        finally:
+            try:
+                if fcntl is not None:
+                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+                elif msvcrt is not None:
+                    lock_file.seek(0)
+                    msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+            except OSError:
+                pass
+
+
+def _normalize(triple) -> Optional[Triple]:
+    """规范化三元组，非法时返回None"""
+    if not isinstance(triple, (list, tuple)) or len(triple) != 3:
+        return None
+    if not all(isinstance(x, str) for x in triple):
+        return None
+    return tuple(triple)
+
+
+def read_log(path: str, position: Optional[LogPosition] = None) -> Tuple[List[Triple], Optional[LogPosition], bool]:
+    """读取日志position之后的完整行
+
+    返回 (三元组, 新位置, 是否从头读取)；文件不存在时新位置为None。
+    文件被替换（inode变化）或截断时从头读取，调用方应丢弃旧数据。
+    """
+    try:
+        st = os.stat(path)
+    except OSError:
+        return [], None, False
+    file_id = (st.st_dev, st.st_ino)
+    offset = 0
+    reset = True
+    if position is not None and position[:2] == file_id and st.st_size >= position[2]:
+        offset = position[2]
+        reset = False
+    triples = []
+    if st.st_size > offset:
+        with open(path, 'rb') as f:
+            f.seek(offset)
+            for raw in f:
+                if not raw.endswith(b'\n'):  # 未写完的行，留待下次读取
+                    break
+                offset += len(raw)
+                try:
+                    t = _normalize(json.loads(raw))
+                except (json.JSONDecodeError, UnicodeDecodeError):
+                    logger.warning(f"跳过损坏的三元组日志行: {raw[:80]!r}")
+                    continue
+                if t is not None:
+                    triples.append(t)
+    return triples, file_id + (offset,), reset
+
+
+class TripleStore:
+    """追加写三元组存储：JSONL日志 + 内存去重集合"""
+
+    def __init__(self, path: str = TRIPLES_LOG_FILE, legacy_path: Optional[str] = LEGACY_TRIPLES_FILE):
+        self.path = path
+        self.legacy_path = legacy_path
+        self._lock = threading.RLock()
+        self._lock_path = f"{path}.lock"
+        self._triples: Set[Triple] = set()
+        self._position: Optional[LogPosition] = None  # 已读取到的日志位置
+        self._migrated = False
+        self._loaded = False
+
+    # --- 加载 ---
+    def _ensure_loaded(self):
+        if self._loaded:
+            return
+        with self._lock:
+            if self._loaded:
+                return
+            with _process_lock(self._lock_path):
+                self._migrate_legacy()
+                self._read_tail()
+            self._migrated = True
+            self._loaded = True
+            logger.info(f"三元组存储已加载: {len(self._triples)} 条")
+
+    def _migrate_legacy(self):
+        """首次启动时将旧版triples.json导入日志"""
+        if os.path.exists(self.path) or not self.legacy_path or not os.path.exists(self.legacy_path):
+            return
+        try:
+            with open(self.legacy_path, 'r', encoding='utf-8') as f:
+                legacy = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            logger.warning(f"读取旧版三元组文件失败，跳过迁移: {e}")
+            return
+        triples = []
+        seen = set()
+        for item in legacy:
+            t = _normalize(item)
+            if t is not None and t not in seen:
+                seen.add(t)
+                triples.append(t)
+        self._write_snapshot(triples)
+        logger.info(f"已从 {self.legacy_path} 迁移 {len(triples)} 条三元组到 {self.path}")
+
+    def _read_tail(self):
+        """读取自上次位置之后的新日志（包括其他进程追加的内容）"""
+        triples, position, reset = read_log(self.path, self._position)
+        if position is None:
+            return
+        if reset:  # 文件被替换或截断，重新全量加载
+            self._triples.clear()
+        self._triples.update(triples)
+        self._position = position
+
+    def read_since(self, position: Optional[LogPosition] = None) -> Tuple[List[Triple], Optional[LogPosition], bool]:
+        """按日志位置增量读取（不加载去重集合），供本地图谱索引同步，返回值同read_log"""
+        if not self._migrated:
+            with self._lock:
+                if not self._migrated:
+                    with _process_lock(self._lock_path):
+                        self._migrate_legacy()
+                    self._migrated = True
+        return read_log(self.path, position)
+
+    # --- 写入 ---
+    def add(self, triples: Iterable) -> List[Triple]:
+        """追加三元组，返回本次真正新增的部分"""
+        self._ensure_loaded()
+        with self._lock, _process_lock(self._lock_path):
+            self._read_tail()
+            added = []
+            for item in triples:
+                t = _normalize(item)
+                if t is not None and t not in self._triples:
+                    self._triples.add(t)
+                    added.append(t)
+            if added:
+                data = ''.join(json.dumps(list(t), ensure_ascii=False) + '\n' for t in added).encode('utf-8')
+                with open(self.path, 'ab') as f:
+                    f.write(data)
+                    f.flush()
+                    os.fsync(f.fileno())
+                    st = os.fstat(f.fileno())
+                self._position = (st.st_dev, st.st_ino, st.st_size)  # 持有进程锁，写入前已读到文件末尾
+            return added
+
+    def _write_snapshot(self, triples: Iterable[Triple]):
+        """写出完整日志（仅用于旧版迁移）"""
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            for t in triples:
+                f.write(json.dumps(list(t), ensure_ascii=False) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+    # --- 读取 ---
+    def all(self) -> Set[Triple]:
+        """返回全部三元组的副本"""
+        self._ensure_loaded()
+        with self._lock:
+            return set(self._triples)
+
+    def __contains__(self, triple) -> bool:
+        self._ensure_loaded()
+        return _normalize(triple) in self._triples
+
+    def __len__(self) -> int:
+        self._ensure_loaded()
+        return len(self._triples)
+
+
+_store: Optional[TripleStore] = None
+_store_lock = threading.Lock()
+
+
+def get_triple_store() -> TripleStore:
+    """获取全局三元组存储实例"""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = TripleStore()
+    return _store
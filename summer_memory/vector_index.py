@@ -0,0 +1,209 @@
+"""
+记忆向量索引
+三元组和对话片段的嵌入向量存于内存映射文件，元数据存于JSONL，
+NumPy暴力余弦检索，支持增量追加
+"""
+import json
+import logging
+import os
+import threading
+import zlib
+from typing import Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+import requests
+
+logger = logging.getLogger(__name__)
+
+VECTOR_FILE_PREFIX = "memory_vectors"
+DEFAULT_DIM = 256
+_INITIAL_CAPACITY = 1024
+
+
+class HashingEmbedder:
+    """本地字符n-gram哈希嵌入，无需模型和网络，适合中文短文本的近似召回"""
+
+    def __init__(self, dim: int = DEFAULT_DIM, ngram_range=(1, 3)):
+        self.dim = dim
+        self.ngram_range = ngram_range
+        self.name = f"hashing-{dim}"
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        lo, hi = self.ngram_range
+        for row, text in enumerate(texts):
+            text = text.casefold()
+            for n in range(lo, hi + 1):
+                for i in range(len(text) - n + 1):
+                    h = zlib.crc32(text[i:i + n].encode('utf-8'))  # 稳定哈希，不受进程随机盐影响
+                    vectors[row, h % self.dim] += 1.0 if h & 0x80000000 else -1.0
+        return _normalize(vectors)
+
+
+class APIEmbedder:
+    """OpenAI兼容 /embeddings 接口的嵌入器"""
+
+    def __init__(self, base_url: str, api_key: str, model: str, batch_size: int = 64, timeout: int = 10):
+        self.url = f"{base_url.rstrip('/')}/embeddings"
+        self.api_key = api_key
+        self.model = model
+        self.batch_size = batch_size
+        self.timeout = timeout
+        self.name = f"api-{model}"
+        self.dim = None  # 首次调用后确定
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        headers = {"Authorization": f"Bearer {self.api_key}", "Content-Type": "application/json"}
+        chunks = []
+        for i in range(0, len(texts), self.batch_size):
+            body = {"model": self.model, "input": list(texts[i:i + self.batch_size])}
+            response = requests.post(self.url, headers=headers, json=body, timeout=self.timeout)
+            response.raise_for_status()
+            data = sorted(response.json()["data"], key=lambda d: d["index"])
+            chunks.append(np.asarray([d["embedding"] for d in data], dtype=np.float32))
+        vectors = np.vstack(chunks) if chunks else np.zeros((0, self.dim or 0), dtype=np.float32)
+        self.dim = vectors.shape[1] if len(vectors) else self.dim
+        return _normalize(vectors)
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+class VectorIndex:
+    """内存映射向量文件 + JSONL元数据的增量向量索引"""
+
+    def __init__(self, embedder, prefix: str = VECTOR_FILE_PREFIX):
+        self.embedder = embedder
+        self.vector_path = f"{prefix}.f32"
+        self.meta_path = f"{prefix}.jsonl"
+        self.header_path = f"{prefix}.json"
+        self._lock = threading.RLock()
+        self._dim: Optional[int] = None
+        self._matrix: Optional[np.memmap] = None
+        self._capacity = 0
+        self._metadata: List[Dict] = []
+        self._texts = set()
+        self._load()
+
+    # --- 持久化 ---
+    def _load(self):
+        try:
+            with open(self.header_path, 'r', encoding='utf-8') as f:
+                header = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return
+        if header.get("embedder") != self.embedder.name:
+            logger.warning(f"嵌入模型已变化({header.get('embedder')} -> {self.embedder.name})，重建向量索引")
+            self._remove_files()
+            return
+        self._dim = header["dim"]
+        metadata = []
+        if os.path.exists(self.meta_path):
+            with open(self.meta_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    if not line.endswith('\n'):
+                        break  # 未写完的元数据行
+                    metadata.append(json.loads(line))
+        rows = os.path.getsize(self.vector_path) // (4 * self._dim) if os.path.exists(self.vector_path) else 0
+        self._metadata = metadata[:rows]  # 向量先于元数据写入，以两者较小者为准
+        self._texts = {m["text"] for m in self._metadata}
+        if rows:
+            self._open_matrix(rows)
+        logger.info(f"向量索引已加载: {len(self._metadata)} 条")
+
+    def _remove_files(self):
+        for path in (self.vector_path, self.meta_path, self.header_path):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def _open_matrix(self, capacity: int):
+        self._matrix = np.memmap(self.vector_path, dtype=np.float32, mode='r+', shape=(capacity, self._dim))
+        self._capacity = capacity
+
+    def _grow(self, needed: int):
+        if needed <= self._capacity:
+            return
+        capacity = max(_INITIAL_CAPACITY, self._capacity)
+        while capacity < needed:
+            capacity *= 2
+        if self._matrix is not None:
+            self._matrix.flush()
+            self._matrix = None
+        with open(self.vector_path, 'ab') as f:
+            f.truncate(capacity * self._dim * 4)
+        self._open_matrix(capacity)
+
+    # --- 写入 ---
+    def add(self, texts: Iterable[str], kind: str = "triple") -> int:
+        """嵌入并追加文本，已存在的文本跳过，返回新增数量"""
+        with self._lock:
+            pending = []
+            seen = set()
+            for text in texts:
+                text = text.strip() if isinstance(text, str) else ""
+                if text and text not in self._texts and text not in seen:
+                    seen.add(text)
+                    pending.append(text)
+        if not pending:
+            return 0
+        vectors = self.embedder.embed(pending)  # 嵌入（可能是网络请求）不持有锁
+        with self._lock:
+            keep = [i for i, text in enumerate(pending) if text not in self._texts]  # 排除并发写入的相同文本
+            if len(keep) < len(pending):
+                pending = [pending[i] for i in keep]
+                vectors = vectors[keep]
+                if not pending:
+                    return 0
+            if self._dim is None:
+                self._dim = vectors.shape[1]
+                with open(self.header_path, 'w', encoding='utf-8') as f:
+                    json.dump({"dim": self._dim, "embedder": self.embedder.name}, f)
+            start = len(self._metadata)
+            self._grow(start + len(pending))
+            self._matrix[start:start + len(pending)] = vectors
+            self._matrix.flush()
+            with open(self.meta_path, 'a', encoding='utf-8') as f:
+                for text in pending:
+                    f.write(json.dumps({"text": text, "kind": kind}, ensure_ascii=False) + '\n')
+            for text in pending:
+                self._metadata.append({"text": text, "kind": kind})
+                self._texts.add(text)
+        return len(pending)
+
+    # --- 检索 ---
+    def search(self, query: str, k: int = 3, min_score: float = 0.0) -> List[Dict]:
+        """按余弦相似度返回top-k，结果包含text/kind/score"""
+        with self._lock:
+            count = len(self._metadata)
+        if not count or not query:
+            return []
+        q = self.embedder.embed([query])[0]
+        with self._lock:
+            scores = np.asarray(self._matrix[:count]) @ q
+            k = min(k, count)
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+            return [
+                {**self._metadata[i], "score": float(scores[i])}
+                for i in top if scores[i] > min_score
+            ]
+
+    def __len__(self) -> int:
+        return len(self._metadata)
+
+
+def create_embedder(model: str = "", base_url: str = "", api_key: str = ""):
+    """配置了嵌入模型时使用API，否则使用本地哈希嵌入"""
+    if model:
+        return APIEmbedder(base_url, api_key, model)
+    return HashingEmbedder()
+
+
+def triple_to_text(triple) -> str:
+    head, rel, tail = triple
+    return f"{head} {rel} {tail}"
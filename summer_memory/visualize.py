@@ -1,63 +1,196 @@
-from pyvis.network import Network
+import json
+import os
 import webbrowser
-import matplotlib.pyplot as plt
-from .graph import get_all_triples
+from collections import Counter, deque
+from typing import Iterable, List, Optional, Tuple
+from .graph import get_local_graph
 import logging
 
 logger = logging.getLogger(__name__)
 
-def visualize_triples():
+Triple = Tuple[str, str, str]
+
+GRAPH_HTML = "graph.html"
+LARGE_GRAPH_EDGES = 2000  # 超过该边数时关闭边标签和曲线，缩短布局时间
+
+# 静态页面只负责渲染，数据放在同名 _data.js 中按行追加（file:// 下也可通过<script>加载）
+HTML_TEMPLATE = """<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>知识图谱</title>
+<script src="https://unpkg.com/vis-network@9.1.9/standalone/umd/vis-network.min.js"></script>
+<style>html, body, #graph { margin: 0; width: 100%; height: 100%; }</style>
+</head>
+<body>
+<div id="graph"></div>
+<script>var GRAPH_EDGES = [];</script>
+<script src="__DATA_FILE__"></script>
+<script>
+(function () {
+  var nodes = new vis.DataSet(), edges = [], seen = {};
+  GRAPH_EDGES.forEach(function (e, i) {
+    [[e[0], '#FFAA00'], [e[2], '#00AAFF']].forEach(function (n) {
+      if (!seen[n[0]]) { seen[n[0]] = 1; nodes.add({id: n[0], label: n[0], color: n[1]}); }
+    });
+    edges.push({id: i, from: e[0], to: e[2], label: e[1], arrows: 'to'});
+  });
+  var large = edges.length > __LARGE_GRAPH_EDGES__;
+  var network = new vis.Network(document.getElementById('graph'), {nodes: nodes, edges: new vis.DataSet(edges)}, {
+    layout: {improvedLayout: !large},
+    nodes: {font: {size: 24}},
+    edges: {length: 120, font: {size: large ? 0 : 20}, smooth: !large},
+    physics: {
+      solver: 'barnesHut',
+      barnesHut: {gravitationalConstant: -8000, springLength: 100, springConstant: 0.04},
+      minVelocity: 0.75,
+      stabilization: {iterations: large ? 100 : 300}
+    }
+  });
+  network.once('stabilizationIterationsDone', function () { network.setOptions({physics: false}); });
+})();
+</script>
+</body>
+</html>
+"""
+
+
+def _is_valid(triple) -> bool:
+    return isinstance(triple, tuple) and len(triple) == 3 and all(isinstance(x, str) and x.strip() for x in triple)
+
+
+def _data_line(triple: Triple) -> str:
+    return f"GRAPH_EDGES.push({json.dumps(list(triple), ensure_ascii=False, separators=(',', ':'))});\n"
+
+
+def _data_path(output: str) -> str:
+    return os.path.splitext(output)[0] + "_data.js"
+
+
+def _state_path(output: str) -> str:
+    return output + ".state.json"
+
+
+def _write_html(output: str):
+    html = HTML_TEMPLATE.replace("__DATA_FILE__", os.path.basename(_data_path(output)))
+    html = html.replace("__LARGE_GRAPH_EDGES__", str(LARGE_GRAPH_EDGES))
+    with open(output, 'w', encoding='utf-8') as f:
+        f.write(html)
+
+
+def sample_by_degree(triples: Iterable[Triple], max_nodes: int) -> List[Triple]:
+    """保留度数最高的max_nodes个节点及其之间的边"""
+    triples = list(triples)
+    degree = Counter()
+    for head, _, tail in triples:
+        degree[head] += 1
+        degree[tail] += 1
+    keep = {node for node, _ in degree.most_common(max_nodes)}
+    return [t for t in triples if t[0] in keep and t[2] in keep]
+
+
+def k_hop_subgraph(entity: str, hops: int = 2, max_edges: int = LARGE_GRAPH_EDGES) -> List[Triple]:
+    """以entity为中心广度优先提取hops跳内的子图"""
+    index = get_local_graph()
+    seen_nodes = {entity}
+    seen_edges = set()
+    result = []
+    frontier = deque([(entity, 0)])
+    while frontier and len(result) < max_edges:
+        node, depth = frontier.popleft()
+        if depth >= hops:
+            continue
+        for triple in index.neighbors(node):
+            if triple not in seen_edges:
+                seen_edges.add(triple)
+                result.append(triple)
+                if len(result) >= max_edges:
+                    break
+            for other in (triple[0], triple[2]):
+                if other not in seen_nodes:
+                    seen_nodes.add(other)
+                    frontier.append((other, depth + 1))
+    return result
+
+
+def _render_view(triples: List[Triple], output: str) -> int:
+    """写出子图/采样视图的完整数据文件"""
+    with open(_data_path(output), 'w', encoding='utf-8') as f:
+        f.writelines(_data_line(t) for t in triples if _is_valid(t))
+    _write_html(output)
+    try:
+        os.remove(_state_path(output))  # 视图覆盖了全图数据，下次全图渲染需重写
+    except OSError:
+        pass
+    return len(triples)
+
+
+def _render_incremental(output: str) -> Tuple[int, int]:
+    """全图增量渲染：只把上次渲染之后新增的边追加到数据文件，返回 (总边数, 本次追加数)"""
+    index = get_local_graph()
+    total = len(index)
+    state = {}
+    try:
+        with open(_state_path(output), 'r', encoding='utf-8') as f:
+            state = json.load(f)
+    except (OSError, json.JSONDecodeError):
+        pass
+
+    rendered = state.get("edges", 0)
+    resumable = (
+        0 < rendered <= total
+        and os.path.exists(_data_path(output))
+        and os.path.exists(output)
+        and list(index.edges(rendered - 1)[0]) == state.get("last")
+    )
+    start = rendered if resumable else 0
+    new_edges = index.edges(start)
+    with open(_data_path(output), 'a' if resumable else 'w', encoding='utf-8') as f:
+        f.writelines(_data_line(t) for t in new_edges if _is_valid(t))
+    if not resumable:
+        _write_html(output)
+    if total:
+        with open(_state_path(output), 'w', encoding='utf-8') as f:
+            json.dump({"edges": total, "last": list(index.edges(total - 1)[0])}, f, ensure_ascii=False)
+    return total, len(new_edges)
+
+
+def visualize_triples(query_entity: Optional[str] = None, hops: int = 2, max_nodes: Optional[int] = None,
+                      output: str = GRAPH_HTML, open_browser: bool = True):
     """
-    直接从 Neo4j 数据库中读取所有三元组，并生成可视化图谱 graph.html
+    生成知识图谱可视化页面 graph.html
+    - 默认渲染全图，增量追加上次渲染后新增的三元组
+    - query_entity: 只渲染该实体hops跳内的子图
+    - max_nodes: 按度数采样，只保留度数最高的节点
     """
     try:
-        triples = get_all_triples()
-        if not triples:
-            logger.warning("从数据库中未获取到任何三元组，无法生成可视化图谱")
+        if query_entity:
+            triples = k_hop_subgraph(query_entity, hops)
+            if max_nodes:
+                triples = sample_by_degree(triples, max_nodes)
+            count = _render_view(triples, output)
+            logger.info(f"已生成实体 {query_entity} 的 {hops} 跳子图，共 {count} 条三元组")
+        elif max_nodes:
+            triples = sample_by_degree(get_local_graph().edges(), max_nodes)
+            count = _render_view(triples, output)
+            logger.info(f"已按度数采样 {max_nodes} 个节点，共 {count} 条三元组")
+        else:
+            count, appended = _render_incremental(output)
+            logger.info(f"知识图谱共 {count} 条三元组，本次追加 {appended} 条")
+
+        if not count:
+            logger.warning("未获取到任何三元组，无法生成可视化图谱")
             print("未获取到任何三元组，无法生成图谱。")
             return
-        
-        logger.info(f"从数据库获取到 {len(triples)} 条三元组进行可视化")
-
-        # 过滤非法三元组
-        triples = [
-            t for t in triples
-            if isinstance(t, tuple) and len(t) == 3 and all(isinstance(x, str) and x.strip() for x in t)
-        ]
-        
-        net = Network(height='1600px', width='100%', notebook=False)
-        net.use_template = False
-        net.barnes_hut()
-        net.set_options("""
-        var options = {
-          "physics": {
-            "barnesHut": {
-              "gravitationalConstant": -8000,
-              "springLength": 100,
-              "springConstant": 0.04
-            },
-            "minVelocity": 0.75
-          }
-        }
-        """)
-
-        added_nodes = set()
-        for head, rel, tail in triples:
-            for node, color in [(head, '#FFAA00'), (tail, '#00AAFF')]:
-                if node not in added_nodes:
-                    net.add_node(node, label=node, color=color, font={'size': 24})
-                    added_nodes.add(node)
-            net.add_edge(head, tail, label=rel, length=120, font={'size': 20})
-
-        net.write_html("graph.html")
-
-        try:
-            webbrowser.open("graph.html")
-        except Exception as e:
-            print(f"无法自动打开浏览器：{e}")
-
-        print("知识图谱已生成：graph.html，请手动打开查看。")
-        logger.info("知识图谱可视化完成，文件 graph.html 已生成")
+
+        if open_browser:
+            try:
+                webbrowser.open(output)
+            except Exception as e:
+                print(f"无法自动打开浏览器：{e}")
+
+        print(f"知识图谱已生成：{output}，请手动打开查看。")
+        logger.info(f"知识图谱可视化完成，文件 {output} 已生成")
 
     except Exception as e:
         logger.error(f"可视化三元组失败: {e}")
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+工具结果缓存测试脚本
+用一个mcp类型的文档服务验证：cacheable工具的结果被缓存，声明mutating的工具调用后缓存失效
+"""
+
+import asyncio
+import os
+import sys
+import tempfile
+sys.path.append(os.path.dirname(__file__))
+
+from mcpserver.mcp_manager import MCPManager
+from mcpserver.mcp_registry import MCP_REGISTRY, MANIFEST_CACHE
+
+SERVICE_NAME = "test-word-document"
+
+MANIFEST = {
+    "name": SERVICE_NAME,
+    "agentType": "mcp",
+    "capabilities": {
+        "invocationCommands": [
+            {"command": "get_document_text", "aliases": ["read_text"], "cacheable": True, "ttl": 600, "fileArgs": ["filename"]},
+            {"command": "get_document_info"},
+            {"command": "add_paragraph", "mutating": True}
+        ]
+    }
+}
+
+class FakeWordAgent:
+    """记录调用次数的文档服务；add_paragraph不改动文件，失效只能来自mutating声明"""
+
+    def __init__(self):
+        self.reads = 0
+        self.paragraphs = []
+
+    def get_document_text(self, filename):
+        self.reads += 1
+        return "\n".join(self.paragraphs)
+
+    def read_text(self, filename):
+        return self.get_document_text(filename)
+
+    def get_document_info(self, filename):
+        return f"{len(self.paragraphs)} paragraphs"
+
+    def add_paragraph(self, filename, text):
+        self.paragraphs.append(text)
+        return "ok"
+
+def _register():
+    agent = FakeWordAgent()
+    MANIFEST_CACHE[SERVICE_NAME] = MANIFEST
+    MCP_REGISTRY.register(SERVICE_NAME, MANIFEST)
+    MCP_REGISTRY[SERVICE_NAME] = agent
+    return agent
+
+def _unregister():
+    MANIFEST_CACHE.pop(SERVICE_NAME, None)
+    if SERVICE_NAME in MCP_REGISTRY:
+        del MCP_REGISTRY[SERVICE_NAME]
+
+def test_mutating_tool_invalidates_cached_read():
+    """get_document_text命中缓存，add_paragraph（mutating）调用后重新读取"""
+    agent = _register()
+    manager = MCPManager()
+    with tempfile.NamedTemporaryFile(suffix=".docx", delete=False) as f:
+        filename = f.name
+    try:
+        async def scenario():
+            assert await manager.unified_call(SERVICE_NAME, "add_paragraph", {"filename": filename, "text": "第一段"}) == "ok"
+            assert await manager.unified_call(SERVICE_NAME, "get_document_text", {"filename": filename}) == "第一段"
+            assert await manager.unified_call(SERVICE_NAME, "get_document_text", {"filename": filename}) == "第一段"
+            assert agent.reads == 1  # 第二次命中缓存
+
+            # 别名解析到同一缓存项；未声明mutating的工具不清除缓存
+            assert await manager.unified_call(SERVICE_NAME, "read_text", {"filename": filename}) == "第一段"
+            assert await manager.unified_call(SERVICE_NAME, "get_document_info", {"filename": filename}) == "1 paragraphs"
+            assert await manager.unified_call(SERVICE_NAME, "get_document_text", {"filename": filename}) == "第一段"
+            assert agent.reads == 1
+
+            assert await manager.unified_call(SERVICE_NAME, "add_paragraph", {"filename": filename, "text": "第二段"}) == "ok"
+            assert await manager.unified_call(SERVICE_NAME, "get_document_text", {"filename": filename}) == "第一段\n第二段"
+            assert agent.reads == 2  # mutating调用后缓存失效
+
+        asyncio.run(scenario())
+        stats = manager.get_tool_call_stats()["tools"][f"{SERVICE_NAME}.get_document_text"]
+        assert stats["cache_hits"] == 3
+    finally:
+        _unregister()
+        os.unlink(filename)
+
+if __name__ == "__main__":
+    test_mutating_tool_invalidates_cached_read()
+    print("✅ 工具结果缓存测试完成！")
@@ -165,13 +165,21 @@ class TreeThinkingEngine:
         # 创建任务批次
         task_batch = TaskBatch(self.thread_pool)
         
+        # 获取相关记忆（如果有记忆管理器），各路线共用一次召回结果
+        related_memories = []
+        if self.memory_manager:
+            try:
+                related_memories = await self.memory_manager.recall_memory_async(question, k=3)
+            except Exception as e:
+                logger.warning(f"获取相关记忆失败: {e}")
+        
         # 为每个思考路线创建任务
         for i in range(routes_count):
             temperature = temperatures[i]
             branch_type = branch_types[i]
             
             # 根据分支类型调整提示词
-            thinking_prompt = self._create_thinking_prompt(question, branch_type, i+1, routes_count)
+            thinking_prompt = self._create_thinking_prompt(question, branch_type, i+1, routes_count, related_memories)
             
             # 添加API任务
             task_batch.add_api_task(
@@ -213,23 +221,19 @@ class TreeThinkingEngine:
             traceback.print_exc()
             return []
     
-    def _create_thinking_prompt(self, question: str, branch_type: str, route_num: int, total_routes: int) -> str:
+    def _create_thinking_prompt(self, question: str, branch_type: str, route_num: int, total_routes: int,
+                                related_memories: Optional[List[Dict]] = None) -> str:
         """创建思考提示词"""
         from .config import BRANCH_TYPES
         
         branch_description = BRANCH_TYPES.get(branch_type, "综合分析型")
         
-        # 获取相关记忆（如果有记忆管理器）
+        # 相关记忆由调用方异步召回后传入
         memory_context = ""
-        if self.memory_manager:
-            try:
-                related_memories = self.memory_manager.recall_memory(question, k=3)
-                if related_memories:
-                    memory_context = f"\n相关记忆参考：\n"
-                    for memory in related_memories:
-                        memory_context += f"- {memory.get('text', '')[:100]}...\n"
-            except Exception as e:
-                logger.warning(f"获取相关记忆失败: {e}")
+        if related_memories:
+            memory_context = f"\n相关记忆参考：\n"
+            for memory in related_memories:
+                memory_context += f"- {memory.get('text', '')[:100]}...\n"
         
         prompt = f"""
 作为{branch_description}思考者，请深入分析以下问题（第{route_num}/{total_routes}路思考）：
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+TTS服务并发压测脚本
+同时发出多个 /v1/audio/speech 请求，统计吞吐量、首字节时间和完整响应时间
+"""
+import sys
+import os
+import argparse
+import asyncio
+import time
+
+import aiohttp
+
+# 添加项目根目录到路径
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+from config import config
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+async def one_request(session, url, payload, headers, semaphore, results):
+    """发出一个请求，记录首字节时间、总耗时和音频字节数"""
+    async with semaphore:
+        started = time.perf_counter()
+        ttfb = None
+        size = 0
+        try:
+            async with session.post(url, json=payload, headers=headers) as response:
+                if response.status != 200:
+                    results["errors"].append(f"{response.status} {(await response.text())[:200]}")
+                    return
+                async for data in response.content.iter_any():
+                    if ttfb is None:
+                        ttfb = time.perf_counter() - started
+                    size += len(data)
+        except Exception as e:
+            results["errors"].append(str(e))
+            return
+        results["ttfb"].append(ttfb or 0.0)
+        results["total"].append(time.perf_counter() - started)
+        results["bytes"] += size
+
+async def run_benchmark(url, requests, concurrency, text, voice, response_format, speed, timeout):
+    headers = {"Authorization": f"Bearer {config.tts.api_key}"} if config.tts.require_api_key else {}
+    payload = {"input": text, "voice": voice, "response_format": response_format, "speed": speed}
+    results = {"ttfb": [], "total": [], "bytes": 0, "errors": []}
+    semaphore = asyncio.Semaphore(concurrency)
+    async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=timeout)) as session:
+        started = time.perf_counter()
+        await asyncio.gather(*[
+            one_request(session, url, payload, headers, semaphore, results) for _ in range(requests)
+        ])
+        elapsed = time.perf_counter() - started
+    return results, elapsed
+
+def main():
+    parser = argparse.ArgumentParser(description="TTS服务并发压测")
+    parser.add_argument("--url", default=f"http://127.0.0.1:{config.tts.port}/v1/audio/speech", help="TTS接口地址")
+    parser.add_argument("-n", "--requests", type=int, default=20, help="请求总数")
+    parser.add_argument("-c", "--concurrency", type=int, default=10, help="并发数")
+    parser.add_argument("--text", default="你好，这是一段用于测试语音合成并发性能的文本。", help="合成文本")
+    parser.add_argument("--voice", default=config.tts.default_voice, help="语音")
+    parser.add_argument("--format", default=config.tts.default_format, help="音频格式")
+    parser.add_argument("--speed", type=float, default=config.tts.default_speed, help="语速")
+    parser.add_argument("--timeout", type=float, default=120, help="单个请求超时（秒）")
+    args = parser.parse_args()
+
+    results, elapsed = asyncio.run(run_benchmark(
+        args.url, args.requests, args.concurrency, args.text, args.voice, args.format, args.speed, args.timeout
+    ))
+    succeeded = len(results["total"])
+
+    print("=" * 50)
+    print(f"📋 {args.requests}个请求，并发{args.concurrency}，格式{args.format}")
+    print(f"   成功: {succeeded}  失败: {len(results['errors'])}")
+    print(f"   总耗时: {elapsed:.2f}s")
+    print(f"   吞吐量: {succeeded / elapsed:.2f} 请求/秒，{results['bytes'] / 1024 / elapsed:.1f} KB/秒")
+    if succeeded:
+        print(f"   首字节时间: p50 {percentile(results['ttfb'], 50) * 1000:.0f}ms  p95 {percentile(results['ttfb'], 95) * 1000:.0f}ms")
+        print(f"   完整响应时间: p50 {percentile(results['total'], 50) * 1000:.0f}ms  p95 {percentile(results['total'], 95) * 1000:.0f}ms")
+    for message in results["errors"][:5]:
+        print(f"   ❌ {message}")
+    print("=" * 50)
+
+if __name__ == "__main__":
+    main()
@@ -1,20 +1,22 @@
 import sys, os
 sys.path.append(os.path.dirname(os.path.dirname(__file__)))  # 加入项目根目录到模块查找路径
 # server.py
+import asyncio
 import base64
+import tempfile
 import librosa
-from flask import Flask, request, send_file, jsonify
-from gevent.pywsgi import WSGIServer
-import os
-from flask_cors import CORS
+import uvicorn
+from fastapi import Depends, FastAPI, HTTPException, Request
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, StreamingResponse
 
 from handle_text import prepare_tts_input_with_context
-from tts_handler import generate_speech, get_models, get_voices
+from tts_handler import stream_speech, synthesize_speech, get_models, list_voices as list_edge_voices
 from utils import require_api_key, AUDIO_FORMAT_MIME_TYPES
 from config import config # 统一配置系统
 
-app = Flask(__name__)
-CORS(app, resources={r"/*": {"origins": "*"}})
+app = FastAPI()
+app.add_middleware(CORSMiddleware, allow_origins=["*"], allow_methods=["*"], allow_headers=["*"])
 
 API_KEY = config.tts.api_key
 PORT = config.tts.port
@@ -26,14 +28,55 @@ REMOVE_FILTER = config.tts.remove_filter
 EXPAND_API = config.tts.expand_api
 
 
-@app.route('/v1/audio/speech', methods=['POST'])
-@app.route('/audio/speech', methods=['POST'])  # 增加别名接口
-@require_api_key
+@app.exception_handler(HTTPException)
+async def http_error_handler(request: Request, exc: HTTPException):
+    # 保持原接口的 {"error": ...} 错误格式
+    return JSONResponse({"error": exc.detail}, status_code=exc.status_code)
+
+def error(message, status_code):
+    return JSONResponse({"error": message}, status_code=status_code)
+
+async def read_json(request: Request):
+    """解析JSON请求体，无效时返回None"""
+    try:
+        return await request.json()
+    except Exception:
+        return None
+
+async def speech_response(text, voice, response_format, speed, download_name):
+    """边合成边返回音频
+
+    先取到第一块数据再发送响应头：合成失败（语音名错误、网络异常等）仍能返回500，
+    之后的数据块收到即写给客户端，首字节时间只取决于edge-tts的第一块音频。
+    """
+    chunks = stream_speech(text, voice, response_format, speed)
+    try:
+        first = await chunks.__anext__()
+    except StopAsyncIteration:
+        return error("TTS生成失败: 未生成音频数据", 500)
+    except Exception as e:
+        return error(f"TTS生成失败: {str(e)}", 500)
+
+    async def body():
+        try:
+            yield first
+            async for data in chunks:
+                yield data
+        finally:
+            await chunks.aclose()  # 客户端断开时立即结束合成和FFmpeg子进程
+
+    mime_type = AUDIO_FORMAT_MIME_TYPES.get(response_format, "audio/mpeg")
+    headers = {"Content-Disposition": f'attachment; filename="{download_name}"'}
+    return StreamingResponse(body(), media_type=mime_type, headers=headers)
+
+
+@app.post('/v1/audio/speech', dependencies=[Depends(require_api_key)])
+@app.post('/audio/speech', dependencies=[Depends(require_api_key)])  # 增加别名接口
 # 文本转语音主接口
-def text_to_speech():
-    data = request.json
+async def text_to_speech(request: Request):
+    data = await read_json(request)
     if not data or 'input' not in data:
-        return jsonify({"error": "请求体缺少 'input' 字段"}), 400
+        return error("请求体缺少 'input' 字段", 400)
 
     text = data.get('input')
 
@@ -45,41 +88,33 @@ def text_to_speech():
 
     response_format = data.get('response_format', DEFAULT_RESPONSE_FORMAT)
     speed = float(data.get('speed', DEFAULT_SPEED))
-    
-    mime_type = AUDIO_FORMAT_MIME_TYPES.get(response_format, "audio/mpeg")
-
-    # 生成音频文件
-    output_file_path = generate_speech(text, voice, response_format, speed)
 
-    # 返回音频文件，设置正确的MIME类型
-    return send_file(output_file_path, mimetype=mime_type, as_attachment=True, download_name=f"speech.{response_format}")
+    # 流式返回音频，设置正确的MIME类型
+    return await speech_response(text, voice, response_format, speed, f"speech.{response_format}")
 
-@app.route('/v1/models', methods=['GET', 'POST'])
-@app.route('/models', methods=['GET', 'POST'])
-@require_api_key
+@app.api_route('/v1/models', methods=['GET', 'POST'], dependencies=[Depends(require_api_key)])
+@app.api_route('/models', methods=['GET', 'POST'], dependencies=[Depends(require_api_key)])
 # 获取模型列表
-def list_models():
-    return jsonify({"data": get_models()})
+async def list_models():
+    return {"data": get_models()}
 
-@app.route('/v1/voices', methods=['GET', 'POST'])
-@app.route('/voices', methods=['GET', 'POST'])
-@require_api_key
+@app.api_route('/v1/voices', methods=['GET', 'POST'], dependencies=[Depends(require_api_key)])
+@app.api_route('/voices', methods=['GET', 'POST'], dependencies=[Depends(require_api_key)])
 # 获取语音列表（可按语言过滤）
-def list_voices():
+async def list_voices(request: Request):
     specific_language = None
 
-    data = request.args if request.method == 'GET' else request.json
+    data = request.query_params if request.method == 'GET' else await read_json(request)
     if data and ('language' in data or 'locale' in data):
         specific_language = data.get('language') if 'language' in data else data.get('locale')
 
-    return jsonify({"voices": get_voices(specific_language)})
+    return {"voices": await list_edge_voices(specific_language)}
 
-@app.route('/v1/voices/all', methods=['GET', 'POST'])
-@app.route('/voices/all', methods=['GET', 'POST'])
-@require_api_key
+@app.api_route('/v1/voices/all', methods=['GET', 'POST'], dependencies=[Depends(require_api_key)])
+@app.api_route('/voices/all', methods=['GET', 'POST'], dependencies=[Depends(require_api_key)])
 # 获取所有语音
-def list_all_voices():
-    return jsonify({"voices": get_voices('all')})
+async def list_all_voices():
+    return {"voices": await list_edge_voices('all')}
 
 """
 Support for ElevenLabs and Azure AI Speech
@@ -88,20 +123,18 @@ Support for ElevenLabs and Azure AI Speech
 
 # http://localhost:5050/elevenlabs/v1/text-to-speech
 # http://localhost:5050/elevenlabs/v1/text-to-speech/en-US-AndrewNeural
-@app.route('/elevenlabs/v1/text-to-speech/<voice_id>', methods=['POST'])
-@require_api_key
+@app.post('/elevenlabs/v1/text-to-speech/{voice_id}', dependencies=[Depends(require_api_key)])
 # ElevenLabs风格TTS接口
-def elevenlabs_tts(voice_id):
+async def elevenlabs_tts(voice_id: str, request: Request):
     if not EXPAND_API:
-        return jsonify({"error": f"Endpoint not allowed"}), 500
-    
+        return error("Endpoint not allowed", 500)
+
     # 解析JSON请求体
-    try:
-        payload = request.json
-        if not payload or 'text' not in payload:
-            return jsonify({"error": "请求体缺少 'text' 字段"}), 400
-    except Exception as e:
-        return jsonify({"error": f"无效的JSON请求体: {str(e)}"}), 400
+    payload = await read_json(request)
+    if not isinstance(payload, dict):
+        return error("无效的JSON请求体", 400)
+    if 'text' not in payload:
+        return error("请求体缺少 'text' 字段", 400)
 
     text = payload['text']
 
@@ -111,33 +144,24 @@ def elevenlabs_tts(voice_id):
     voice = voice_id  # ElevenLabs用URL中的voice_id
 
     # 使用edge-tts默认设置
-    response_format = 'mp3'
     speed = DEFAULT_SPEED  # 可选自定义
 
-    # 生成语音
-    try:
-        output_file_path = generate_speech(text, voice, response_format, speed)
-    except Exception as e:
-        return jsonify({"error": f"TTS生成失败: {str(e)}"}), 500
-
-    # 返回生成的音频文件
-    return send_file(output_file_path, mimetype="audio/mpeg", as_attachment=True, download_name="speech.mp3")
+    return await speech_response(text, voice, 'mp3', speed, "speech.mp3")
 
 # tts.speech.microsoft.com/cognitiveservices/v1
 # https://{region}.tts.speech.microsoft.com/cognitiveservices/v1
 # http://localhost:5050/azure/cognitiveservices/v1
-@app.route('/azure/cognitiveservices/v1', methods=['POST'])
-@require_api_key
+@app.post('/azure/cognitiveservices/v1', dependencies=[Depends(require_api_key)])
 # Azure风格TTS接口
-def azure_tts():
+async def azure_tts(request: Request):
     if not EXPAND_API:
-        return jsonify({"error": f"Endpoint not allowed"}), 500
-    
+        return error("Endpoint not allowed", 500)
+
     # 解析SSML请求体
     try:
-        ssml_data = request.data.decode('utf-8')
+        ssml_data = (await request.body()).decode('utf-8')
         if not ssml_data:
-            return jsonify({"error": "缺少SSML请求体"}), 400
+            return error("缺少SSML请求体", 400)
 
         # 从SSML中提取文本和voice
         from xml.etree import ElementTree as ET
@@ -145,34 +169,33 @@ def azure_tts():
         text = root.find('.//{http://www.w3.org/2001/10/synthesis}voice').text
         voice = root.find('.//{http://www.w3.org/2001/10/synthesis}voice').get('name')
     except Exception as e:
-        return jsonify({"error": f"无效的SSML请求体: {str(e)}"}), 400
+        return error(f"无效的SSML请求体: {str(e)}", 400)
 
     # 使用edge-tts默认设置
-    response_format = 'mp3'
     speed = DEFAULT_SPEED
 
     if not REMOVE_FILTER:
         text = prepare_tts_input_with_context(text)
 
-    # 生成语音
-    try:
-        output_file_path = generate_speech(text, voice, response_format, speed)
-    except Exception as e:
-        return jsonify({"error": f"TTS生成失败: {str(e)}"}), 500
+    return await speech_response(text, voice, 'mp3', speed, "speech.mp3")
 
-    # 返回生成的音频文件
-    return send_file(output_file_path, mimetype="audio/mpeg", as_attachment=True, download_name="speech.mp3")
-@app.route('/', methods=['GET'])
+@app.get('/')
 # 测试接口
-def azure_tts_test():
-    return jsonify({"status": "success"})
+async def azure_tts_test():
+    return {"status": "success"}
 
-@app.route('/genVoice', methods=['POST'])
+def save_and_measure(audio_data, response_format):
+    """写出音频文件并计算时长（librosa解码较慢，在线程池中执行）"""
+    with tempfile.NamedTemporaryFile(delete=False, suffix=f".{response_format}") as f:
+        f.write(audio_data)
+    return f.name, librosa.get_duration(path=f.name)
+
+@app.post('/genVoice')
 # 兼容旧版的genVoice接口
-def genVoice():
-    data = request.json
+async def genVoice(request: Request):
+    data = await read_json(request)
     if not data or 'genText' not in data:
-        return jsonify({"error": "请求体缺少 'input' 字段"}), 400
+        return error("请求体缺少 'input' 字段", 400)
 
     text = data.get('genText')
 
@@ -185,23 +208,15 @@ def genVoice():
     response_format = data.get('response_format', DEFAULT_RESPONSE_FORMAT)
     speed = float(data.get('speed', DEFAULT_SPEED))
 
-    mime_type = AUDIO_FORMAT_MIME_TYPES.get(response_format, "audio/mpeg")
-
-    # 生成音频文件
-    output_file_path = generate_speech(text, voice, response_format, speed)
-
-    duration = librosa.get_duration(path=output_file_path)
-
-    with open(output_file_path, "rb") as f:
-        audio_data = f.read()
-        audio_base64 = base64.b64encode(audio_data).decode("utf-8")
-        f.close()
-    # os.remove(output_file_path)
-    return {"status": "success", "content": {"audio_base64": audio_base64,"duration":duration,"outputName":output_file_path.split('/')[-1]}}
+    # 生成音频数据
+    try:
+        audio_data = await synthesize_speech(text, voice, response_format, speed)
+    except Exception as e:
+        return error(f"TTS生成失败: {str(e)}", 500)
 
-    # Return the file with the correct MIME type
-    # return send_file(output_file_path, mimetype=mime_type, as_attachment=True,
-    #                  download_name=f"speech.{response_format}")
+    output_file_path, duration = await asyncio.to_thread(save_and_measure, audio_data, response_format)
+    audio_base64 = base64.b64encode(audio_data).decode("utf-8")
+    return {"status": "success", "content": {"audio_base64": audio_base64, "duration": duration, "outputName": os.path.basename(output_file_path)}}
 
 
 print(f" Edge TTS (Free Azure TTS) Replacement for OpenAI's TTS API")  # 启动信息
@@ -212,5 +227,4 @@ print(f" * TTS Endpoint: http://127.0.0.1:{PORT}/v1/audio/speech")
 print(f" ")
 
 if __name__ == '__main__':
-    http_server = WSGIServer(('0.0.0.0', PORT), app)
-    http_server.serve_forever()
+    uvicorn.run(app, host='0.0.0.0', port=PORT)
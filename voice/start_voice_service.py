@@ -19,15 +19,14 @@ from config import config
 def start_http_server():
     """启动HTTP TTS服务器"""
     try:
+        import uvicorn
         from voice.server import app
-        from gevent.pywsgi import WSGIServer
         
         print(f"🚀 启动HTTP TTS服务器...")
         print(f"📍 地址: http://127.0.0.1:{config.tts.port}")
         print(f"🔑 API密钥: {'已启用' if config.tts.require_api_key else '已禁用'}")
         
-        http_server = WSGIServer(('0.0.0.0', config.tts.port), app)
-        http_server.serve_forever()
+        uvicorn.run(app, host="0.0.0.0", port=config.tts.port)
     except Exception as e:
         print(f"❌ HTTP服务器启动失败: {e}")
         return False
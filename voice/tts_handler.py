@@ -2,13 +2,13 @@ import sys, os
 sys.path.append(os.path.dirname(os.path.dirname(__file__)))  # 加入项目根目录到模块查找路径
 import edge_tts
 import asyncio
+import shutil
 import tempfile
-import subprocess
-import os
-from pathlib import Path
-import config # 顶部引入
+import time
+from typing import AsyncIterator, List, Optional
+from config import config # 统一配置
 
-# 语言默认值（环境变量）
+# 语言默认值
 DEFAULT_LANGUAGE = config.tts.default_language # 统一配置
 
 # OpenAI语音名与edge-tts语音名映射
@@ -21,79 +21,124 @@ voice_mapping = {
     'shimmer': 'en-US-EmmaNeural'
 }
 
-def is_ffmpeg_installed():
-    """检查FFmpeg是否已安装并可用。"""
-    try:
-        subprocess.run(['ffmpeg', '-version'], check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        return True
-    except (subprocess.CalledProcessError, FileNotFoundError):
-        return False
-
-def _generate_audio(text, voice, response_format, speed):
-    """生成TTS音频，并可选转换格式。"""
-    # 判断是否为OpenAI兼容语音名，否则直接用edge-tts语音名
-    edge_tts_voice = voice_mapping.get(voice, voice)  # 优先用映射，否则原样
+# 目标格式 -> (FFmpeg编码器, 输出容器)；输出写到管道，容器必须支持非seek输出
+FFMPEG_OUTPUTS = {
+    "aac": ("aac", "adts"),  # ADTS裸流，对应audio/aac，可直接流式输出
+    "mp3": ("libmp3lame", "mp3"),
+    "wav": ("pcm_s16le", "wav"),
+    "opus": ("libopus", "ogg"),
+    "flac": ("flac", "flac"),
+    "pcm": ("pcm_s16le", "s16le")
+}
 
-    # 先生成mp3格式的临时文件
-    temp_output_file = tempfile.NamedTemporaryFile(delete=False, suffix=".mp3")
+PIPE_READ_SIZE = 64 * 1024 # 从FFmpeg stdout每次读取的字节数
+VOICES_CACHE_TTL = 3600 # 语音列表缓存时间（秒）
 
-    # 转换速度为SSML rate格式
+_ffmpeg_available: Optional[bool] = None
+_voices_cache: Optional[List[dict]] = None
+_voices_cached_at = 0.0
+
+def is_ffmpeg_installed():
+    """检查FFmpeg是否已安装并可用（结果缓存，不在每个请求里起子进程探测）。"""
+    global _ffmpeg_available
+    if _ffmpeg_available is None:
+        _ffmpeg_available = shutil.which("ffmpeg") is not None
+    return _ffmpeg_available
+
+def _safe_rate(speed) -> str:
+    """转换速度为SSML rate格式，出错时用+0%"""
     try:
-        speed_rate = speed_to_rate(speed)  # 转换为+X%或-X%
+        return speed_to_rate(float(speed))  # 转换为+X%或-X%
     except Exception as e:
         print(f"速度转换出错: {e}，默认+0%。")
-        speed_rate = "+0%"
-
-    # 生成MP3文件
-    communicator = edge_tts.Communicate(text=text, voice=edge_tts_voice, rate=speed_rate)
-    asyncio.run(communicator.save(temp_output_file.name))
-
-    # 如果请求mp3格式，直接返回
-    if response_format == "mp3":
-        return temp_output_file.name
-
-    # 检查FFmpeg
-    if not is_ffmpeg_installed():
-        print("FFmpeg不可用，返回原始mp3文件。"); return temp_output_file.name
-
-    # 新建转换后输出文件
-    converted_output_file = tempfile.NamedTemporaryFile(delete=False, suffix=f".{response_format}")
-
-    # 构建FFmpeg命令
-    ffmpeg_command = [
-        "ffmpeg",
-        "-i", temp_output_file.name,  # 输入文件
-        "-c:a", {
-            "aac": "aac",
-            "mp3": "libmp3lame",
-            "wav": "pcm_s16le",
-            "opus": "libopus",
-            "flac": "flac"
-        }.get(response_format, "aac"),  # 默认aac
-        "-b:a", "192k" if response_format != "wav" else None,  # wav不需要码率
-        "-f", {
-            "aac": "mp4",  # AAC用MP4容器
-            "mp3": "mp3",
-            "wav": "wav",
-            "opus": "ogg",
-            "flac": "flac"
-        }.get(response_format, response_format),
-        "-y",  # 覆盖输出
-        converted_output_file.name
-    ]
+        return "+0%"
 
+async def stream_edge_audio(text, voice, speed=1.0) -> AsyncIterator[bytes]:
+    """逐块产出edge-tts合成的mp3数据，收到一块就交出一块"""
+    edge_tts_voice = voice_mapping.get(voice, voice)  # 优先用映射，否则原样
+    communicator = edge_tts.Communicate(text=text, voice=edge_tts_voice, rate=_safe_rate(speed))
+    async for chunk in communicator.stream():
+        if chunk["type"] == "audio" and chunk["data"]:
+            yield chunk["data"]
+
+async def _transcode(source: AsyncIterator[bytes], response_format: str) -> AsyncIterator[bytes]:
+    """把mp3数据块经管道送入FFmpeg子进程，边写边读出转换后的数据"""
+    codec, container = FFMPEG_OUTPUTS.get(response_format, FFMPEG_OUTPUTS["aac"])  # 默认aac
+    command = ["ffmpeg", "-hide_banner", "-loglevel", "error", "-f", "mp3", "-i", "pipe:0", "-c:a", codec]
+    if codec not in ("pcm_s16le", "flac"):
+        command += ["-b:a", "192k"]  # 无损格式不需要码率
+    command += ["-f", container, "pipe:1"]
+
+    process = await asyncio.create_subprocess_exec(
+        *command,
+        stdin=asyncio.subprocess.PIPE,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE
+    )
+
+    async def feed():
+        try:
+            async for data in source:
+                process.stdin.write(data)
+                await process.stdin.drain()
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # FFmpeg提前退出，错误由返回码报告
+        finally:
+            try:
+                process.stdin.close()
+            except Exception:
+                pass
+
+    feeder = asyncio.create_task(feed())
+    stderr_reader = asyncio.create_task(process.stderr.read())  # 并发读取，避免stderr写满阻塞FFmpeg
     try:
-        subprocess.run(ffmpeg_command, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-    except subprocess.CalledProcessError as e:
-        raise RuntimeError(f"FFmpeg音频转换出错: {e}")
-
-    # 删除原始临时文件
-    Path(temp_output_file.name).unlink(missing_ok=True)
-
-    return converted_output_file.name
+        while True:
+            data = await process.stdout.read(PIPE_READ_SIZE)
+            if not data:
+                break
+            yield data
+        await feeder  # 合成出错时在这里抛出
+        stderr = await stderr_reader
+        if await process.wait() != 0:
+            raise RuntimeError(f"FFmpeg音频转换出错: {stderr.decode('utf-8', errors='replace').strip()}")
+    finally:
+        if process.returncode is None:  # 客户端断开或出错：结束子进程
+            try:
+                process.kill()
+            except ProcessLookupError:
+                pass
+            await process.wait()
+        for task in (feeder, stderr_reader):
+            if not task.done():
+                task.cancel()
+
+async def stream_speech(text, voice, response_format, speed=1.0) -> AsyncIterator[bytes]:
+    """流式生成TTS音频：mp3直接转发edge-tts数据块，其它格式经FFmpeg管道转换"""
+    source = stream_edge_audio(text, voice, speed)
+    if response_format != "mp3" and not is_ffmpeg_installed():
+        print("FFmpeg不可用，返回原始mp3数据。")
+        response_format = "mp3"
+    if response_format == "mp3":
+        async for data in source:
+            yield data
+        return
+    async for data in _transcode(source, response_format):
+        yield data
+
+async def synthesize_speech(text, voice, response_format, speed=1.0) -> bytes:
+    """生成完整音频数据（内存中拼接，不落临时文件）"""
+    return b"".join([data async for data in stream_speech(text, voice, response_format, speed)])
+
+async def _save_speech(text, voice, response_format, speed):
+    audio = await synthesize_speech(text, voice, response_format, speed)
+    suffix = response_format if response_format == "mp3" or is_ffmpeg_installed() else "mp3"
+    with tempfile.NamedTemporaryFile(delete=False, suffix=f".{suffix}") as output_file:
+        output_file.write(audio)
+    return output_file.name
 
 def generate_speech(text, voice, response_format, speed=1.0):
-    return asyncio.run(_generate_audio(text, voice, response_format, speed))
+    """同步接口：生成音频并返回临时文件路径（供线程池中的同步调用方使用，不能在事件循环内调用）"""
+    return asyncio.run(_save_speech(text, voice, response_format, speed))
 
 def get_models():
     return [
@@ -101,18 +146,21 @@ def get_models():
         {"id": "tts-1-hd", "name": "Text-to-speech v1 HD"}
     ]
 
-def _get_voices(language=None):
-    # 列出所有语音，可按语言过滤
-    all_voices = asyncio.run(edge_tts.list_voices())
+async def list_voices(language=None):
+    """列出所有语音，可按语言过滤；edge-tts语音列表需要联网获取，按VOICES_CACHE_TTL缓存"""
+    global _voices_cache, _voices_cached_at
+    if _voices_cache is None or time.monotonic() - _voices_cached_at > VOICES_CACHE_TTL:
+        _voices_cache = await edge_tts.list_voices()
+        _voices_cached_at = time.monotonic()
     language = language or DEFAULT_LANGUAGE
-    filtered_voices = [
+    return [
         {"name": v['ShortName'], "gender": v['Gender'], "language": v['Locale']}
-        for v in all_voices if language == 'all' or language is None or v['Locale'] == language
+        for v in _voices_cache if language == 'all' or v['Locale'] == language
     ]
-    return filtered_voices
 
 def get_voices(language=None):
-    return asyncio.run(_get_voices(language))
+    """同步接口，不能在事件循环内调用"""
+    return asyncio.run(list_voices(language))
 
 def speed_to_rate(speed: float) -> str:
     """
@@ -2,8 +2,7 @@ import sys
 import os
 sys.path.append(os.path.dirname(os.path.dirname(__file__)))  # 加入项目根目录到模块查找路径
 # utils.py
-from flask import request, jsonify
-from functools import wraps
+from fastapi import HTTPException, Request
 from config import config  # 使用统一配置系统
 
 API_KEY = config.tts.api_key
@@ -14,19 +13,16 @@ def getenv_bool(key: str, default: bool = False) -> bool:
     value = os.getenv(key, str(default)).lower()
     return value in ('true', '1', 'yes', 'on')
 
-def require_api_key(f):
-    @wraps(f)
-    def decorated_function(*args, **kwargs):
-        if not REQUIRE_API_KEY:
-            return f(*args, **kwargs)
-        auth_header = request.headers.get('Authorization')
-        if not auth_header or not auth_header.startswith('Bearer '):
-            return jsonify({"error": "Missing or invalid API key"}), 401
-        token = auth_header.split('Bearer ')[1]
-        if token != API_KEY:
-            return jsonify({"error": "Invalid API key"}), 401
-        return f(*args, **kwargs)
-    return decorated_function
+async def require_api_key(request: Request):
+    """FastAPI依赖：校验Bearer API密钥"""
+    if not REQUIRE_API_KEY:
+        return
+    auth_header = request.headers.get('Authorization')
+    if not auth_header or not auth_header.startswith('Bearer '):
+        raise HTTPException(status_code=401, detail="Missing or invalid API key")
+    token = auth_header.split('Bearer ')[1]
+    if token != API_KEY:
+        raise HTTPException(status_code=401, detail="Invalid API key")
 
 # Mapping of audio format to MIME type
 AUDIO_FORMAT_MIME_TYPES = {